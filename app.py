@@ -4,17 +4,34 @@ Chạy: python app.py
 Truy cập: http://localhost:5000
 """
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response
 import pandas as pd
 import numpy as np
 import yfinance as yf
 import os
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import threading
 import time
+import heapq
+import queue
+import hashlib
+import struct
 import schedule
-from pattern_recognition import PatternRecognition, load_data as load_pattern_data
+from pattern_recognition import analyze_patterns, scan_patterns
+from similarity_search import find_similar
+import pattern_stats
+import volume_profile
+import data_store
+from data_store import load_data
+import quote_service
+import live_feed
+import jobs
+import download_all_vn
+from scoring import calculate_indicators, ai_analyze
+import screener_snapshot
+import screener_query
+import relative_strength
 
 app = Flask(__name__)
 
@@ -22,6 +39,7 @@ app = Flask(__name__)
 AUTO_UPDATE_ENABLED = True
 UPDATE_INTERVAL_MINUTES = 15  # Cập nhật mỗi 15 phút trong giờ giao dịch
 last_auto_update = None
+quote_service.QUOTE_TTL = UPDATE_INTERVAL_MINUTES * 60
 
 # Cache để lưu dữ liệu
 data_cache = {}
@@ -30,43 +48,8 @@ last_update = {}
 # ============ DATA FUNCTIONS ============
 
 def get_realtime_price(symbol: str) -> dict:
-    """Lấy giá realtime từ Yahoo Finance"""
-    try:
-        yf_symbol = symbol + ".VN"
-        ticker = yf.Ticker(yf_symbol)
-        
-        # Lấy thông tin realtime
-        info = ticker.info
-        
-        # Lấy giá từ history nếu info không có
-        hist = ticker.history(period="5d")
-        
-        if hist.empty:
-            return None
-        
-        latest = hist.iloc[-1]
-        prev = hist.iloc[-2] if len(hist) > 1 else hist.iloc[-1]
-        
-        current_price = float(latest["Close"])
-        prev_close = float(prev["Close"])
-        change = current_price - prev_close
-        change_pct = (change / prev_close) * 100
-        
-        return {
-            "symbol": symbol,
-            "price": current_price,
-            "change": change,
-            "change_pct": change_pct,
-            "open": float(latest["Open"]),
-            "high": float(latest["High"]),
-            "low": float(latest["Low"]),
-            "volume": int(latest["Volume"]),
-            "prev_close": prev_close,
-            "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-    except Exception as e:
-        print(f"Lỗi lấy giá {symbol}: {e}")
-        return None
+    """Lấy giá realtime (qua cache giá của quote_service, hết hạn sau mỗi chu kỳ cập nhật)"""
+    return quote_service.get_quote(symbol)
 
 def update_stock_data(symbol: str) -> bool:
     """Cập nhật dữ liệu cổ phiếu mới nhất"""
@@ -95,235 +78,93 @@ def update_stock_data(symbol: str) -> bool:
         print(f"Lỗi cập nhật {symbol}: {e}")
         return False
 
-def load_data(csv_path: str) -> pd.DataFrame:
-    """Đọc CSV từ yfinance"""
-    try:
-        df = pd.read_csv(csv_path, header=[0, 1], index_col=0)
-        df.columns = [col[0] for col in df.columns]
-    except:
-        df = pd.read_csv(csv_path, index_col=0)
-    
-    df = df.reset_index()
-    df.columns.values[0] = "Date"
-    
-    if df["Date"].dtype == object:
-        df = df[df["Date"].str.match(r"^\d{4}-\d{2}-\d{2}", na=False)].copy()
-    
-    df["Date"] = pd.to_datetime(df["Date"])
-    for col in ["Open", "High", "Low", "Close", "Volume"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    
-    df = df.set_index("Date").dropna()
-    return df
-
-def calculate_indicators(df: pd.DataFrame) -> pd.DataFrame:
-    """Tính các chỉ báo kỹ thuật"""
-    df = df.copy()
-    
-    # MA
-    df["MA20"] = df["Close"].rolling(20).mean()
-    df["MA50"] = df["Close"].rolling(50).mean()
-    
-    # RSI
-    delta = df["Close"].diff()
-    gain = delta.where(delta > 0, 0).rolling(14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-    rs = gain / loss
-    df["RSI"] = 100 - (100 / (1 + rs))
-    
-    # MACD
-    ema12 = df["Close"].ewm(span=12).mean()
-    ema26 = df["Close"].ewm(span=26).mean()
-    df["MACD"] = ema12 - ema26
-    df["MACD_Signal"] = df["MACD"].ewm(span=9).mean()
-    
-    # Bollinger Bands
-    df["BB_Mid"] = df["Close"].rolling(20).mean()
-    bb_std = df["Close"].rolling(20).std()
-    df["BB_Upper"] = df["BB_Mid"] + 2 * bb_std
-    df["BB_Lower"] = df["BB_Mid"] - 2 * bb_std
-    
-    # Volume MA
-    df["Vol_MA20"] = df["Volume"].rolling(20).mean()
-    
-    return df
-
-def ai_analyze(df: pd.DataFrame, symbol: str, realtime_price: dict = None) -> dict:
-    """AI phân tích và đánh giá cổ phiếu"""
-    if len(df) < 50:
-        return {"error": "Không đủ dữ liệu"}
-    
-    df = calculate_indicators(df)
-    latest = df.iloc[-1]
-    prev = df.iloc[-2]
-    
-    # Sử dụng giá realtime nếu có
-    if realtime_price:
-        current_price = realtime_price["price"]
-        price_change = realtime_price["change_pct"]
-        updated_time = realtime_price["updated"]
-    else:
-        current_price = float(latest["Close"])
-        price_change = float((latest["Close"] - prev["Close"]) / prev["Close"] * 100)
-        updated_time = df.index[-1].strftime("%Y-%m-%d")
-    
-    score = 0
-    max_score = 100
-    signals = []
-    
-    # 1. Xu hướng MA (25 điểm)
-    ma20 = float(latest["MA20"])
-    ma50 = float(latest["MA50"])
-    
-    if current_price > ma20 > ma50:
-        score += 25
-        signals.append({"type": "bullish", "text": "Giá trên MA20 và MA50 - Xu hướng tăng mạnh"})
-    elif current_price > ma20:
-        score += 15
-        signals.append({"type": "bullish", "text": "Giá trên MA20 - Xu hướng tăng"})
-    elif current_price < ma20 < ma50:
-        score += 0
-        signals.append({"type": "bearish", "text": "Giá dưới MA20 và MA50 - Xu hướng giảm"})
-    else:
-        score += 10
-        signals.append({"type": "neutral", "text": "Xu hướng chưa rõ ràng"})
-    
-    # Golden/Death Cross
-    prev_ma20 = float(prev["MA20"])
-    prev_ma50 = float(prev["MA50"])
-    
-    if prev_ma20 <= prev_ma50 and ma20 > ma50:
-        score += 10
-        signals.append({"type": "bullish", "text": "🔥 GOLDEN CROSS - Tín hiệu mua mạnh!"})
-    elif prev_ma20 >= prev_ma50 and ma20 < ma50:
-        score -= 10
-        signals.append({"type": "bearish", "text": "⚠️ DEATH CROSS - Tín hiệu bán!"})
-    
-    # 2. RSI (20 điểm)
-    rsi = float(latest["RSI"])
-    if 30 <= rsi <= 40:
-        score += 20
-        signals.append({"type": "bullish", "text": f"RSI {rsi:.0f} - Gần vùng quá bán, cơ hội mua"})
-    elif rsi < 30:
-        score += 15
-        signals.append({"type": "bullish", "text": f"RSI {rsi:.0f} - Quá bán, có thể hồi phục"})
-    elif 40 <= rsi <= 60:
-        score += 15
-        signals.append({"type": "neutral", "text": f"RSI {rsi:.0f} - Vùng trung tính"})
-    elif 60 < rsi <= 70:
-        score += 10
-        signals.append({"type": "neutral", "text": f"RSI {rsi:.0f} - Đang mạnh"})
-    else:
-        score += 5
-        signals.append({"type": "bearish", "text": f"RSI {rsi:.0f} - Quá mua, cẩn thận"})
-    
-    # 3. MACD (20 điểm)
-    macd = float(latest["MACD"])
-    macd_signal = float(latest["MACD_Signal"])
-    prev_macd = float(prev["MACD"])
-    prev_signal = float(prev["MACD_Signal"])
-    
-    if macd > macd_signal:
-        score += 15
-        signals.append({"type": "bullish", "text": "MACD trên Signal - Động lượng tăng"})
-    else:
-        score += 5
-        signals.append({"type": "bearish", "text": "MACD dưới Signal - Động lượng giảm"})
-    
-    if prev_macd <= prev_signal and macd > macd_signal:
-        score += 5
-        signals.append({"type": "bullish", "text": "MACD vừa cắt lên Signal!"})
-    
-    # 4. Volume (15 điểm)
-    vol_ma20 = float(latest["Vol_MA20"])
-    vol_ratio = float(latest["Volume"]) / vol_ma20 if vol_ma20 > 0 else 1
-    
-    if vol_ratio > 1.5:
-        score += 15
-        signals.append({"type": "bullish", "text": f"Volume cao gấp {vol_ratio:.1f}x - Có sự quan tâm"})
-    elif vol_ratio > 1:
-        score += 10
-        signals.append({"type": "neutral", "text": f"Volume bình thường ({vol_ratio:.1f}x)"})
-    else:
-        score += 5
-        signals.append({"type": "bearish", "text": f"Volume thấp ({vol_ratio:.1f}x)"})
-    
-    # 5. Bollinger Bands (10 điểm)
-    bb_upper = float(latest["BB_Upper"])
-    bb_lower = float(latest["BB_Lower"])
-    bb_pos = (current_price - bb_lower) / (bb_upper - bb_lower) if bb_upper != bb_lower else 0.5
-    
-    if bb_pos < 0.2:
-        score += 10
-        signals.append({"type": "bullish", "text": "Giá gần đáy Bollinger - Cơ hội mua"})
-    elif bb_pos > 0.8:
-        score += 3
-        signals.append({"type": "bearish", "text": "Giá gần đỉnh Bollinger - Cẩn thận"})
-    else:
-        score += 7
-        signals.append({"type": "neutral", "text": "Giá trong vùng Bollinger an toàn"})
-    
-    # 6. Xu hướng ngắn hạn (10 điểm)
-    price_5d_ago = float(df["Close"].iloc[-5])
-    ret_5d = (current_price - price_5d_ago) / price_5d_ago * 100
-    
-    if ret_5d > 3:
-        score += 10
-        signals.append({"type": "bullish", "text": f"Tăng {ret_5d:.1f}% trong 5 ngày"})
-    elif ret_5d > 0:
-        score += 7
-        signals.append({"type": "neutral", "text": f"Tăng nhẹ {ret_5d:.1f}% trong 5 ngày"})
-    else:
-        score += 3
-        signals.append({"type": "bearish", "text": f"Giảm {abs(ret_5d):.1f}% trong 5 ngày"})
-    
-    # Xếp hạng
-    if score >= 80:
-        rating = "A+"
-        recommendation = "MUA MẠNH"
-        rec_class = "buy-strong"
-    elif score >= 70:
-        rating = "A"
-        recommendation = "NÊN MUA"
-        rec_class = "buy"
-    elif score >= 60:
-        rating = "B+"
-        recommendation = "THEO DÕI ĐỂ MUA"
-        rec_class = "watch"
-    elif score >= 50:
-        rating = "B"
-        recommendation = "TRUNG LẬP"
-        rec_class = "neutral"
-    elif score >= 40:
-        rating = "C"
-        recommendation = "CẨN THẬN"
-        rec_class = "caution"
+# ============ CONDITIONAL GET (ETAG / LAST-MODIFIED) ============
+
+def make_etag(*parts) -> str:
+    """ETag mạnh từ phiên bản dữ liệu và tham số của request"""
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:24]
+
+def not_modified(etag: str, last_modified: datetime = None):
+    """Response 304 nếu client đã có đúng bản này, None nếu phải tính
+    If-None-Match được ưu tiên; chỉ xét If-Modified-Since khi client không gửi ETag"""
+    if request.if_none_match:
+        hit = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified:
+        hit = last_modified.replace(microsecond=0) <= request.if_modified_since
     else:
-        rating = "D"
-        recommendation = "TRÁNH"
-        rec_class = "avoid"
-    
-    return {
-        "symbol": symbol,
-        "price": current_price,
-        "change": price_change,
-        "score": score,
-        "max_score": max_score,
-        "rating": rating,
-        "recommendation": recommendation,
-        "rec_class": rec_class,
-        "signals": signals,
-        "indicators": {
-            "rsi": rsi,
-            "macd": macd,
-            "macd_signal": macd_signal,
-            "ma20": ma20,
-            "ma50": ma50,
-            "vol_ratio": vol_ratio
-        },
-        "updated": updated_time
-    }
+        hit = False
+    return with_validators(Response(status=304), etag, last_modified) if hit else None
+
+def with_validators(response, etag: str, last_modified: datetime = None):
+    """Gắn ETag / Last-Modified; no-cache để trình duyệt luôn hỏi lại server (trả 304 nếu chưa đổi)"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+# ============ CHART PAYLOAD (JSON / BINARY) ============
+
+# Chuỗi số của biểu đồ: (khóa trong payload, cột của calculate_indicators, số chữ số thập phân khi trả JSON)
+CHART_SERIES = [
+    ("open", "Open", 2), ("high", "High", 2), ("low", "Low", 2), ("close", "Close", 2),
+    ("volume", "Volume", 0), ("ma20", "MA20", 2), ("ma50", "MA50", 2), ("rsi", "RSI", 2),
+    ("macd", "MACD", 4), ("macd_signal", "MACD_Signal", 4),
+    ("bb_upper", "BB_Upper", 2), ("bb_lower", "BB_Lower", 2), ("rs_rank", None, 0),
+]
+CHART_BARS = 200
+CHART_MAGIC = b"TCB1"
+
+def chart_series(symbol: str, df: pd.DataFrame):
+    """Ngày và các chuỗi float64 (khóa theo CHART_SERIES) của CHART_BARS nến gần nhất"""
+    df = calculate_indicators(df).tail(CHART_BARS)
+    
+    # Xếp hạng sức mạnh tương đối (1-99) so với toàn bộ mã theo từng ngày
+    rs = relative_strength.rs_history(symbol)
+    rs_rank = rs["rs_rank"].reindex(df.index) if rs is not None else pd.Series(np.nan, index=df.index)
+    
+    series = {}
+    for key, column, _ in CHART_SERIES:
+        values = rs_rank if column is None else df[column]
+        series[key] = values.to_numpy(dtype=np.float64)
+    return df.index, series
+
+def chart_json(dates: pd.DatetimeIndex, series: dict) -> dict:
+    """Payload JSON: làm tròn theo CHART_SERIES, NaN (nến chưa đủ chu kỳ chỉ báo) thành null"""
+    data = {"dates": dates.strftime("%Y-%m-%d").tolist()}
+    for key, _, decimals in CHART_SERIES:
+        values = series[key]
+        missing = np.isnan(values)
+        rounded = np.round(values, decimals)
+        if decimals == 0 and not missing.any():
+            data[key] = rounded.astype(np.int64).tolist()
+        elif missing.any():
+            data[key] = np.where(missing, None, rounded).tolist()
+        else:
+            data[key] = rounded.tolist()
+    data["last_date"] = dates[-1].strftime("%Y-%m-%d")
+    return data
+
+def chart_binary(symbol: str, dates: pd.DatetimeIndex, series: dict) -> bytes:
+    """Payload nhị phân little-endian (?format=bin):
+    magic "TCB1" | uint32 độ dài header | header JSON (đệm khoảng trắng cho chia hết 4 byte)
+    | int32[n] số ngày kể từ base_date | float32[n] từng chuỗi theo thứ tự header["series"]
+    | mặt nạ NaN: mỗi chuỗi ceil(n/8) byte, bit i (thứ tự little) = 1 nếu nến i không có giá trị"""
+    n = len(dates)
+    base = dates[0].normalize()
+    header = json.dumps({
+        "symbol": symbol, "rows": n, "series": [key for key, _, _ in CHART_SERIES],
+        "base_date": base.strftime("%Y-%m-%d"), "last_date": dates[-1].strftime("%Y-%m-%d"),
+    }).encode()
+    header += b" " * (-(len(CHART_MAGIC) + 4 + len(header)) % 4)
+    
+    days = ((dates.normalize() - base) // pd.Timedelta(days=1)).to_numpy(dtype="<i4")
+    values = np.stack([series[key] for key, _, _ in CHART_SERIES]) if n else np.empty((0, 0))
+    mask = np.packbits(np.isnan(values), axis=1, bitorder="little") if n else b""
+    return b"".join([
+        CHART_MAGIC, struct.pack("<I", len(header)), header,
+        days.tobytes(), values.astype("<f4").tobytes(), bytes(mask),
+    ])
 
 # ============ ROUTES ============
 
@@ -333,45 +174,49 @@ def index():
 
 @app.route("/api/stocks")
 def get_stocks():
-    """Lấy danh sách cổ phiếu"""
+    """Lấy danh sách cổ phiếu (304 nếu danh sách chưa đổi)"""
     data_dir = "data"
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
-    stocks = [f.replace(".csv", "") for f in os.listdir(data_dir) if f.endswith(".csv")]
-    return jsonify(sorted(stocks))
+    stocks = sorted(f.replace(".csv", "") for f in os.listdir(data_dir) if f.endswith(".csv"))
+    
+    etag = make_etag("stocks", stocks)
+    last_modified = datetime.fromtimestamp(os.stat(data_dir).st_mtime, timezone.utc)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    return with_validators(jsonify(stocks), etag, last_modified)
 
 @app.route("/api/stock/<symbol>")
 def get_stock_data(symbol):
-    """Lấy dữ liệu 1 cổ phiếu"""
+    """Lấy dữ liệu biểu đồ 1 cổ phiếu (304 nếu dữ liệu chưa đổi)
+    Tham số: format (json mặc định | bin - mảng float32 nhị phân, xem chart_binary)
+    Xếp hạng RS so với mọi mã nên phiên bản tính trên toàn bộ dữ liệu"""
     csv_path = f"data/{symbol}.csv"
     
     if not os.path.exists(csv_path):
         return jsonify({"error": "Không tìm thấy dữ liệu"}), 404
     
+    fmt = request.args.get("format", "json").lower()
+    if fmt not in ("json", "bin"):
+        return jsonify({"error": "format phải là json hoặc bin"}), 400
+    
+    version, last_modified = data_store.version_stamp()
+    etag = make_etag("stock", symbol, fmt, version)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    
     df = load_data(csv_path)
-    df = calculate_indicators(df)
-    
-    # Lấy 200 ngày gần nhất
-    df = df.tail(200)
-    
-    data = {
-        "dates": df.index.strftime("%Y-%m-%d").tolist(),
-        "open": df["Open"].tolist(),
-        "high": df["High"].tolist(),
-        "low": df["Low"].tolist(),
-        "close": df["Close"].tolist(),
-        "volume": df["Volume"].tolist(),
-        "ma20": df["MA20"].tolist(),
-        "ma50": df["MA50"].tolist(),
-        "rsi": df["RSI"].tolist(),
-        "macd": df["MACD"].tolist(),
-        "macd_signal": df["MACD_Signal"].tolist(),
-        "bb_upper": df["BB_Upper"].tolist(),
-        "bb_lower": df["BB_Lower"].tolist(),
-        "last_date": df.index[-1].strftime("%Y-%m-%d")
-    }
-    
-    return jsonify(data)
+    if df.empty:
+        return jsonify({"error": "Không có dữ liệu"}), 404
+    dates, series = chart_series(symbol, df)
+    
+    if fmt == "bin":
+        response = Response(chart_binary(symbol, dates, series), mimetype="application/octet-stream")
+    else:
+        response = jsonify(chart_json(dates, series))
+    return with_validators(response, etag, last_modified)
 
 @app.route("/api/realtime/<symbol>")
 def get_realtime(symbol):
@@ -391,64 +236,316 @@ def update_stock(symbol):
 
 @app.route("/api/update-all")
 def update_all_stocks():
-    """Cập nhật tất cả cổ phiếu"""
-    data_dir = "data"
-    stocks = [f.replace(".csv", "") for f in os.listdir(data_dir) if f.endswith(".csv")]
-    
-    updated = 0
-    failed = 0
-    
-    for symbol in stocks:
-        if update_stock_data(symbol):
-            updated += 1
-        else:
-            failed += 1
-        time.sleep(0.5)  # Delay để tránh bị block
-    
-    return jsonify({
-        "success": True,
-        "updated": updated,
-        "failed": failed,
-        "total": len(stocks)
-    })
+    """Cập nhật tất cả cổ phiếu - tạo job nền (giống POST /api/jobs/update-all), không chờ xong"""
+    return start_job("update-all")
+
+def analyze_validators(symbol: str, version: str, last_modified: datetime, realtime: dict):
+    """ETag / Last-Modified của /api/analyze: phiên bản dữ liệu của mã và giá realtime dùng để chấm"""
+    if realtime:
+        quoted = datetime.strptime(realtime["updated"], "%Y-%m-%d %H:%M:%S").astimezone(timezone.utc)
+        last_modified = max(last_modified, quoted) if last_modified else quoted
+    return make_etag("analyze", symbol, version, realtime), last_modified
 
 @app.route("/api/analyze/<symbol>")
 def analyze_stock(symbol):
-    """AI phân tích cổ phiếu"""
+    """AI phân tích cổ phiếu (304 nếu dữ liệu và giá realtime chưa đổi)"""
     csv_path = f"data/{symbol}.csv"
     
     if not os.path.exists(csv_path):
         return jsonify({"error": "Không tìm thấy dữ liệu"}), 404
     
-    df = load_data(csv_path)
-    
-    # Lấy giá realtime
+    # Kiểm tra 304 trước khi lấy giá: phiên bản dữ liệu + giá đang có trong cache (không gọi mạng)
+    version, data_modified = data_store.version_stamp([symbol])
+    known, quote = quote_service.peek_quote(symbol)
+    if known:
+        etag, last_modified = analyze_validators(symbol, version, data_modified, quote)
+        cached = not_modified(etag, last_modified)
+        if cached:
+            # Giá quá hạn được lấy lại trong nền cho lần hỏi sau
+            quote_service.refresh_async([symbol])
+            return cached
+    
+    # Lấy giá realtime (từ cache giá) - kết quả phụ thuộc giá này
     realtime = get_realtime_price(symbol)
+    etag, last_modified = analyze_validators(symbol, version, data_modified, realtime)
     
+    df = load_data(csv_path)
     result = ai_analyze(df, symbol, realtime)
     
-    return jsonify(result)
+    return with_validators(jsonify(result), etag, last_modified)
 
 @app.route("/api/screener")
 def stock_screener():
-    """Sàng lọc tất cả cổ phiếu"""
-    data_dir = "data"
-    stocks = [f.replace(".csv", "") for f in os.listdir(data_dir) if f.endswith(".csv")]
+    """Sàng lọc tất cả cổ phiếu (đọc bảng snapshot, chỉ chấm lại mã có dữ liệu mới)
+    Tham số: where (vd "rsi<35 and vol_ratio>1.5 and close>ma50"), sort (vd "-ret_20d,symbol",
+    mặc định -score), limit, offset, asof (YYYY-MM-DD: kết quả screener tại cuối ngày đó).
+    Tổng số mã thỏa điều kiện trả về ở header X-Total-Count"""
+    asof = request.args.get("asof")
+    if asof:
+        try:
+            table = screener_snapshot.snapshot_asof(datetime.strptime(asof, "%Y-%m-%d"))
+        except ValueError:
+            return jsonify({"error": "asof phải có dạng YYYY-MM-DD"}), 400
+    else:
+        table = screener_snapshot.get_snapshot()
     
-    results = []
-    for symbol in stocks:
+    try:
+        page, total = screener_query.run_query(
+            table,
+            where=request.args.get("where"),
+            sort=request.args.get("sort", "-score"),
+            limit=request.args.get("limit", type=int),
+            offset=request.args.get("offset", 0, type=int)
+        )
+    except screener_query.QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if asof:
+        # Giá tại ngày asof, không đè giá realtime
+        page = screener_snapshot.fill_signals(page)
+        quotes = {}
+    else:
+        # Bảng lớn chấm theo lô không tính sẵn volume profile: chỉ tính cho các dòng trả về
+        page = screener_snapshot.fill_volume_profile(page)
+        # Giá realtime từ cache, mã quá hạn được lấy lại (1 lần gọi cho cả danh sách) trong nền
+        quotes = quote_service.get_quotes(list(table.index), wait=False)
+    
+    results = [screener_snapshot.to_result(symbol, row, quotes.get(symbol))
+               for symbol, row in zip(page.index, page.to_dict("records"))]
+    
+    response = jsonify(results)
+    response.headers["X-Total-Count"] = str(total)
+    return response
+
+@app.route("/api/screener/changes")
+def stock_screener_changes():
+    """Thay đổi so với lần chấm trước của từng mã: mới vào A/A+, tăng/giảm hạng, Golden/Death Cross,
+    RSI cắt 30/70. Chỉ chấm lại mã có dữ liệu mới. Tham số: since (YYYY-MM-DD, lọc theo ngày nến hiện tại)"""
+    since = request.args.get("since")
+    if since:
         try:
-            df = load_data(f"data/{symbol}.csv")
-            realtime = get_realtime_price(symbol)
-            result = ai_analyze(df, symbol, realtime)
-            if "error" not in result:
-                results.append(result)
-        except Exception as e:
-            pass
+            since = datetime.strptime(since, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            return jsonify({"error": "since phải có dạng YYYY-MM-DD"}), 400
+    
+    out = screener_snapshot.get_changes(since)
+    out["counts"] = {kind: len(items) for kind, items in out["changes"].items()}
+    out["labels"] = screener_snapshot.CHANGE_KINDS
+    return jsonify(out)
+
+@app.route("/api/screener/stream")
+def stock_screener_stream():
+    """Sàng lọc dạng server-sent events: đẩy kết quả từng mã ngay khi có điểm
+    Mã đã có trong snapshot được gửi ngay, mã có dữ liệu mới được chấm lần lượt rồi gửi tiếp
+    Sự kiện: result (1 mã), top (k mã dẫn đầu hiện tại), done (xếp hạng cuối cùng)
+    Tham số: k (số mã dẫn đầu, mặc định 20)"""
+    k = max(1, min(request.args.get("k", 20, type=int), 200))
+    
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    
+    def generate():
+        start = time.time()
+        # Heap k phần tử nhỏ nhất ở đỉnh: (điểm, thứ tự, kết quả)
+        leaders = []
+        sent = set()
+        counter = [0, 0]  # [tổng số mã, số mã tiềm năng (A, A+)]
+        
+        def push(symbol, row, quote):
+            result = screener_snapshot.to_result(symbol, row, quote)
+            if symbol not in sent:
+                sent.add(symbol)
+                counter[0] += 1
+                counter[1] += result["score"] >= 70
+            item = (result["score"], -len(sent), result)
+            if len(leaders) < k:
+                heapq.heappush(leaders, item)
+            elif item > leaders[0]:
+                heapq.heapreplace(leaders, item)
+            return sse("result", result)
+        
+        def top(done):
+            ranked = [item[2] for item in sorted(leaders, reverse=True)]
+            return sse("top", {"done": done, "total": counter[0], "strong": counter[1], "top": ranked})
+        
+        table, stale, removed = screener_snapshot.pending_changes()
+        symbols = list(table.index.union(stale))
+        quote_service.refresh_async(symbols)
+        quotes = quote_service.peek_quotes(symbols)
+        
+        # 1. Mã đã có điểm trong snapshot: gửi ngay
+        skip = set(stale) | set(removed)
+        for symbol, row in zip(table.index, table.to_dict("records")):
+            if symbol not in skip:
+                yield push(symbol, row, quotes.get(symbol))
+        yield top(not stale)
+        
+        # 2. Mã có dữ liệu mới: chấm lần lượt, gửi ngay khi có điểm
+        last_top = time.time()
+        for symbol, row in screener_snapshot.iter_refresh():
+            yield push(symbol, row, quotes.get(symbol))
+            if time.time() - last_top >= 0.5:
+                last_top = time.time()
+                yield top(False)
+        
+        # Mã do lượt làm mới khác (auto update) chấm xong trong lúc chờ
+        table = screener_snapshot.get_snapshot()
+        for symbol, row in zip(table.index, table.to_dict("records")):
+            if symbol not in sent:
+                yield push(symbol, row, quotes.get(symbol))
+        
+        page, total = screener_query.run_query(table, sort="-score", limit=k)
+        ranked = [screener_snapshot.to_result(symbol, row, quotes.get(symbol))
+                  for symbol, row in zip(page.index, page.to_dict("records"))]
+        yield top(True)
+        yield sse("done", {"total": total, "top": ranked, "elapsed": round(time.time() - start, 3)})
+    
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/stream")
+def stream():
+    """Kênh đẩy realtime (server-sent events) cho các mã, thay cho việc hỏi lại /api/realtime
+    Sự kiện: quote (giá mới), analysis (kết quả /api/analyze khi dữ liệu hoặc điểm đổi); comment ping mỗi 15s
+    Tham số: symbols (cách nhau dấu phẩy, tối đa 50 mã)"""
+    symbols = sorted({s.strip().upper() for s in request.args.get("symbols", "").split(",") if s.strip()})
+    if not symbols:
+        return jsonify({"error": "Thiếu tham số symbols"}), 400
+    if len(symbols) > 50:
+        return jsonify({"error": "Tối đa 50 mã"}), 400
+    unknown = [s for s in symbols if data_store.data_version(s) is None]
+    if unknown:
+        return jsonify({"error": f"Không tìm thấy dữ liệu: {', '.join(unknown)}"}), 404
+    
+    def generate():
+        sub_id, events = live_feed.subscribe(symbols)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event, data = events.get(timeout=15)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        finally:
+            live_feed.unsubscribe(sub_id)
+    
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ============ BACKGROUND JOBS ============
+
+def job_update_all(job_id: str, params: dict) -> dict:
+    """Cập nhật lại dữ liệu mọi mã đang có (nghỉ 0.5s giữa các mã để tránh bị block)
+    Xong thì làm mới giá realtime và chấm lại snapshot screener cho mã có dữ liệu mới (như auto_update_job)"""
+    symbols = data_store.list_symbols()
+    result = jobs.run_each(job_id, symbols, update_stock_data, delay=0.5)
+    quote_service.refresh(symbols)
+    refreshed = screener_snapshot.refresh_snapshot()
+    return {**result, "screener_changed": len(refreshed["changed"]), "screener_removed": len(refreshed["removed"])}
+
+def job_download(job_id: str, params: dict) -> dict:
+    """Tải dữ liệu các mã trong params["symbols"] (mặc định toàn bộ mã trong danh sách mã)"""
+    master = download_all_vn.load_symbol_master() or download_all_vn.VN_STOCKS
+    symbols = params.get("symbols") or list(master)
     
-    results.sort(key=lambda x: x["score"], reverse=True)
+    def download(symbol):
+        info = master.get(symbol)
+        ok, rows = download_all_vn.download_stock(symbol, info["name"] if isinstance(info, dict) else info or symbol)
+        return {"ok": ok, "rows": rows}
     
-    return jsonify(results)
+    return jobs.run_each(job_id, symbols, download, delay=0.5)
+
+def job_screener(job_id: str, params: dict) -> dict:
+    """Chấm lại snapshot screener cho các mã có dữ liệu mới, ghi điểm (hoặc lỗi) từng mã và thời gian từng lô"""
+    _, stale, removed = screener_snapshot.pending_changes()
+    jobs.set_total(job_id, len(stale))
+    batches = []
+    handled = set()
+    start = time.time()
+    for todo, rows in screener_snapshot.iter_refresh_batches():
+        elapsed = time.time() - start
+        batches.append({"size": len(todo), "elapsed": round(elapsed, 3)})
+        scores = {row["symbol"]: int(row["score"]) for row in rows}
+        for symbol in todo:
+            # Thời gian của lô chia đều cho các mã trong lô
+            if symbol in scores:
+                jobs.record(job_id, symbol, True, elapsed / len(todo), score=scores[symbol])
+            else:
+                jobs.record(job_id, symbol, False, elapsed / len(todo), message="Không chấm được (thiếu dữ liệu hoặc lỗi)")
+        handled.update(todo)
+        start = time.time()
+    
+    # Mã đã được lượt làm mới khác chấm trong lúc job chạy
+    for symbol in stale:
+        if symbol not in handled:
+            jobs.record(job_id, symbol, True, message="Đã được chấm bởi lượt khác")
+    return {"rescored": len(handled), "removed": len(removed), "batches": batches}
+
+def job_train(job_id: str, params: dict) -> dict:
+    """Train model dự đoán giá cho các mã trong params["symbols"]"""
+    import lstm_prediction  # scikit-learn / matplotlib chỉ cần khi train
+    
+    def train(symbol):
+        result = lstm_prediction.predict(symbol)
+        if "error" in result:
+            return {"ok": False, "message": result["error"]}
+        return {"ok": True, **{k: v for k, v in result.items() if k not in ("y_test", "y_pred", "features")}}
+    
+    return jobs.run_each(job_id, params["symbols"], train)
+
+# Loại job -> (hàm chạy, có cần danh sách mã không)
+JOB_TASKS = {
+    "update-all": (job_update_all, False),
+    "download": (job_download, False),
+    "screener": (job_screener, False),
+    "train": (job_train, True),
+}
+
+def start_job(kind: str):
+    """Tạo job và trả 202 kèm trạng thái ban đầu (Location trỏ tới /api/jobs/<id>)"""
+    task, needs_symbols = JOB_TASKS[kind]
+    body = request.get_json(silent=True)
+    if body is not None and not isinstance(body, dict):
+        return jsonify({"error": "Body JSON phải là object, VD: {\"symbols\": [\"FPT\"]}"}), 400
+    symbols = (body or {}).get("symbols") or request.args.get("symbols", "")
+    if isinstance(symbols, str):
+        symbols = [s for s in symbols.split(",")]
+    elif not isinstance(symbols, list):
+        return jsonify({"error": "symbols phải là danh sách mã hoặc chuỗi cách nhau dấu phẩy"}), 400
+    symbols = sorted({str(s).strip().upper() for s in symbols if str(s).strip()})
+    if needs_symbols and not symbols:
+        return jsonify({"error": "Thiếu tham số symbols"}), 400
+    
+    job = jobs.submit(kind, task, {"symbols": symbols} if symbols else {})
+    if "id" not in job:
+        return jsonify(job), 429
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    return response
+
+@app.route("/api/jobs/<kind>", methods=["POST"])
+def create_job(kind):
+    """Tạo job nền, trả id ngay
+    Loại: update-all, download, screener, train; tham số symbols (JSON hoặc query, cách nhau dấu phẩy)"""
+    if kind not in JOB_TASKS:
+        return jsonify({"error": f"Loại job phải là {', '.join(JOB_TASKS)}"}), 400
+    return start_job(kind)
+
+@app.route("/api/jobs/<job_id>")
+def get_job(job_id):
+    """Tiến độ, kết quả từng mã và thời gian của 1 job"""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Không tìm thấy job"}), 404
+    return jsonify(job)
+
+@app.route("/api/jobs")
+def list_jobs():
+    """Danh sách job (mới nhất trước)"""
+    return jsonify(jobs.list_jobs())
 
 @app.route("/api/download/<symbol>")
 def download_new_stock(symbol):
@@ -476,23 +573,89 @@ def toggle_auto_update():
     AUTO_UPDATE_ENABLED = not AUTO_UPDATE_ENABLED
     return jsonify({"enabled": AUTO_UPDATE_ENABLED})
 
+@app.route("/api/patterns/scan")
+def scan_patterns_route():
+    """Quét mẫu hình cho toàn bộ mã
+    Tham số: pattern (cách nhau dấu phẩy), signal, type (candle/chart), days, limit, timeframe (D/W/M)"""
+    patterns = request.args.get("pattern")
+    timeframe = request.args.get("timeframe", "D").upper()
+    if timeframe not in data_store.TIMEFRAMES:
+        return jsonify({"error": f"timeframe phải là {', '.join(data_store.TIMEFRAMES)}"}), 400
+    try:
+        hits = scan_patterns(
+            patterns=[p.strip() for p in patterns.split(",") if p.strip()] if patterns else None,
+            signal=request.args.get("signal"),
+            pattern_type=request.args.get("type"),
+            days=request.args.get("days", 10, type=int),
+            timeframe=timeframe
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    limit = request.args.get("limit", type=int)
+    return jsonify(hits[:limit] if limit else hits)
+
+@app.route("/api/patterns/stats")
+def get_pattern_stats():
+    """Thống kê sự kiện: lợi nhuận sau mỗi mẫu hình trên toàn bộ mã
+    Tham số: sector=1 để kèm thống kê theo ngành"""
+    try:
+        stats = pattern_stats.get_pattern_stats()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    if request.args.get("sector") != "1":
+        stats = {k: v for k, v in stats.items() if k != "sectors"}
+    return jsonify(stats)
+
 @app.route("/api/patterns/<symbol>")
 def get_patterns(symbol):
-    """Lấy mẫu hình kỹ thuật"""
+    """Lấy mẫu hình kỹ thuật (304 nếu dữ liệu và thống kê mẫu hình chưa đổi)
+    Tham số: timeframe (D/W/M, mặc định D) - nhận diện trên nến ngày/tuần/tháng"""
     csv_path = f"data/{symbol}.csv"
     
     if not os.path.exists(csv_path):
         return jsonify({"error": "Không tìm thấy dữ liệu"}), 404
     
+    timeframe = request.args.get("timeframe", "D").upper()
+    if timeframe not in data_store.TIMEFRAMES:
+        return jsonify({"error": f"timeframe phải là {', '.join(data_store.TIMEFRAMES)}"}), 400
+    
+    # Thống kê sự kiện (nếu đã tính) được gắn vào kết quả nên thuộc phiên bản của response
+    stats = pattern_stats.peek_pattern_stats()
+    stats_version = (stats.get("updated"), stats["total_events"]) if stats and timeframe == "D" else None
+    version, last_modified = data_store.version_stamp([symbol])
+    etag = make_etag("patterns", symbol, timeframe, version, stats_version)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    
     try:
-        df = load_pattern_data(csv_path)
-        pr = PatternRecognition(df)
-        results = pr.analyze_all()
-        results["symbol"] = symbol
-        return jsonify(results)
+        results = analyze_patterns(symbol, timeframe)
+        
+        # Gắn độ mạnh thực nghiệm nếu thống kê sự kiện đã được tính (thống kê trên nến ngày)
+        if stats and timeframe == "D" and "error" not in results:
+            results = pattern_stats.attach_empirical(results, stats)
+        
+        # Hỗ trợ/kháng cự theo volume profile (cộng dồn theo phiên, không quét lại lịch sử)
+        if "error" not in results:
+            results = {**results, "volume_profile": volume_profile.get_levels(symbol)}
+        return with_validators(jsonify(results), etag, last_modified)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/similar/<symbol>")
+def get_similar(symbol):
+    """Tìm đoạn lịch sử có hình dạng giá giống hiện tại
+    Tham số: window (số phiên, mặc định 30), k (số kết quả, mặc định 10)"""
+    window = request.args.get("window", 30, type=int)
+    k = request.args.get("k", 10, type=int)
+    
+    result = find_similar(symbol.upper(), window=window, k=k)
+    if "error" in result:
+        return jsonify(result), 404 if result["error"].startswith("Không tìm thấy") else 400
+    return jsonify(result)
+
 if __name__ == "__main__":
     os.makedirs("templates", exist_ok=True)
     os.makedirs("static", exist_ok=True)
@@ -529,6 +692,10 @@ if __name__ == "__main__":
                     updated += 1
                 time.sleep(0.3)
             
+            # Làm mới giá realtime cho toàn bộ mã trong 1 lần gọi, chấm lại snapshot cho mã có dữ liệu mới
+            quote_service.refresh(stocks)
+            screener_snapshot.refresh_snapshot()
+            
             last_auto_update = datetime.now()
             print(f"[AUTO] Đã cập nhật {updated} mã")
     
@@ -541,6 +708,10 @@ if __name__ == "__main__":
             schedule.run_pending()
             time.sleep(60)
     
+    # Tính trước thống kê sự kiện mẫu hình và snapshot screener trong nền
+    threading.Thread(target=pattern_stats.get_pattern_stats, daemon=True).start()
+    jobs.submit("screener", job_screener)
+    
     # Khởi động auto updater trong thread riêng
     if AUTO_UPDATE_ENABLED:
         updater_thread = threading.Thread(target=run_scheduler, daemon=True)
@@ -0,0 +1,277 @@
+"""
+Kho dữ liệu giá - Đọc CSV, phiên bản dữ liệu (data version) và cache DataFrame theo mã
+Phiên bản dữ liệu thay đổi mỗi khi file CSV của mã được ghi lại (tải/cập nhật)
+Dữ liệu đã phân tích được lưu dạng pickle (cache/frames) để lần đọc sau không phải phân tích lại CSV
+"""
+
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+DATA_DIR = "data"
+FRAME_CACHE_DIR = os.path.join("cache", "frames")
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Cache DataFrame đã đọc: symbol -> (version, df)
+_frame_cache = {}
+_frame_lock = threading.Lock()
+
+def csv_path(symbol: str) -> str:
+    """Đường dẫn file CSV của 1 mã"""
+    return os.path.join(DATA_DIR, f"{symbol}.csv")
+
+def list_symbols() -> list:
+    """Danh sách mã có dữ liệu (đã sắp xếp)"""
+    if not os.path.exists(DATA_DIR):
+        return []
+    return sorted(f.replace(".csv", "") for f in os.listdir(DATA_DIR) if f.endswith(".csv"))
+
+def data_version(symbol: str) -> str:
+    """Phiên bản dữ liệu của 1 mã (None nếu chưa có dữ liệu)"""
+    try:
+        st = os.stat(csv_path(symbol))
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+def version_stamp(symbols: list = None):
+    """Phiên bản chung của nhiều mã và thời điểm ghi dữ liệu gần nhất (UTC), chỉ đọc stat của file
+    Phiên bản đổi khi bất kỳ mã nào được ghi lại, thêm hoặc bớt mã. Trả về (chuỗi phiên bản, datetime | None)"""
+    symbols = list_symbols() if symbols is None else symbols
+    digest = hashlib.sha1()
+    latest = None
+    for symbol in symbols:
+        try:
+            st = os.stat(csv_path(symbol))
+        except OSError:
+            digest.update(f"{symbol}:-;".encode())
+            continue
+        digest.update(f"{symbol}:{st.st_mtime_ns:x}-{st.st_size:x};".encode())
+        latest = st.st_mtime if latest is None else max(latest, st.st_mtime)
+    modified = datetime.fromtimestamp(latest, timezone.utc) if latest is not None else None
+    return digest.hexdigest()[:16], modified
+
+def load_data(csv_path: str) -> pd.DataFrame:
+    """Đọc CSV từ yfinance"""
+    try:
+        df = pd.read_csv(csv_path, header=[0, 1], index_col=0)
+        df.columns = [col[0] for col in df.columns]
+    except:
+        df = pd.read_csv(csv_path, index_col=0)
+
+    df = df.reset_index()
+    df.columns.values[0] = "Date"
+
+    if df["Date"].dtype == object:
+        df = df[df["Date"].str.match(r"^\d{4}-\d{2}-\d{2}", na=False)].copy()
+
+    df["Date"] = pd.to_datetime(df["Date"])
+    for col in ["Open", "High", "Low", "Close", "Volume"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    df = df.set_index("Date").dropna()
+    return df
+
+def _read_frame(symbol: str, version: str) -> pd.DataFrame:
+    """Đọc bản đã phân tích (pickle) nếu cùng phiên bản, nếu không thì đọc CSV rồi lưu lại bản pickle"""
+    path = os.path.join(FRAME_CACHE_DIR, f"{symbol}.pkl")
+    try:
+        cached_version, df = pd.read_pickle(path)
+        if cached_version == version:
+            return df
+    except Exception:
+        pass
+
+    df = load_data(csv_path(symbol))
+    try:
+        os.makedirs(FRAME_CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pd.to_pickle((version, df), tmp)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return df
+
+def load_symbol(symbol: str, keep: bool = True):
+    """Đọc dữ liệu 1 mã, dùng lại cache nếu phiên bản chưa đổi
+    keep=False: không giữ lại trong bộ nhớ (quét toàn bộ mã với bộ nhớ giới hạn)
+    Trả về (df, version); df dùng chung giữa các lần gọi nên không được sửa trực tiếp"""
+    version = data_version(symbol)
+    if version is None:
+        return None, None
+
+    with _frame_lock:
+        cached = _frame_cache.get(symbol)
+    if cached and cached[0] == version:
+        return cached[1], version
+
+    df = _read_frame(symbol, version)
+    if keep:
+        with _frame_lock:
+            _frame_cache[symbol] = (version, df)
+    return df, version
+
+def first_changed_row(old: pd.DataFrame, new: pd.DataFrame) -> int:
+    """Vị trí dòng đầu tiên khác nhau giữa dữ liệu cũ và mới của cùng 1 mã
+    (0 nếu ngày giao dịch trong lịch sử bị thay đổi, độ dài phần chung nếu chỉ thêm/bớt ở cuối)"""
+    n = min(len(old), len(new))
+    if n == 0 or not old.index[:n].equals(new.index[:n]):
+        return 0
+
+    cols = [c for c in PRICE_COLUMNS if c in old.columns and c in new.columns]
+    changed = np.flatnonzero((old[cols].values[:n] != new[cols].values[:n]).any(axis=1))
+    return int(changed[0]) if len(changed) else n
+
+# ============ PANEL (NGÀY x MÃ) ============
+
+# Cache panel: (tuple(symbols), tuple(columns)) -> (tuple(versions), panel)
+_panel_cache = {}
+
+def load_panel(symbols: list = None, columns: list = PRICE_COLUMNS, keep: bool = True) -> dict:
+    """Ghép dữ liệu nhiều mã thành bảng (ngày x mã) cho từng cột giá
+    Ngày mã chưa niêm yết / không có giao dịch là NaN. Dùng lại cache nếu mọi phiên bản chưa đổi
+    Panel cũ cùng danh sách mã được dùng lại cho các mã chưa đổi phiên bản (chỉ đọc lại mã đã cập nhật)
+    Dữ liệu từng mã không giữ trong bộ nhớ (đã có bản pickle); keep=False: không lưu cả panel (xử lý theo lô)"""
+    symbols = list_symbols() if symbols is None else list(symbols)
+    key = (tuple(symbols), tuple(columns))
+    versions = tuple(data_version(s) for s in symbols)
+
+    with _frame_lock:
+        cached = _panel_cache.get(key)
+    if cached and cached[0] == versions:
+        return cached[1]
+
+    # Mã chưa đổi phiên bản lấy lại cột từ panel cũ, chỉ đọc lại mã đã đổi
+    reuse = {}
+    if cached:
+        old_columns = cached[1][columns[0]].columns
+        for symbol, old_version, version in zip(symbols, cached[0], versions):
+            if version is not None and old_version == version and symbol in old_columns:
+                reuse[symbol] = old_columns.get_loc(symbol)
+
+    frames = {}
+    for symbol in symbols:
+        if symbol in reuse:
+            continue
+        df, _ = load_symbol(symbol, keep=False)
+        if df is not None:
+            frames[symbol] = df
+
+    # Lưới ngày chung tạo 1 lần rồi đặt giá trị từng mã vào đúng dòng (không hợp index từng cột)
+    names = [s for s in symbols if s in reuse or s in frames]
+    parts = [df.index.values for df in frames.values()]
+    if reuse:
+        old_index = cached[1][columns[0]].index
+        old_j = np.array(list(reuse.values()))
+        old_rows = np.flatnonzero(~np.isnan(cached[1][columns[0]].values[:, old_j]).all(axis=1))
+        parts.append(old_index.values[old_rows])
+    if parts:
+        name = old_index.name if reuse else next(iter(frames.values())).index.name
+        index = pd.DatetimeIndex(np.unique(np.concatenate(parts)), name=name)
+    else:
+        index = pd.DatetimeIndex([], name="Date")
+    position = {s: j for j, s in enumerate(names)}
+    values = {col: np.full((len(index), len(names)), np.nan) for col in columns}
+    if reuse:
+        new_j = np.array([position[s] for s in reuse])
+        rows = index.searchsorted(old_index.values[old_rows])
+        for col in columns:
+            values[col][np.ix_(rows, new_j)] = cached[1][col].values[np.ix_(old_rows, old_j)]
+    for symbol, df in frames.items():
+        rows = index.searchsorted(df.index.values)
+        for col in columns:
+            values[col][rows, position[symbol]] = df[col].values
+    panel = {col: pd.DataFrame(values[col], index=index, columns=names) for col in columns}
+
+    if keep:
+        with _frame_lock:
+            _panel_cache[key] = (versions, panel)
+    return panel
+
+def compact_columns(frame: pd.DataFrame):
+    """Dồn giá trị hợp lệ của mỗi cột lên đầu (chuỗi nến riêng của từng mã, bỏ ngày NaN)
+    Trả về (mảng dồn, vị trí dòng trong mảng dồn, mặt nạ hợp lệ) để tính theo nến rồi trải lại"""
+    values = frame.values.astype(float)
+    valid = ~np.isnan(values)
+    rank = np.cumsum(valid, axis=0) - 1
+    compact = np.full((max(int(valid.sum(axis=0).max(initial=0)), 1), values.shape[1]), np.nan)
+    cols = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    compact[rank[valid], cols[valid]] = values[valid]
+    return compact, rank, valid
+
+def expand_columns(compact: np.ndarray, rank: np.ndarray, valid: np.ndarray, like: pd.DataFrame) -> pd.DataFrame:
+    """Trải kết quả tính trên mảng dồn về lại lưới (ngày x mã) của `like`"""
+    out = np.full(valid.shape, np.nan)
+    cols = np.broadcast_to(np.arange(valid.shape[1]), valid.shape)
+    out[valid] = compact[rank[valid], cols[valid]]
+    return pd.DataFrame(out, index=like.index, columns=like.columns)
+
+# ============ KHUNG THỜI GIAN TUẦN / THÁNG ============
+
+# Khung thời gian -> quy tắc resample của pandas (None: dữ liệu ngày gốc); "ME" cần pandas >= 2.2 (requirements.txt)
+TIMEFRAMES = {"D": None, "W": "W", "M": "ME"}
+_PERIOD_FREQ = {"W": "W", "M": "M"}
+
+# Cache nến đã gộp: (symbol, timeframe) -> (version, df ngày, df đã gộp)
+_resample_cache = {}
+
+def resample_ohlc(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """Gộp nến ngày theo tuần/tháng; mỗi nến gộp mang ngày giao dịch cuối cùng của kỳ"""
+    rule = TIMEFRAMES[timeframe]
+    if rule is None:
+        return df
+
+    out = df.assign(_date=df.index).resample(rule).agg({
+        "Open": "first",
+        "High": "max",
+        "Low": "min",
+        "Close": "last",
+        "Volume": "sum",
+        "_date": "last"
+    }).dropna()
+    return out.set_index("_date").rename_axis("Date")
+
+def load_timeframe(symbol: str, timeframe: str = "D"):
+    """Dữ liệu 1 mã theo khung thời gian, trả về (df, version) như load_symbol
+    Khi dữ liệu ngày đổi phiên bản chỉ gộp lại từ kỳ chứa phiên đầu tiên bị thay đổi"""
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"Khung thời gian không hợp lệ: {timeframe} (chọn {', '.join(TIMEFRAMES)})")
+
+    daily, version = load_symbol(symbol)
+    if daily is None or TIMEFRAMES[timeframe] is None:
+        return daily, version
+
+    key = (symbol, timeframe)
+    with _frame_lock:
+        cached = _resample_cache.get(key)
+    if cached and cached[0] == version:
+        return cached[2], version
+
+    if cached is None:
+        bars = resample_ohlc(daily, timeframe)
+    else:
+        _, old_daily, old_bars = cached
+        start = first_changed_row(old_daily, daily)
+        # Giữ các nến gộp của kỳ trước kỳ chứa phiên đầu tiên bị thay đổi/thêm mới
+        # (bớt phiên ở cuối thì gộp lại kỳ chứa phiên cuối còn lại)
+        if start < len(daily):
+            changed = daily.index[start]
+        elif start < len(old_daily) and len(daily):
+            changed = daily.index[-1]
+        else:
+            changed = None
+        if changed is None:
+            keep = len(old_bars) if len(daily) else 0
+        else:
+            keep = old_bars.index.searchsorted(pd.Period(changed, _PERIOD_FREQ[timeframe]).start_time)
+        kept = old_bars.iloc[:keep]
+        rest = daily if keep == 0 else daily[daily.index > kept.index[-1]]
+        bars = pd.concat([kept, resample_ohlc(rest, timeframe)]) if len(rest) else kept
+
+    with _frame_lock:
+        _resample_cache[key] = (version, daily, bars)
+    return bars, version
@@ -5,9 +5,13 @@ Sử dụng: python download_all_vn.py
 
 import yfinance as yf
 from datetime import datetime
+import csv
 import os
 import time
 
+# Danh sách mã đầy đủ (toàn thị trường): CSV cột symbol,name,exchange,sector
+SYMBOL_MASTER_PATH = "symbols.csv"
+
 # DANH SÁCH 50+ CỔ PHIẾU VIỆT NAM PHỔ BIẾN
 VN_STOCKS = {
     # Ngân hàng
@@ -101,6 +105,58 @@ VN_STOCKS = {
     "VHC": "Vinh Hoan",
 }
 
+# Nhóm ngành (theo các nhóm trong VN_STOCKS)
+SECTORS = {
+    "Ngân hàng": ["VCB", "TCB", "MBB", "VPB", "ACB", "BID", "CTG", "STB", "HDB", "TPB", "LPB", "EIB", "SHB", "SSB", "MSB"],
+    "Bất động sản": ["VIC", "VHM", "VRE", "NVL", "KDH", "DXG", "PDR", "NLG", "DIG", "KBC", "IJC"],
+    "Công nghệ": ["FPT", "CMG"],
+    "Thực phẩm & Đồ uống": ["VNM", "MSN", "SAB", "QNS", "MCH"],
+    "Bán lẻ": ["MWG", "PNJ", "FRT", "DGW"],
+    "Thép & Vật liệu": ["HPG", "HSG", "NKG"],
+    "Chứng khoán": ["SSI", "VND", "HCM", "VCI", "SHS"],
+    "Dầu khí": ["GAS", "PLX", "PVD", "PVS", "BSR"],
+    "Điện": ["POW", "GEG", "PC1", "REE", "NT2"],
+    "Hàng không & Logistics": ["HVN", "VJC", "ACV", "GMD"],
+    "Khác": ["VGC", "GVR", "DCM", "DPM", "PHR", "HAG", "DBC", "ANV", "VHC"],
+}
+
+# Mã -> ngành
+SYMBOL_SECTOR = {symbol: sector for sector, symbols in SECTORS.items() for symbol in symbols}
+
+# Cache danh sách mã: path -> (mtime, {mã: {"name", "exchange", "sector"}})
+_master_cache = {}
+
+def load_symbol_master(path: str = None) -> dict:
+    """Đọc danh sách mã đầy đủ từ CSV (rỗng nếu chưa có file), đọc lại khi file đổi"""
+    path = path or SYMBOL_MASTER_PATH
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _master_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    master = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            symbol = (row.get("symbol") or "").strip().upper()
+            if symbol:
+                master[symbol] = {
+                    "name": (row.get("name") or symbol).strip(),
+                    "exchange": (row.get("exchange") or "").strip(),
+                    "sector": (row.get("sector") or "").strip(),
+                }
+    _master_cache[path] = (mtime, master)
+    return master
+
+def get_sector(symbol: str) -> str:
+    """Ngành của 1 mã: theo SECTORS, sau đó theo danh sách mã đầy đủ ("Khác" nếu không có)"""
+    if symbol in SYMBOL_SECTOR:
+        return SYMBOL_SECTOR[symbol]
+    info = load_symbol_master().get(symbol)
+    return info["sector"] if info and info["sector"] else "Khác"
+
 def download_stock(symbol: str, name: str, start: str = "2020-01-01"):
     """Tải dữ liệu 1 mã"""
     yf_symbol = symbol + ".VN"
@@ -120,18 +176,19 @@ def download_stock(symbol: str, name: str, start: str = "2020-01-01"):
     except Exception as e:
         return False, 0
 
-def download_all():
-    """Tải tất cả cổ phiếu"""
+def download_all(stocks: dict = None):
+    """Tải tất cả cổ phiếu (mặc định VN_STOCKS; truyền {mã: tên} để tải danh sách khác)"""
+    stocks = VN_STOCKS if stocks is None else stocks
     print(f"\n{'='*60}")
-    print(f"   TAI DU LIEU {len(VN_STOCKS)} CO PHIEU VIET NAM")
+    print(f"   TAI DU LIEU {len(stocks)} CO PHIEU VIET NAM")
     print(f"{'='*60}\n")
     
     success = 0
     failed = 0
     failed_list = []
     
-    for i, (symbol, name) in enumerate(VN_STOCKS.items(), 1):
-        print(f"[{i}/{len(VN_STOCKS)}] {symbol} ({name})...", end=" ")
+    for i, (symbol, name) in enumerate(stocks.items(), 1):
+        print(f"[{i}/{len(stocks)}] {symbol} ({name})...", end=" ")
         
         ok, rows = download_stock(symbol, name)
         
@@ -158,8 +215,9 @@ if __name__ == "__main__":
     print("1. Tai tat ca 70+ ma co phieu VN")
     print("2. Tai theo nganh")
     print("3. Nhap danh sach tu chon")
+    print(f"4. Tai toan bo ma trong {SYMBOL_MASTER_PATH} (toan thi truong)")
     
-    choice = input("\nLua chon (1/2/3): ").strip()
+    choice = input("\nLua chon (1/2/3/4): ").strip()
     
     if choice == "1":
         download_all()
@@ -175,11 +233,11 @@ if __name__ == "__main__":
         sector = input("Chon nganh (1-5): ").strip()
         
         sectors = {
-            "1": ["VCB", "TCB", "MBB", "VPB", "ACB", "BID", "CTG", "STB", "HDB", "TPB", "LPB", "EIB", "SHB", "SSB", "MSB"],
-            "2": ["VIC", "VHM", "VRE", "NVL", "KDH", "DXG", "PDR", "NLG", "DIG", "KBC", "IJC"],
-            "3": ["SSI", "VND", "HCM", "VCI", "SHS"],
-            "4": ["GAS", "PLX", "PVD", "PVS", "BSR"],
-            "5": ["VNM", "MSN", "SAB", "QNS", "MCH"],
+            "1": SECTORS["Ngân hàng"],
+            "2": SECTORS["Bất động sản"],
+            "3": SECTORS["Chứng khoán"],
+            "4": SECTORS["Dầu khí"],
+            "5": SECTORS["Thực phẩm & Đồ uống"],
         }
         
         if sector in sectors:
@@ -200,3 +258,10 @@ if __name__ == "__main__":
             ok, rows = download_stock(symbol, name)
             print(f"OK ({rows} ngay)" if ok else "THAT BAI")
             time.sleep(0.5)
+
+    elif choice == "4":
+        master = load_symbol_master()
+        if not master:
+            print(f"Chua co {SYMBOL_MASTER_PATH} (cot symbol,name,exchange,sector)")
+        else:
+            download_all({symbol: info["name"] for symbol, info in master.items()})
@@ -0,0 +1,150 @@
+"""
+Job nền - Chạy tác vụ dài (cập nhật / tải dữ liệu, chấm lại screener, train model) trên pool thread giới hạn
+Request chỉ tạo job và nhận id ngay; tiến độ, kết quả từng mã và thời gian xem qua get_job (/api/jobs/<id>)
+Sử dụng: python jobs.py (thử 1 job giả lập)
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Số job chạy cùng lúc; job tạo thêm chờ trong hàng đợi
+JOB_WORKERS = 2
+
+# Số job chưa xong tối đa (đang chạy + đang chờ); vượt quá thì từ chối tạo job mới
+MAX_PENDING = 10
+
+# Số job đã xong được giữ lại để xem kết quả
+JOB_HISTORY = 50
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+# id -> trạng thái job (theo thứ tự tạo)
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+ACTIVE = ("queued", "running")
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+def _prune():
+    """Bỏ các job đã xong cũ nhất khi vượt JOB_HISTORY (gọi khi đang giữ _jobs_lock)"""
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] not in ACTIVE]
+    for job_id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+        del _jobs[job_id]
+
+def submit(kind: str, task, params: dict = None) -> dict:
+    """Tạo job chạy task(job_id, params) trên pool, trả về ngay bản tóm tắt của job
+    Đã có job cùng loại và cùng tham số chưa xong thì trả về job đó ("existing": True)
+    Quá MAX_PENDING job chưa xong thì trả về {"error": ...}"""
+    params = params or {}
+    with _jobs_lock:
+        active = [job for job in _jobs.values() if job["status"] in ACTIVE]
+        for job in active:
+            if job["kind"] == kind and job["params"] == params:
+                return {**summary(job), "existing": True}
+        if len(active) >= MAX_PENDING:
+            return {"error": f"Đang có {len(active)} job chưa xong, thử lại sau"}
+
+        job = {
+            "id": uuid.uuid4().hex[:12], "kind": kind, "params": params, "status": "queued",
+            "total": None, "done": 0, "ok": 0, "failed": 0, "results": [],
+            "created": _now(), "started": None, "finished": None,
+            "_start": None, "elapsed": None, "result": None, "error": None,
+        }
+        _jobs[job["id"]] = job
+        _prune()
+    _executor.submit(_run, job["id"], task, params)
+    return summary(job)
+
+def _run(job_id: str, task, params: dict):
+    """Chạy 1 job trong thread của pool, ghi trạng thái cuối (done / failed)"""
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job.update(status="running", started=_now(), _start=time.time())
+    try:
+        result = task(job_id, params)
+        status, error = "done", None
+    except Exception as e:
+        result, status, error = None, "failed", str(e)
+    with _jobs_lock:
+        job.update(status=status, result=result, error=error, finished=_now(),
+                   elapsed=round(time.time() - job["_start"], 3))
+
+def set_total(job_id: str, total: int):
+    """Số mục (mã) job sẽ xử lý, dùng tính tiến độ"""
+    with _jobs_lock:
+        _jobs[job_id]["total"] = total
+
+def record(job_id: str, item: str, ok: bool, elapsed: float = None, **detail):
+    """Ghi kết quả của 1 mục (mã) trong job"""
+    outcome = {"item": item, "ok": bool(ok), **detail}
+    if elapsed is not None:
+        outcome["elapsed"] = round(elapsed, 3)
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job["results"].append(outcome)
+        job["done"] += 1
+        job["ok" if ok else "failed"] += 1
+
+def run_each(job_id: str, items: list, work, delay: float = 0) -> dict:
+    """Chạy work(item) lần lượt cho từng mục, ghi kết quả từng mục
+    work trả về bool hoặc dict (có khóa "ok", các khóa khác ghi kèm kết quả); lỗi của 1 mục không dừng job
+    delay: nghỉ giữa các mục (tránh bị nguồn dữ liệu chặn)"""
+    set_total(job_id, len(items))
+    for i, item in enumerate(items):
+        start = time.time()
+        try:
+            out = work(item)
+            detail = dict(out) if isinstance(out, dict) else {"ok": bool(out)}
+        except Exception as e:
+            detail = {"ok": False, "message": str(e)}
+        record(job_id, item, detail.pop("ok"), time.time() - start, **detail)
+        if delay and i < len(items) - 1:
+            time.sleep(delay)
+    with _jobs_lock:
+        job = _jobs[job_id]
+        return {"ok": job["ok"], "failed": job["failed"], "total": len(items)}
+
+def summary(job: dict, results: bool = False) -> dict:
+    """Bản sao công khai của job: tiến độ (%), thời gian đã chạy, ước tính còn lại; results=True kèm kết quả từng mục"""
+    out = {k: v for k, v in job.items() if not k.startswith("_") and k != "results"}
+    if job["status"] == "running" and job["_start"]:
+        out["elapsed"] = round(time.time() - job["_start"], 3)
+    total, done = job["total"], job["done"]
+    out["progress"] = (100.0 if job["status"] == "done" else
+                       round(done / total * 100, 1) if total else 0.0)
+    out["eta"] = (round(out["elapsed"] / done * (total - done), 1)
+                  if job["status"] == "running" and total and done else None)
+    if results:
+        out["results"] = list(job["results"])
+    return out
+
+def get_job(job_id: str) -> dict:
+    """Trạng thái đầy đủ của 1 job (None nếu không có)"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return summary(job, results=True) if job else None
+
+def list_jobs() -> list:
+    """Tóm tắt các job (mới nhất trước, không kèm kết quả từng mục)"""
+    with _jobs_lock:
+        return [summary(job) for job in reversed(_jobs.values())]
+
+if __name__ == "__main__":
+    def demo(job_id, params):
+        return run_each(job_id, ["AAA", "BBB", "CCC", "DDD"], lambda s: {"ok": s != "CCC", "rows": len(s)}, delay=0.2)
+
+    job = submit("demo", demo)
+    while True:
+        state = get_job(job["id"])
+        print(f"{state['status']:<8} {state['done']}/{state['total']} {state['progress']:>5.1f}%")
+        if state["status"] not in ACTIVE:
+            break
+        time.sleep(0.2)
+    for outcome in state["results"]:
+        print(f"  {outcome['item']:<6} {'OK' if outcome['ok'] else 'THAT BAI'} {outcome['elapsed']:.3f}s")
+    print(f"Thoi gian: {state['elapsed']}s, ket qua: {state['result']}")
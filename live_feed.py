@@ -0,0 +1,163 @@
+"""
+Kênh đẩy realtime - 1 thread nền theo dõi cache giá (quote_service) và phiên bản dữ liệu các mã đang được theo dõi,
+mỗi thay đổi được gửi 1 lần tới mọi người nghe (server-sent events ở /api/stream)
+Số lần gọi Yahoo không phụ thuộc số tab đang mở: giá được lấy chung cho mọi mã đang theo dõi, theo QUOTE_TTL
+Sử dụng: python live_feed.py [MA ...]
+"""
+
+import itertools
+import queue
+import threading
+import time
+import data_store
+import quote_service
+from scoring import ai_analyze
+
+# Chu kỳ kiểm tra thay đổi (giây) - chỉ đọc cache giá và stat file, không gọi mạng
+FEED_INTERVAL = 2
+
+# Số sự kiện tối đa chờ gửi của 1 người nghe; người nghe quá chậm bị bỏ sự kiện cũ nhất
+SUBSCRIBER_QUEUE = 100
+
+# Người nghe: id -> (tập mã, hàng đợi sự kiện)
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+_ids = itertools.count(1)
+
+# Trạng thái đã gửi của từng mã: symbol -> {"version", "quote", "analysis"}
+_sent = {}
+_feeder = {"thread": None}
+
+def _quote_key(quote: dict):
+    """Phần của quote xác định giá có đổi không (bỏ qua thời điểm lấy)"""
+    if not quote:
+        return None
+    return (quote["price"], quote["change"], quote["volume"], quote["high"], quote["low"])
+
+def _analysis_key(analysis: dict):
+    """Phần của kết quả phân tích xác định điểm có đổi không"""
+    if not analysis or "error" in analysis:
+        return None
+    return (analysis["score"], analysis["rating"], tuple(s["text"] for s in analysis["signals"]))
+
+def analyze(symbol: str, quote: dict = None) -> dict:
+    """Phân tích AI 1 mã từ dữ liệu cache của data_store và giá realtime đang có"""
+    df, _ = data_store.load_symbol(symbol)
+    if df is None:
+        return {"error": "Không tìm thấy dữ liệu"}
+    return ai_analyze(df, symbol, quote)
+
+def subscribe(symbols: list) -> tuple:
+    """Đăng ký nhận sự kiện của các mã, trả về (id, hàng đợi)
+    Hàng đợi nhận ngay giá và phân tích hiện tại (nếu đã có), sau đó là các thay đổi"""
+    events = queue.Queue(SUBSCRIBER_QUEUE)
+    symbols = set(symbols)
+    with _subscribers_lock:
+        sub_id = next(_ids)
+        _subscribers[sub_id] = (symbols, events)
+        for symbol in sorted(symbols):
+            state = _sent.get(symbol, {})
+            if state.get("quote"):
+                _put(events, ("quote", state["quote"]))
+            if state.get("analysis"):
+                _put(events, ("analysis", state["analysis"]))
+    _start()
+    return sub_id, events
+
+def unsubscribe(sub_id: int):
+    """Hủy đăng ký (khi client ngắt kết nối)"""
+    with _subscribers_lock:
+        _subscribers.pop(sub_id, None)
+
+def watched() -> list:
+    """Các mã đang có người theo dõi"""
+    with _subscribers_lock:
+        return sorted(set().union(*(symbols for symbols, _ in _subscribers.values())))
+
+def _put(events: queue.Queue, event: tuple):
+    """Đưa sự kiện vào hàng đợi, bỏ sự kiện cũ nhất nếu đầy"""
+    while True:
+        try:
+            events.put_nowait(event)
+            return
+        except queue.Full:
+            try:
+                events.get_nowait()
+            except queue.Empty:
+                pass
+
+def publish(symbol: str, event: str, data: dict):
+    """Gửi 1 sự kiện của 1 mã tới mọi người nghe mã đó"""
+    with _subscribers_lock:
+        for symbols, events in _subscribers.values():
+            if symbol in symbols:
+                _put(events, (event, data))
+
+def check(symbols: list) -> int:
+    """Gửi các thay đổi giá / dữ liệu / điểm của các mã so với lần gửi trước, trả về số sự kiện đã gửi"""
+    quotes = quote_service.peek_quotes(symbols)
+    count = 0
+    for symbol in symbols:
+        state = _sent.setdefault(symbol, {"version": None, "quote": None, "analysis": None})
+        version = data_store.data_version(symbol)
+        quote = quotes.get(symbol)
+        quote_changed = _quote_key(quote) != _quote_key(state["quote"])
+        if version == state["version"] and not quote_changed:
+            continue
+
+        if quote_changed:
+            state["quote"] = quote
+            if quote:
+                publish(symbol, "quote", quote)
+                count += 1
+
+        # Điểm tính lại khi dữ liệu đổi phiên bản hoặc giá realtime đổi; chỉ gửi khi khác lần trước
+        analysis = analyze(symbol, quote) if version else None
+        version_changed = version != state["version"]
+        state["version"] = version
+        if analysis and "error" not in analysis and (version_changed or
+                                                     _analysis_key(analysis) != _analysis_key(state["analysis"])):
+            state["analysis"] = {**analysis, "version": version}
+            publish(symbol, "analysis", state["analysis"])
+            count += 1
+    return count
+
+def _run():
+    """Vòng lặp thread nền: chạy khi còn người nghe, tự dừng khi không còn ai"""
+    while True:
+        with _subscribers_lock:
+            if not _subscribers:
+                _feeder["thread"] = None
+                return
+        symbols = watched()
+        if symbols:
+            # Giá quá TTL được lấy lại trong nền, 1 lượt chung cho mọi mã đang theo dõi
+            quote_service.refresh_async(symbols)
+            try:
+                check(symbols)
+            except Exception as e:
+                print(f"Lỗi live feed: {e}")
+        time.sleep(FEED_INTERVAL)
+
+def _start():
+    """Khởi động thread nền nếu chưa chạy"""
+    with _subscribers_lock:
+        if _feeder["thread"] is None:
+            _feeder["thread"] = threading.Thread(target=_run, daemon=True)
+            _feeder["thread"].start()
+
+if __name__ == "__main__":
+    import sys
+
+    symbols = [a.upper() for a in sys.argv[1:]] or data_store.list_symbols()[:5]
+    sub_id, events = subscribe(symbols)
+    print(f"Theo doi {', '.join(symbols)} (Ctrl+C de dung)")
+    try:
+        while True:
+            event, data = events.get()
+            if event == "quote":
+                print(f"[{data['updated']}] {data['symbol']:<8} {data['price']:>12,.2f} {data['change_pct']:>+7.2f}%")
+            else:
+                print(f"[{data['updated']}] {data['symbol']:<8} diem {data['score']:>3} {data['rating']}")
+    except KeyboardInterrupt:
+        unsubscribe(sub_id)
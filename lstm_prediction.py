@@ -123,62 +123,39 @@ def train_and_predict(X_train, X_test, y_train, y_test, scaler_y, model_type="rf
     
     return model, y_test_inv, y_pred_inv
 
-def run_prediction(symbol: str):
-    """Chạy dự đoán"""
-    csv_path = f"data/{symbol}.csv"
+def predict(symbol: str, model_type: str = "rf") -> dict:
+    """Train model cho 1 mã, trả về sai số trên tập test và giá dự đoán phiên tiếp theo
+    Trả về {"error": ...} nếu thiếu thư viện hoặc dữ liệu"""
+    if not HAS_SKLEARN:
+        return {"error": "Chưa cài scikit-learn"}
     
+    csv_path = f"data/{symbol}.csv"
     if not os.path.exists(csv_path):
-        print(f"Khong tim thay file {csv_path}")
-        return
-    
-    print(f"\n{'='*60}")
-    print(f"   DU DOAN GIA: {symbol}")
-    print(f"{'='*60}")
+        return {"error": f"Không tìm thấy file {csv_path}"}
     
     # Load và xử lý dữ liệu
     df = load_data(csv_path)
-    print(f"So ngay du lieu: {len(df)}")
-    
-    if len(df) < 100:
-        print("Khong du du lieu (can it nhat 100 ngay)")
-        return
+    rows = len(df)
+    if rows < 100:
+        return {"error": "Không đủ dữ liệu (cần ít nhất 100 ngày)", "rows": rows}
     
     # Thêm features
     df = add_features(df)
-    print(f"So ngay sau xu ly: {len(df)}")
     
-    # Chuẩn bị dữ liệu
+    # Chuẩn bị dữ liệu, train và dự đoán
     X_train, X_test, y_train, y_test, scaler_y, feature_cols = prepare_data(df)
-    
-    print(f"Train samples: {len(X_train)}")
-    print(f"Test samples: {len(X_test)}")
-    print(f"Features: {', '.join(feature_cols)}")
-    
-    # Train và dự đoán
-    print(f"\nDang train model...")
-    model, y_test_inv, y_pred_inv = train_and_predict(X_train, X_test, y_train, y_test, scaler_y, "rf")
+    model, y_test_inv, y_pred_inv = train_and_predict(X_train, X_test, y_train, y_test, scaler_y, model_type)
     
     # Đánh giá
     rmse = np.sqrt(mean_squared_error(y_test_inv, y_pred_inv))
     mae = mean_absolute_error(y_test_inv, y_pred_inv)
     mape = np.mean(np.abs((y_test_inv - y_pred_inv) / y_test_inv)) * 100
     
-    print(f"\n--- KET QUA ---")
-    print(f"RMSE: {rmse:,.0f}")
-    print(f"MAE: {mae:,.0f}")
-    print(f"MAPE: {mape:.2f}%")
-    print(f"Do chinh xac: {100 - mape:.1f}%")
-    
     # Dự đoán xu hướng
     current_price = df["Close"].iloc[-1]
     predicted_price = y_pred_inv[-1]
     change_pct = (predicted_price - y_test_inv[-2]) / y_test_inv[-2] * 100 if len(y_test_inv) > 1 else 0
     
-    print(f"\n--- DU DOAN ---")
-    print(f"Gia hien tai: {current_price:,.0f}")
-    print(f"Gia du doan gan nhat: {predicted_price:,.0f}")
-    print(f"Xu huong: {change_pct:+.2f}%")
-    
     # Dự đoán ngày tiếp theo
     last_features = df[feature_cols].iloc[-1:].values
     scaler_X = MinMaxScaler()
@@ -189,19 +166,70 @@ def run_prediction(symbol: str):
     
     next_change = (next_price - current_price) / current_price * 100
     
-    print(f"\nDu doan ngay tiep theo: {next_price:,.0f} ({next_change:+.2f}%)")
-    
     if next_change > 1:
-        print(f"\n>>> KHUYEN NGHI: XEM XET MUA <<<")
+        recommendation = "XEM XET MUA"
     elif next_change < -1:
-        print(f"\n>>> KHUYEN NGHI: CAN THAN <<<")
+        recommendation = "CAN THAN"
     else:
-        print(f"\n>>> KHUYEN NGHI: GIU/THEO DOI <<<")
+        recommendation = "GIU/THEO DOI"
+    
+    return {
+        "symbol": symbol,
+        "model": model_type,
+        "rows": rows,
+        "rows_features": len(df),
+        "train_samples": len(X_train),
+        "test_samples": len(X_test),
+        "features": feature_cols,
+        "rmse": float(rmse),
+        "mae": float(mae),
+        "mape": float(mape),
+        "current_price": float(current_price),
+        "predicted_price": float(predicted_price),
+        "trend_pct": float(change_pct),
+        "next_price": float(next_price),
+        "next_change": float(next_change),
+        "recommendation": recommendation,
+        "y_test": y_test_inv,
+        "y_pred": y_pred_inv,
+    }
+
+def run_prediction(symbol: str):
+    """Chạy dự đoán"""
+    print(f"\n{'='*60}")
+    print(f"   DU DOAN GIA: {symbol}")
+    print(f"{'='*60}")
+    
+    print(f"\nDang train model...")
+    result = predict(symbol)
+    if "error" in result:
+        print(result["error"])
+        return
+    
+    print(f"So ngay du lieu: {result['rows']}")
+    print(f"So ngay sau xu ly: {result['rows_features']}")
+    print(f"Train samples: {result['train_samples']}")
+    print(f"Test samples: {result['test_samples']}")
+    print(f"Features: {', '.join(result['features'])}")
+    
+    print(f"\n--- KET QUA ---")
+    print(f"RMSE: {result['rmse']:,.0f}")
+    print(f"MAE: {result['mae']:,.0f}")
+    print(f"MAPE: {result['mape']:.2f}%")
+    print(f"Do chinh xac: {100 - result['mape']:.1f}%")
+    
+    print(f"\n--- DU DOAN ---")
+    print(f"Gia hien tai: {result['current_price']:,.0f}")
+    print(f"Gia du doan gan nhat: {result['predicted_price']:,.0f}")
+    print(f"Xu huong: {result['trend_pct']:+.2f}%")
+    
+    print(f"\nDu doan ngay tiep theo: {result['next_price']:,.0f} ({result['next_change']:+.2f}%)")
+    print(f"\n>>> KHUYEN NGHI: {result['recommendation']} <<<")
     
     # Vẽ biểu đồ
     plt.figure(figsize=(14, 6))
-    plt.plot(y_test_inv, label='Gia thuc', color='blue')
-    plt.plot(y_pred_inv, label='Du doan', color='red', alpha=0.7)
+    plt.plot(result["y_test"], label='Gia thuc', color='blue')
+    plt.plot(result["y_pred"], label='Du doan', color='red', alpha=0.7)
     plt.title(f'{symbol} - Gia thuc vs Du doan (Random Forest)')
     plt.xlabel('Ngay')
     plt.ylabel('Gia')
@@ -1,26 +1,387 @@
 """
 AI Pattern Recognition - Nhận diện mẫu hình biểu đồ
 Bao gồm: Mẫu nến, Mẫu hình giá, Hỗ trợ/Kháng cự
+Trạng thái nhận diện được giữ theo mã và phiên bản dữ liệu, khi có nến mới
+chỉ đánh giá lại phần dữ liệu mới (kèm đoạn nhìn lại cần thiết của từng quy tắc)
 """
 
 import pandas as pd
 import numpy as np
 from scipy.signal import argrelextrema
 import os
+import sys
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import data_store
+from data_store import load_data
+
+# ============ MẪU NẾN ============
+
+# Tên mẫu nến -> (tín hiệu, độ mạnh, mô tả), theo thứ tự quy tắc
+CANDLE_PATTERNS_INFO = {
+    "Doji": ("neutral", 1, "Doji - Thị trường do dự, có thể đảo chiều"),
+    "Hammer": ("bullish", 2, "Hammer - Tín hiệu đảo chiều tăng ở đáy"),
+    "Inverted Hammer": ("bullish", 2, "Inverted Hammer - Có thể đảo chiều tăng"),
+    "Shooting Star": ("bearish", 2, "Shooting Star - Tín hiệu đảo chiều giảm ở đỉnh"),
+    "Bullish Engulfing": ("bullish", 3, "Bullish Engulfing - Tín hiệu đảo chiều tăng mạnh"),
+    "Bearish Engulfing": ("bearish", 3, "Bearish Engulfing - Tín hiệu đảo chiều giảm mạnh"),
+    "Morning Star": ("bullish", 4, "Morning Star - Tín hiệu đảo chiều tăng rất mạnh"),
+    "Evening Star": ("bearish", 4, "Evening Star - Tín hiệu đảo chiều giảm rất mạnh"),
+    "Three White Soldiers": ("bullish", 4, "Three White Soldiers - Xu hướng tăng mạnh"),
+    "Three Black Crows": ("bearish", 4, "Three Black Crows - Xu hướng giảm mạnh"),
+}
+CANDLE_PATTERNS = list(CANDLE_PATTERNS_INFO)
+
+
+# ============ HỒI QUY TRƯỢT (ROLLING OLS) ============
+
+def rolling_regression(values, window: int) -> dict:
+    """Hồi quy tuyến tính trượt y = intercept + slope * x (x = 0..window-1 trong mỗi cửa sổ)
+    Tính O(n) bằng tổng tích lũy, không gọi polyfit cho từng cửa sổ
+    values: mảng 1 chiều (1 mã) hoặc 2 chiều (ngày x mã); cửa sổ có NaN cho kết quả NaN
+    Trả về dict "slope", "intercept", "resid_std" cùng kích thước values (cửa sổ kết thúc tại mỗi nến)"""
+    y = np.asarray(values, dtype=float)
+    n = y.shape[0]
+    w = window
+    out = {k: np.full(y.shape, np.nan) for k in ("slope", "intercept", "resid_std")}
+    if n < w:
+        return out
+
+    # Trừ trung bình để tổng tích lũy không bị mất độ chính xác (không ảnh hưởng độ dốc)
+    valid = ~np.isnan(y)
+    offset = np.nanmean(y, axis=0) if valid.any() else 0.0
+    offset = np.nan_to_num(offset)
+    yc = np.where(valid, y - offset, 0.0)
+    j = np.arange(n, dtype=float).reshape((n,) + (1,) * (y.ndim - 1))
+
+    def window_sum(a):
+        c = np.cumsum(a, axis=0)
+        c = np.concatenate([np.zeros((1,) + a.shape[1:]), c], axis=0)
+        return c[w:] - c[:-w]
+
+    sy = window_sum(yc)
+    sjy = window_sum(j * yc)
+    syy = window_sum(yc * yc)
+    count = window_sum(valid.astype(float))
+
+    # Với cửa sổ bắt đầu tại s: sum(x*y) = sum(j*y) - s*sum(y)
+    s = j[:n - w + 1]
+    sxy = sjy - s * sy
+    sx = w * (w - 1) / 2
+    sxx_c = w * (w * w - 1) / 12          # sum((x - x_tb)^2)
+    sxy_c = sxy - sx * sy / w
+    syy_c = syy - sy * sy / w
+
+    slope = sxy_c / sxx_c
+    intercept = sy / w - slope * (w - 1) / 2 + offset
+    ssr = np.maximum(syy_c - slope * sxy_c, 0.0)
+    resid_std = np.sqrt(ssr / max(w - 2, 1))
+
+    full = count == w
+    out["slope"][w - 1:] = np.where(full, slope, np.nan)
+    out["intercept"][w - 1:] = np.where(full, intercept, np.nan)
+    out["resid_std"][w - 1:] = np.where(full, resid_std, np.nan)
+    return out
+
+def classify_triangle(high_slope, low_slope, cutoff: float = 0.1):
+    """Phân loại tam giác theo độ dốc đỉnh/đáy (chạy được trên mảng)
+    cutoff: ngưỡng "đi ngang"/"dốc" (tam giác cân dùng cutoff/2), cùng đơn vị với độ dốc
+    Trả về mảng nhãn: "Ascending Triangle", "Descending Triangle", "Symmetrical Triangle" hoặc "" """
+    high_slope = np.asarray(high_slope, dtype=float)
+    low_slope = np.asarray(low_slope, dtype=float)
+    half = cutoff / 2
+    return np.select(
+        [(np.abs(high_slope) < cutoff) & (low_slope > cutoff),
+         (high_slope < -cutoff) & (np.abs(low_slope) < cutoff),
+         (high_slope < -half) & (low_slope > half)],
+        ["Ascending Triangle", "Descending Triangle", "Symmetrical Triangle"],
+        default=""
+    )
+
+# Tín hiệu của từng loại tam giác
+TRIANGLE_SIGNALS = {
+    "Ascending Triangle": "bullish",
+    "Descending Triangle": "bearish",
+    "Symmetrical Triangle": "neutral",
+}
+
+def classify_channel(avg_slope):
+    """Phân loại kênh xu hướng theo độ dốc trung bình (chạy được trên mảng)"""
+    avg_slope = np.asarray(avg_slope, dtype=float)
+    return np.select([avg_slope > 0.5, avg_slope < -0.5],
+                     ["Uptrend Channel", "Downtrend Channel"], default="Sideways Channel")
+
+def panel_rolling_fit(panel: dict, window: int = 30) -> dict:
+    """Hồi quy trượt cho đỉnh (High) và đáy (Low) của cả panel (ngày x mã)
+    Mỗi mã hồi quy trên chuỗi nến của chính nó (bỏ qua ngày không giao dịch)
+    Trả về dict tên cột -> DataFrame (vd "high_slope", "low_intercept", ...)"""
+    result = {}
+    for col in ["High", "Low"]:
+        frame = panel[col]
+        compact, rank, valid = data_store.compact_columns(frame)
+        fit = rolling_regression(compact, window)
+        for key, arr in fit.items():
+            result[f"{col.lower()}_{key}"] = data_store.expand_columns(arr, rank, valid, frame)
+    return result
+
+
+# ============ CHỈ MỤC ĐỈNH/ĐÁY ĐA TẦNG ============
+
+class PivotIndex:
+    """Chỉ mục đỉnh/đáy tính 1 lần cho mỗi mã, dùng chung cho mọi bộ nhận diện mẫu hình
+    - Đỉnh/đáy cục bộ (argrelextrema) theo nhiều bậc `order`
+    - Zigzag theo ngưỡng đảo chiều = hệ số x ATR
+    Khi dữ liệu thay đổi từ nến `start`, chỉ tính lại phần bị ảnh hưởng"""
+
+    def __init__(self, df: pd.DataFrame, orders=(3, 5), atr_mults=(1.5, 3.0), atr_period=14):
+        self.atr_period = atr_period
+        self.close = np.array([], dtype=float)
+        self.atr = np.array([], dtype=float)
+        self.extrema = {order: None for order in orders}   # order -> (peaks_idx, troughs_idx)
+        self.zigzags = {mult: None for mult in atr_mults}  # mult -> trạng thái zigzag
+        self.update(df)
+
+    def update(self, df: pd.DataFrame, start: int = 0) -> dict:
+        """Cập nhật chỉ mục với dữ liệu mới (thay đổi từ nến `start`)
+        Trả về {order: vị trí pivot đầu tiên có thể đã thay đổi}"""
+        close = df["Close"].values.astype(float)
+        start = max(0, min(start, len(self.close), len(close)))
+
+        # ATR (True Range trung bình) - chỉ tính lại từ start, cần thêm atr_period nến trước
+        lo = max(0, start - self.atr_period)
+        part = df.iloc[lo:]
+        prev_close = part["Close"].shift(1)
+        tr = pd.concat([part["High"] - part["Low"],
+                        (part["High"] - prev_close).abs(),
+                        (part["Low"] - prev_close).abs()], axis=1).max(axis=1)
+        if lo > 0:
+            tr.iloc[0] = max(part["High"].iloc[0], df["Close"].iloc[lo - 1]) - min(part["Low"].iloc[0], df["Close"].iloc[lo - 1])
+        atr = tr.rolling(self.atr_period).mean().values
+        self.atr = np.concatenate([self.atr[:start], atr[start - lo:]])
+        self.close = close
+
+        since = {order: self._update_extrema(order, start) for order in self.extrema}
+        for mult in self.zigzags:
+            self._update_zigzag(mult, start)
+        return since
+
+    def _update_extrema(self, order: int, start: int = 0) -> int:
+        """Tính lại đỉnh/đáy bậc `order` khi dữ liệu thay đổi từ nến `start`
+        Pivot tại i phụ thuộc các nến [i-order, i+order] nên chỉ pivot từ start-order trở đi
+        bị ảnh hưởng. Trả về vị trí đó (các pivot trước nó giữ nguyên)"""
+        close = self.close
+        since = max(0, start - order)
+        lo = max(0, since - order)
+
+        # Tìm đỉnh (local maxima) và đáy (local minima) trên đoạn cần tính lại
+        peaks_idx = argrelextrema(close[lo:], np.greater, order=order)[0] + lo
+        troughs_idx = argrelextrema(close[lo:], np.less, order=order)[0] + lo
+
+        old = self.extrema.get(order)
+        if since > 0 and old is not None:
+            old_peaks, old_troughs = old
+            peaks_idx = np.concatenate([old_peaks[old_peaks < since], peaks_idx[peaks_idx >= since]])
+            troughs_idx = np.concatenate([old_troughs[old_troughs < since], troughs_idx[troughs_idx >= since]])
+
+        self.extrema[order] = (peaks_idx, troughs_idx)
+        return since
+
+    def _update_zigzag(self, mult: float, start: int = 0):
+        """Zigzag: xác nhận đỉnh khi giá giảm từ đỉnh ứng viên >= mult x ATR (và ngược lại)
+        Tiếp tục từ lần xác nhận cuối cùng trước `start` nên chỉ duyệt lại phần mới"""
+        close, atr = self.close, self.atr
+        state = self.zigzags.get(mult)
+
+        # Mỗi lần xác nhận lưu (vị trí pivot, loại +1 đỉnh/-1 đáy, nến xác nhận)
+        if state is not None and start > 0:
+            confirmed = [c for c in state["confirmed"] if c[2] < start]
+        else:
+            confirmed = []
+
+        if confirmed:
+            # Sau khi xác nhận tại nến c: đổi chiều, ứng viên mới là chính nến c
+            _, kind, c = confirmed[-1]
+            direction, cand, i0 = -kind, c, c + 1
+        else:
+            # Chưa có hướng: theo dõi cả giá cao nhất và thấp nhất từ đầu
+            direction, cand, i0 = 0, 0, 1
+
+        hi = lo = cand
+        for i in range(i0, len(close)):
+            thr = mult * atr[i]
+            if direction == 0:
+                if close[i] > close[hi]:
+                    hi = i
+                if close[i] < close[lo]:
+                    lo = i
+                if close[hi] - close[i] >= thr and hi < i:
+                    confirmed.append((hi, 1, i))
+                    direction, cand = -1, i
+                elif close[i] - close[lo] >= thr and lo < i:
+                    confirmed.append((lo, -1, i))
+                    direction, cand = 1, i
+            elif direction == 1:
+                # Đang tăng: ứng viên đỉnh
+                if close[i] > close[cand]:
+                    cand = i
+                elif close[cand] - close[i] >= thr:
+                    confirmed.append((cand, 1, i))
+                    direction, cand = -1, i
+            else:
+                # Đang giảm: ứng viên đáy
+                if close[i] < close[cand]:
+                    cand = i
+                elif close[i] - close[cand] >= thr:
+                    confirmed.append((cand, -1, i))
+                    direction, cand = 1, i
+
+        self.zigzags[mult] = {"confirmed": confirmed, "direction": direction, "candidate": cand}
+
+    # ============ TRUY VẤN ============
+
+    def peaks_troughs(self, order: int = 5):
+        """Đỉnh và đáy bậc `order` (tính thêm nếu bậc này chưa có trong chỉ mục)"""
+        if self.extrema.get(order) is None:
+            self._update_extrema(order)
+        return self.extrema[order]
+
+    def zigzag(self, mult: float = 1.5, include_last: bool = False):
+        """Các pivot zigzag (chỉ số, loại +1 đỉnh/-1 đáy) xen kẽ nhau
+        include_last: thêm điểm cực trị chưa được xác nhận ở cuối chuỗi"""
+        if self.zigzags.get(mult) is None:
+            self._update_zigzag(mult)
+        state = self.zigzags[mult]
+        pivots = [(p, k) for p, k, _ in state["confirmed"]]
+        if include_last and state["direction"] != 0:
+            pivots.append((state["candidate"], state["direction"]))
+        idx = np.array([p for p, _ in pivots], dtype=int)
+        kinds = np.array([k for _, k in pivots], dtype=int)
+        return idx, kinds
+
+    def in_range(self, order: int, lo: int, hi: int = None):
+        """Đỉnh và đáy bậc `order` nằm trong đoạn nến [lo, hi)"""
+        peaks_idx, troughs_idx = self.peaks_troughs(order)
+        hi = len(self.close) if hi is None else hi
+        return (peaks_idx[(peaks_idx >= lo) & (peaks_idx < hi)],
+                troughs_idx[(troughs_idx >= lo) & (troughs_idx < hi)])
+
 
 class PatternRecognition:
     """Lớp nhận diện các mẫu hình kỹ thuật"""
-    
-    def __init__(self, df: pd.DataFrame):
+
+    # Số nến nhìn lại của mẫu nến: 2 nến trước (mẫu 3 nến) + cửa sổ TB thân nến
+    CANDLE_LOOKBACK = 2
+    AVG_BODY_WINDOW = 20
+
+    # Các mẫu hình giá dựa trên đỉnh/đáy (bậc 5), được lưu và cập nhật tăng dần
+    CHART_DETECTORS = ["double_top", "double_bottom", "head_shoulders", "inverse_head_shoulders"]
+    CHART_ORDER = 5
+
+    def __init__(self, df: pd.DataFrame, version: str = None, timeframe: str = "D"):
         self.df = df.copy()
         self.patterns_found = []
+        self.version = version
+        self.timeframe = timeframe  # D/W/M: mỗi nến là 1 phiên/tuần/tháng
+
+        # Trạng thái tăng dần
+        self.last_index = 0      # Số nến đã xử lý
+        self.candle_hits = []    # Mẫu nến đã phát hiện
+        self.pivot_index = None  # Chỉ mục đỉnh/đáy dùng chung cho các mẫu hình giá
+        self.fits = {}           # window -> hồi quy trượt của High/Low
+        self.chart_hits = {name: [] for name in self.CHART_DETECTORS}
+
+    # ============ CẬP NHẬT TĂNG DẦN ============
+
+    def update(self, df: pd.DataFrame) -> int:
+        """Nạp dữ liệu mới, chỉ đánh giá lại từ nến đầu tiên bị thay đổi/thêm mới
+        Trả về vị trí nến bắt đầu tính lại"""
+        start = min(self._first_changed_bar(df), self.last_index)
+        self.df = df.copy()
+        self._refresh(start)
+        return start
+
+    def _first_changed_bar(self, df: pd.DataFrame) -> int:
+        """Vị trí nến đầu tiên khác nhau giữa dữ liệu cũ và mới (0 nếu lịch sử bị thay đổi)"""
+        return data_store.first_changed_row(self.df, df)
+
+    def _date_at(self, i: int):
+        """Ngày của nến thứ i (None nếu vượt quá dữ liệu)"""
+        return self.df.index[i].strftime("%Y-%m-%d") if i < len(self.df) else None
+
+    def _drop_from(self, hits: list, i: int) -> list:
+        """Bỏ các kết quả từ nến thứ i trở đi
+        i >= số nến (dữ liệu bị cắt bớt ở cuối): bỏ kết quả sau nến cuối còn lại"""
+        cutoff = self._date_at(i)
+        if cutoff is not None:
+            return [p for p in hits if p["date"] < cutoff]
+        if len(self.df) == 0:
+            return []
+        last = self.df.index[-1].strftime("%Y-%m-%d")
+        return [p for p in hits if p["date"] <= last]
+
+    def _refresh(self, start: int):
+        """Tính lại mẫu nến, đỉnh/đáy và mẫu hình giá cho các nến từ vị trí `start`"""
+        if start <= 0:
+            start = 0
+            self.candle_hits = []
+            self.pivot_index = None
+            self.chart_hits = {name: [] for name in self.CHART_DETECTORS}
+
+        # Mẫu nến: bỏ kết quả từ `start`, đánh giá lại các nến mới
+        self.candle_hits = self._drop_from(self.candle_hits, start)
+        self.candle_hits.extend(self.detect_candle_patterns(start=start))
+
+        # Đỉnh/đáy: cập nhật chỉ mục cho mọi bậc đã tính
+        if self.pivot_index is None:
+            self.pivot_index = PivotIndex(self.df)
+            since = {order: 0 for order in self.pivot_index.extrema}
+        else:
+            since = self.pivot_index.update(self.df, start)
+        self.fits = {}
+
+        # Mẫu hình giá: chỉ xét lại các nhóm đỉnh/đáy kết thúc sau pivot cuối còn ổn định
+        t = since[self.CHART_ORDER]
+        for name in self.CHART_DETECTORS:
+            kept = self._drop_from(self.chart_hits[name], t)
+            detector = getattr(self, f"detect_{name}")
+            self.chart_hits[name] = kept + detector(since=t)
+
+        self.last_index = len(self.df)
+
+    def _sync(self):
+        """Đảm bảo trạng thái đã xử lý hết dữ liệu hiện tại"""
+        if self.last_index != len(self.df):
+            self._refresh(self.last_index)
+
+    def pattern_history(self) -> list:
+        """Toàn bộ mẫu hình phát hiện được trong lịch sử (dùng cho thống kê sự kiện)
+        Gồm mẫu nến, mẫu hình giá theo đỉnh/đáy và ngày bắt đầu hình thành tam giác
+        "lag": số nến sau ngày mẫu hình mới xác nhận được (pivot bậc n cần n nến phía sau)"""
+        self._sync()
+        events = [{**p, "lag": 0} for p in self.candle_hits]
+        for name in self.CHART_DETECTORS:
+            events.extend({**p, "lag": self.CHART_ORDER} for p in self.chart_hits[name])
         
+        triangles = self.triangle_history()
+        first_day = (triangles != "") & (triangles != triangles.shift(1))
+        for date, name in triangles[first_day].items():
+            events.append({"date": date.strftime("%Y-%m-%d"), "pattern": name,
+                           "type": "chart", "signal": TRIANGLE_SIGNALS[name], "lag": 0})
+        return events
+
     # ============ MẪU NẾN (CANDLESTICK PATTERNS) ============
     
-    def detect_candle_patterns(self) -> list:
-        """Nhận diện tất cả mẫu nến"""
-        patterns = []
-        df = self.df
+    def detect_candle_patterns(self, start: int = 2) -> list:
+        """Nhận diện tất cả mẫu nến (từ nến thứ `start` trở đi)
+        Mỗi quy tắc được tính thành mặt nạ trên cả đoạn, kết quả sắp theo ngày rồi theo thứ tự quy tắc"""
+        start = max(start, 2)
+
+        # Chỉ tính thông số nến cho đoạn cần đánh giá + đoạn nhìn lại
+        lo = max(0, start - self.CANDLE_LOOKBACK - self.AVG_BODY_WINDOW)
+        df = self.df.iloc[lo:].copy()
         
         # Tính các thông số nến
         df["body"] = df["Close"] - df["Open"]
@@ -28,139 +389,95 @@ class PatternRecognition:
         df["upper_shadow"] = df["High"] - df[["Open", "Close"]].max(axis=1)
         df["lower_shadow"] = df[["Open", "Close"]].min(axis=1) - df["Low"]
         df["range"] = df["High"] - df["Low"]
-        avg_body = df["body_abs"].rolling(20).mean()
+        avg_body = df["body_abs"].rolling(self.AVG_BODY_WINDOW).mean()
+        avg = avg_body.fillna(df["body_abs"])
         
-        for i in range(2, len(df)):
-            date = df.index[i].strftime("%Y-%m-%d")
-            curr = df.iloc[i]
-            prev = df.iloc[i-1]
-            prev2 = df.iloc[i-2]
-            avg = avg_body.iloc[i] if not pd.isna(avg_body.iloc[i]) else curr["body_abs"]
-
+        body, body_abs = df["body"], df["body_abs"]
+        upper, lower, rng = df["upper_shadow"], df["lower_shadow"], df["range"]
+        prev_body, prev2_body = body.shift(1), body.shift(2)
+        prev_close, prev2_close = df["Close"].shift(1), df["Close"].shift(2)
+        prev_open, prev2_open = df["Open"].shift(1), df["Open"].shift(2)
+        
+        masks = {
             # 1. DOJI - Thân nến rất nhỏ
-            if curr["body_abs"] < curr["range"] * 0.1 and curr["range"] > 0:
-                patterns.append({
-                    "date": date, "pattern": "Doji", "type": "candle",
-                    "signal": "neutral", "strength": 1,
-                    "description": "Doji - Thị trường do dự, có thể đảo chiều"
-                })
+            "Doji": (body_abs < rng * 0.1) & (rng > 0),
             
             # 2. HAMMER - Búa (tín hiệu đáy)
-            if (curr["lower_shadow"] > curr["body_abs"] * 2 and 
-                curr["upper_shadow"] < curr["body_abs"] * 0.5 and
-                curr["body_abs"] > 0):
-                patterns.append({
-                    "date": date, "pattern": "Hammer", "type": "candle",
-                    "signal": "bullish", "strength": 2,
-                    "description": "Hammer - Tín hiệu đảo chiều tăng ở đáy"
-                })
+            "Hammer": (lower > body_abs * 2) & (upper < body_abs * 0.5) & (body_abs > 0),
             
             # 3. INVERTED HAMMER - Búa ngược
-            if (curr["upper_shadow"] > curr["body_abs"] * 2 and
-                curr["lower_shadow"] < curr["body_abs"] * 0.5 and
-                curr["body_abs"] > 0):
-                patterns.append({
-                    "date": date, "pattern": "Inverted Hammer", "type": "candle",
-                    "signal": "bullish", "strength": 2,
-                    "description": "Inverted Hammer - Có thể đảo chiều tăng"
-                })
+            "Inverted Hammer": (upper > body_abs * 2) & (lower < body_abs * 0.5) & (body_abs > 0),
             
             # 4. SHOOTING STAR - Sao băng (tín hiệu đỉnh)
-            if (curr["upper_shadow"] > curr["body_abs"] * 2 and
-                curr["lower_shadow"] < curr["body_abs"] * 0.3 and
-                curr["body"] < 0):
-                patterns.append({
-                    "date": date, "pattern": "Shooting Star", "type": "candle",
-                    "signal": "bearish", "strength": 2,
-                    "description": "Shooting Star - Tín hiệu đảo chiều giảm ở đỉnh"
-                })
+            "Shooting Star": (upper > body_abs * 2) & (lower < body_abs * 0.3) & (body < 0),
             
             # 5. BULLISH ENGULFING - Nến tăng nuốt
-            if (curr["body"] > 0 and prev["body"] < 0 and
-                curr["Open"] < prev["Close"] and curr["Close"] > prev["Open"]):
-                patterns.append({
-                    "date": date, "pattern": "Bullish Engulfing", "type": "candle",
-                    "signal": "bullish", "strength": 3,
-                    "description": "Bullish Engulfing - Tín hiệu đảo chiều tăng mạnh"
-                })
-
+            "Bullish Engulfing": (body > 0) & (prev_body < 0) & (df["Open"] < prev_close) & (df["Close"] > prev_open),
+            
             # 6. BEARISH ENGULFING - Nến giảm nuốt
-            if (curr["body"] < 0 and prev["body"] > 0 and
-                curr["Open"] > prev["Close"] and curr["Close"] < prev["Open"]):
-                patterns.append({
-                    "date": date, "pattern": "Bearish Engulfing", "type": "candle",
-                    "signal": "bearish", "strength": 3,
-                    "description": "Bearish Engulfing - Tín hiệu đảo chiều giảm mạnh"
-                })
+            "Bearish Engulfing": (body < 0) & (prev_body > 0) & (df["Open"] > prev_close) & (df["Close"] < prev_open),
             
             # 7. MORNING STAR - Sao mai (3 nến)
-            if (prev2["body"] < 0 and abs(prev2["body"]) > avg and
-                prev["body_abs"] < avg * 0.5 and
-                curr["body"] > 0 and
-                curr["Close"] > (prev2["Open"] + prev2["Close"]) / 2):
-                patterns.append({
-                    "date": date, "pattern": "Morning Star", "type": "candle",
-                    "signal": "bullish", "strength": 4,
-                    "description": "Morning Star - Tín hiệu đảo chiều tăng rất mạnh"
-                })
+            "Morning Star": ((prev2_body < 0) & (prev2_body.abs() > avg) &
+                             (body_abs.shift(1) < avg * 0.5) & (body > 0) &
+                             (df["Close"] > (prev2_open + prev2_close) / 2)),
             
             # 8. EVENING STAR - Sao hôm (3 nến)
-            if (prev2["body"] > 0 and prev2["body"] > avg and
-                prev["body_abs"] < avg * 0.5 and
-                curr["body"] < 0 and
-                curr["Close"] < (prev2["Open"] + prev2["Close"]) / 2):
-                patterns.append({
-                    "date": date, "pattern": "Evening Star", "type": "candle",
-                    "signal": "bearish", "strength": 4,
-                    "description": "Evening Star - Tín hiệu đảo chiều giảm rất mạnh"
-                })
+            "Evening Star": ((prev2_body > 0) & (prev2_body > avg) &
+                             (body_abs.shift(1) < avg * 0.5) & (body < 0) &
+                             (df["Close"] < (prev2_open + prev2_close) / 2)),
             
             # 9. THREE WHITE SOLDIERS - 3 lính trắng
-            if (i >= 3 and
-                df.iloc[i-2]["body"] > 0 and df.iloc[i-1]["body"] > 0 and curr["body"] > 0 and
-                df.iloc[i-1]["Close"] > df.iloc[i-2]["Close"] and
-                curr["Close"] > df.iloc[i-1]["Close"]):
-                patterns.append({
-                    "date": date, "pattern": "Three White Soldiers", "type": "candle",
-                    "signal": "bullish", "strength": 4,
-                    "description": "Three White Soldiers - Xu hướng tăng mạnh"
-                })
+            "Three White Soldiers": ((prev2_body > 0) & (prev_body > 0) & (body > 0) &
+                                     (prev_close > prev2_close) & (df["Close"] > prev_close)),
             
             # 10. THREE BLACK CROWS - 3 con quạ đen
-            if (i >= 3 and
-                df.iloc[i-2]["body"] < 0 and df.iloc[i-1]["body"] < 0 and curr["body"] < 0 and
-                df.iloc[i-1]["Close"] < df.iloc[i-2]["Close"] and
-                curr["Close"] < df.iloc[i-1]["Close"]):
-                patterns.append({
-                    "date": date, "pattern": "Three Black Crows", "type": "candle",
-                    "signal": "bearish", "strength": 4,
-                    "description": "Three Black Crows - Xu hướng giảm mạnh"
-                })
+            "Three Black Crows": ((prev2_body < 0) & (prev_body < 0) & (body < 0) &
+                                  (prev_close < prev2_close) & (df["Close"] < prev_close)),
+        }
+        
+        hits = np.column_stack([masks[name].values for name in CANDLE_PATTERNS])
+        hits[:start - lo] = False
+        
+        # 3 lính trắng / 3 con quạ đen chỉ xét từ nến thứ 3 trở đi
+        soldiers = [CANDLE_PATTERNS.index("Three White Soldiers"), CANDLE_PATTERNS.index("Three Black Crows")]
+        hits[:max(0, 3 - lo), soldiers] = False
+        
+        dates = df.index.strftime("%Y-%m-%d")
+        patterns = []
+        for i, k in zip(*np.nonzero(hits)):
+            name = CANDLE_PATTERNS[k]
+            signal, strength, description = CANDLE_PATTERNS_INFO[name]
+            patterns.append({
+                "date": dates[i], "pattern": name, "type": "candle",
+                "signal": signal, "strength": strength,
+                "description": description
+            })
         
         return patterns
 
     # ============ MẪU HÌNH GIÁ (CHART PATTERNS) ============
     
+    def get_pivot_index(self) -> PivotIndex:
+        """Chỉ mục đỉnh/đáy của dữ liệu hiện tại (tạo 1 lần, cập nhật tăng dần)"""
+        if self.pivot_index is None:
+            self.pivot_index = PivotIndex(self.df)
+        return self.pivot_index
+
     def find_peaks_troughs(self, order=5):
-        """Tìm đỉnh và đáy"""
-        close = self.df["Close"].values
-        
-        # Tìm đỉnh (local maxima)
-        peaks_idx = argrelextrema(close, np.greater, order=order)[0]
-        
-        # Tìm đáy (local minima)
-        troughs_idx = argrelextrema(close, np.less, order=order)[0]
-        
-        return peaks_idx, troughs_idx
+        """Tìm đỉnh và đáy (truy vấn từ chỉ mục dùng chung)"""
+        return self.get_pivot_index().peaks_troughs(order)
     
-    def detect_double_top(self, tolerance=0.03) -> list:
-        """Nhận diện Double Top - Hai đỉnh"""
+    def detect_double_top(self, tolerance=0.03, since=0) -> list:
+        """Nhận diện Double Top - Hai đỉnh (chỉ xét đỉnh thứ 2 từ nến `since`)"""
         patterns = []
         peaks_idx, _ = self.find_peaks_troughs()
         close = self.df["Close"].values
         
         for i in range(len(peaks_idx) - 1):
             idx1, idx2 = peaks_idx[i], peaks_idx[i+1]
+            if idx2 < since:
+                continue
             
             # Khoảng cách giữa 2 đỉnh: 10-50 nến
             if not (10 <= idx2 - idx1 <= 50):
@@ -185,14 +502,16 @@ class PatternRecognition:
         
         return patterns
     
-    def detect_double_bottom(self, tolerance=0.03) -> list:
-        """Nhận diện Double Bottom - Hai đáy"""
+    def detect_double_bottom(self, tolerance=0.03, since=0) -> list:
+        """Nhận diện Double Bottom - Hai đáy (chỉ xét đáy thứ 2 từ nến `since`)"""
         patterns = []
         _, troughs_idx = self.find_peaks_troughs()
         close = self.df["Close"].values
         
         for i in range(len(troughs_idx) - 1):
             idx1, idx2 = troughs_idx[i], troughs_idx[i+1]
+            if idx2 < since:
+                continue
             
             if not (10 <= idx2 - idx1 <= 50):
                 continue
@@ -213,8 +532,8 @@ class PatternRecognition:
         
         return patterns
 
-    def detect_head_shoulders(self, tolerance=0.03) -> list:
-        """Nhận diện Head and Shoulders - Đầu và vai"""
+    def detect_head_shoulders(self, tolerance=0.03, since=0) -> list:
+        """Nhận diện Head and Shoulders - Đầu và vai (chỉ xét vai phải từ nến `since`)"""
         patterns = []
         peaks_idx, troughs_idx = self.find_peaks_troughs()
         close = self.df["Close"].values
@@ -227,6 +546,8 @@ class PatternRecognition:
             left_shoulder_idx = peaks_idx[i]
             head_idx = peaks_idx[i+1]
             right_shoulder_idx = peaks_idx[i+2]
+            if right_shoulder_idx < since:
+                continue
             
             left_shoulder = close[left_shoulder_idx]
             head = close[head_idx]
@@ -257,8 +578,8 @@ class PatternRecognition:
         
         return patterns
     
-    def detect_inverse_head_shoulders(self, tolerance=0.03) -> list:
-        """Nhận diện Inverse Head and Shoulders"""
+    def detect_inverse_head_shoulders(self, tolerance=0.03, since=0) -> list:
+        """Nhận diện Inverse Head and Shoulders (chỉ xét vai phải từ nến `since`)"""
         patterns = []
         _, troughs_idx = self.find_peaks_troughs()
         close = self.df["Close"].values
@@ -270,6 +591,8 @@ class PatternRecognition:
             left_idx = troughs_idx[i]
             head_idx = troughs_idx[i+1]
             right_idx = troughs_idx[i+2]
+            if right_idx < since:
+                continue
             
             left = close[left_idx]
             head = close[head_idx]
@@ -298,30 +621,57 @@ class PatternRecognition:
         
         return patterns
 
+    def rolling_fit(self, window=30) -> pd.DataFrame:
+        """Hồi quy trượt của High và Low cho toàn bộ lịch sử (mỗi nến là cuối 1 cửa sổ)"""
+        if window not in self.fits:
+            fit = {}
+            for col in ["High", "Low"]:
+                for key, arr in rolling_regression(self.df[col].values, window).items():
+                    fit[f"{col.lower()}_{key}"] = arr
+            self.fits[window] = pd.DataFrame(fit, index=self.df.index)
+        return self.fits[window]
+    
+    def triangle_history(self, window=30) -> pd.Series:
+        """Loại tam giác tại mỗi nến (chuỗi rỗng nếu không có)"""
+        fit = self.rolling_fit(window)
+        return pd.Series(classify_triangle(fit["high_slope"], fit["low_slope"]), index=fit.index)
+    
+    def channel_history(self, window=30) -> pd.DataFrame:
+        """Kênh xu hướng tại mỗi nến và tín hiệu breakout khỏi kênh của nến trước"""
+        fit = self.rolling_fit(window)
+        upper = fit["high_intercept"] + fit["high_slope"] * (window - 1)
+        lower = fit["low_intercept"] + fit["low_slope"] * (window - 1)
+        avg_slope = (fit["high_slope"] + fit["low_slope"]) / 2
+        
+        # Breakout: giá đóng cửa vượt đường kênh của cửa sổ trước, kéo dài thêm 1 nến
+        next_upper = (upper + fit["high_slope"]).shift(1)
+        next_lower = (lower + fit["low_slope"]).shift(1)
+        close = self.df["Close"]
+        
+        return pd.DataFrame({
+            "type": classify_channel(avg_slope),
+            "upper_bound": upper,
+            "lower_bound": lower,
+            "slope": avg_slope,
+            "breakout_up": close > next_upper,
+            "breakout_down": close < next_lower
+        }, index=fit.index)
+    
     def detect_triangle(self, window=30) -> list:
         """Nhận diện các mẫu tam giác"""
         patterns = []
-        df = self.df.tail(window)
         
-        if len(df) < window:
+        if len(self.df) < window:
             return patterns
         
-        highs = df["High"].values
-        lows = df["Low"].values
-        
-        # Tính xu hướng của đỉnh và đáy
-        x = np.arange(len(highs))
-        
-        # Linear regression cho highs
-        high_slope = np.polyfit(x, highs, 1)[0]
+        # Độ dốc hồi quy của highs và lows trong cửa sổ gần nhất
+        fit = self.rolling_fit(window).iloc[-1]
+        pattern = str(classify_triangle(fit["high_slope"], fit["low_slope"]))
         
-        # Linear regression cho lows
-        low_slope = np.polyfit(x, lows, 1)[0]
-        
-        date = df.index[-1].strftime("%Y-%m-%d")
+        date = self.df.index[-1].strftime("%Y-%m-%d")
         
         # Ascending Triangle - Đỉnh ngang, đáy tăng
-        if abs(high_slope) < 0.1 and low_slope > 0.1:
+        if pattern == "Ascending Triangle":
             patterns.append({
                 "date": date, "pattern": "Ascending Triangle", "type": "chart",
                 "signal": "bullish", "strength": 3,
@@ -329,7 +679,7 @@ class PatternRecognition:
             })
         
         # Descending Triangle - Đỉnh giảm, đáy ngang
-        elif high_slope < -0.1 and abs(low_slope) < 0.1:
+        elif pattern == "Descending Triangle":
             patterns.append({
                 "date": date, "pattern": "Descending Triangle", "type": "chart",
                 "signal": "bearish", "strength": 3,
@@ -337,7 +687,7 @@ class PatternRecognition:
             })
         
         # Symmetrical Triangle - Đỉnh giảm, đáy tăng
-        elif high_slope < -0.05 and low_slope > 0.05:
+        elif pattern == "Symmetrical Triangle":
             patterns.append({
                 "date": date, "pattern": "Symmetrical Triangle", "type": "chart",
                 "signal": "neutral", "strength": 2,
@@ -346,12 +696,131 @@ class PatternRecognition:
         
         return patterns
     
+    def detect_wedge(self, window=40, order=3) -> list:
+        """Nhận diện Rising/Falling Wedge - Nêm tăng/giảm (đỉnh và đáy cùng hướng, hội tụ)"""
+        patterns = []
+        n = len(self.df)
+        if n < window:
+            return patterns
+        
+        peaks_idx, troughs_idx = self.get_pivot_index().in_range(order, n - window)
+        if len(peaks_idx) < 2 or len(troughs_idx) < 2:
+            return patterns
+        
+        close = self.df["Close"].values
+        price = close[-1]
+        
+        # Độ dốc (%/nến) của đường nối các đỉnh và đường nối các đáy
+        high_slope = np.polyfit(peaks_idx, close[peaks_idx], 1)[0] / price * 100
+        low_slope = np.polyfit(troughs_idx, close[troughs_idx], 1)[0] / price * 100
+        
+        date = self.df.index[-1].strftime("%Y-%m-%d")
+        
+        # Rising Wedge - Cả 2 đường đi lên, đáy tăng nhanh hơn đỉnh
+        if high_slope > 0.05 and low_slope > high_slope:
+            patterns.append({
+                "date": date, "pattern": "Rising Wedge", "type": "chart",
+                "signal": "bearish", "strength": 3,
+                "description": "Rising Wedge - Nêm tăng, động lượng yếu dần, dễ đảo chiều giảm"
+            })
+        
+        # Falling Wedge - Cả 2 đường đi xuống, đỉnh giảm nhanh hơn đáy
+        elif low_slope < -0.05 and high_slope < low_slope:
+            patterns.append({
+                "date": date, "pattern": "Falling Wedge", "type": "chart",
+                "signal": "bullish", "strength": 3,
+                "description": "Falling Wedge - Nêm giảm, lực bán yếu dần, dễ đảo chiều tăng"
+            })
+        
+        return patterns
+    
+    def detect_flag(self, atr_mult=1.5, min_pole=0.08, max_pole_bars=15, max_flag_bars=20) -> list:
+        """Nhận diện Bull/Bear Flag - Cột cờ mạnh rồi tích lũy ngắn hồi lại <= 50%"""
+        patterns = []
+        idx, kinds = self.get_pivot_index().zigzag(atr_mult, include_last=True)
+        close = self.df["Close"].values
+        n = len(close)
+        
+        # Cột cờ kết thúc tại pivot cuối (cờ đang hình thành) hoặc pivot kế cuối
+        for j in (len(idx) - 1, len(idx) - 2):
+            if j < 1:
+                continue
+            a, b = idx[j-1], idx[j]
+            flag = close[b+1:]
+            if b - a > max_pole_bars or not (3 <= len(flag) <= max_flag_bars):
+                continue
+            
+            pole = (close[b] - close[a]) / close[a]
+            date = self.df.index[-1].strftime("%Y-%m-%d")
+            
+            if kinds[j] == 1 and pole >= min_pole and (close[b] - flag.min()) <= 0.5 * (close[b] - close[a]):
+                patterns.append({
+                    "date": date, "pattern": "Bull Flag", "type": "chart",
+                    "signal": "bullish", "strength": 3,
+                    "description": f"Bull Flag - Cột cờ +{pole*100:.0f}%, đang tích lũy {len(flag)} phiên",
+                    "price_levels": {"pole_start": close[a], "pole_top": close[b]}
+                })
+                break
+            
+            if kinds[j] == -1 and pole <= -min_pole and (flag.max() - close[b]) <= 0.5 * (close[a] - close[b]):
+                patterns.append({
+                    "date": date, "pattern": "Bear Flag", "type": "chart",
+                    "signal": "bearish", "strength": 3,
+                    "description": f"Bear Flag - Cột cờ {pole*100:.0f}%, đang hồi {len(flag)} phiên",
+                    "price_levels": {"pole_start": close[a], "pole_bottom": close[b]}
+                })
+                break
+        
+        return patterns
+    
+    def detect_cup_handle(self, atr_mult=3.0, tolerance=0.05) -> list:
+        """Nhận diện Cup and Handle - Cốc và tay cầm"""
+        patterns = []
+        idx, kinds = self.get_pivot_index().zigzag(atr_mult, include_last=True)
+        close = self.df["Close"].values
+        
+        # Chuỗi pivot cuối: vành trái (đỉnh) - đáy cốc - vành phải (đỉnh), sau đó là tay cầm
+        j = len(idx) - 1 if len(idx) and kinds[-1] == 1 else len(idx) - 2
+        if j < 2 or kinds[j] != 1:
+            return patterns
+        
+        left, bottom, right = idx[j-2], idx[j-1], idx[j]
+        rim = close[left]
+        depth = (rim - close[bottom]) / rim
+        cup_len = right - left
+        handle = close[right+1:]
+        
+        if not (30 <= cup_len <= 150 and 0.12 <= depth <= 0.40):
+            return patterns
+        
+        # 2 vành gần bằng nhau, đáy cốc nằm khoảng giữa
+        if abs(close[right] - rim) / rim > tolerance or not (0.25 <= (bottom - left) / cup_len <= 0.75):
+            return patterns
+        
+        # Tay cầm: 3 phiên trở lên, hồi không quá nửa độ sâu cốc
+        if not (3 <= len(handle) <= cup_len // 2):
+            return patterns
+        if handle.min() < close[bottom] + 0.5 * (rim - close[bottom]):
+            return patterns
+        
+        date = self.df.index[-1].strftime("%Y-%m-%d")
+        patterns.append({
+            "date": date, "pattern": "Cup and Handle", "type": "chart",
+            "signal": "bullish", "strength": 4,
+            "description": f"Cup and Handle - Cốc sâu {depth*100:.0f}% trong {cup_len} phiên, vành tại {rim:.0f}",
+            "price_levels": {"left_rim": rim, "bottom": close[bottom],
+                            "right_rim": close[right], "handle_low": handle.min()}
+        })
+        
+        return patterns
+    
     def detect_support_resistance(self, window=60, num_levels=3) -> dict:
         """Tìm các mức hỗ trợ và kháng cự"""
         df = self.df.tail(window)
         
-        peaks_idx, troughs_idx = self.find_peaks_troughs(order=3)
-        close = df["Close"].values
+        # Chỉ lấy đỉnh/đáy nằm trong cửa sổ gần nhất
+        peaks_idx, troughs_idx = self.get_pivot_index().in_range(3, len(self.df) - len(df))
+        close = self.df["Close"].values
         
         # Lấy giá tại các đỉnh và đáy
         peak_prices = close[peaks_idx] if len(peaks_idx) > 0 else []
@@ -389,47 +858,33 @@ class PatternRecognition:
 
     def detect_trend_channel(self, window=30) -> dict:
         """Nhận diện kênh xu hướng"""
-        df = self.df.tail(window)
-        
-        highs = df["High"].values
-        lows = df["Low"].values
-        x = np.arange(len(highs))
-        
-        # Linear regression
-        high_coef = np.polyfit(x, highs, 1)
-        low_coef = np.polyfit(x, lows, 1)
+        window = min(window, len(self.df))
         
-        high_slope = high_coef[0]
-        low_slope = low_coef[0]
+        # Đường hồi quy của highs/lows tại nến cuối cùng
+        fit = self.rolling_fit(window).iloc[-1]
+        high_slope = fit["high_slope"]
+        low_slope = fit["low_slope"]
         
         # Xác định loại kênh
         avg_slope = (high_slope + low_slope) / 2
-        
-        if avg_slope > 0.5:
-            channel_type = "Uptrend Channel"
-            signal = "bullish"
-        elif avg_slope < -0.5:
-            channel_type = "Downtrend Channel"
-            signal = "bearish"
-        else:
-            channel_type = "Sideways Channel"
-            signal = "neutral"
+        channel_type = str(classify_channel(avg_slope))
+        signal = {"Uptrend Channel": "bullish", "Downtrend Channel": "bearish"}.get(channel_type, "neutral")
         
         # Tính đường kênh
-        upper_line = high_coef[0] * x + high_coef[1]
-        lower_line = low_coef[0] * x + low_coef[1]
+        upper = fit["high_intercept"] + high_slope * (window - 1)
+        lower = fit["low_intercept"] + low_slope * (window - 1)
         
-        current_price = df["Close"].iloc[-1]
-        channel_width = (upper_line[-1] - lower_line[-1]) / lower_line[-1] * 100
+        current_price = self.df["Close"].iloc[-1]
+        channel_width = (upper - lower) / lower * 100
         
         # Vị trí trong kênh
-        position = (current_price - lower_line[-1]) / (upper_line[-1] - lower_line[-1])
+        position = (current_price - lower) / (upper - lower)
         
         return {
             "type": channel_type,
             "signal": signal,
-            "upper_bound": upper_line[-1],
-            "lower_bound": lower_line[-1],
+            "upper_bound": upper,
+            "lower_bound": lower,
             "channel_width_pct": channel_width,
             "position_in_channel": position,  # 0 = đáy kênh, 1 = đỉnh kênh
             "slope": avg_slope
@@ -445,17 +900,21 @@ class PatternRecognition:
             "summary": {}
         }
         
+        # Xử lý các nến chưa đánh giá
+        self._sync()
+        
         # Mẫu nến (chỉ lấy 10 ngày gần nhất)
-        candle_patterns = self.detect_candle_patterns()
+        candle_patterns = self.candle_hits
         results["candle_patterns"] = candle_patterns[-10:] if candle_patterns else []
         
         # Mẫu hình giá
         chart_patterns = []
-        chart_patterns.extend(self.detect_double_top())
-        chart_patterns.extend(self.detect_double_bottom())
-        chart_patterns.extend(self.detect_head_shoulders())
-        chart_patterns.extend(self.detect_inverse_head_shoulders())
+        for name in self.CHART_DETECTORS:
+            chart_patterns.extend(self.chart_hits[name])
         chart_patterns.extend(self.detect_triangle())
+        chart_patterns.extend(self.detect_wedge())
+        chart_patterns.extend(self.detect_flag())
+        chart_patterns.extend(self.detect_cup_handle())
         results["chart_patterns"] = chart_patterns
         
         # Hỗ trợ/Kháng cự
@@ -491,47 +950,163 @@ class PatternRecognition:
         return results
 
 
-# ============ HELPER FUNCTIONS ============
+# ============ TRẠNG THÁI THEO MÃ ============
 
-def load_data(csv_path: str) -> pd.DataFrame:
-    """Đọc CSV"""
-    try:
-        df = pd.read_csv(csv_path, header=[0, 1], index_col=0)
-        df.columns = [col[0] for col in df.columns]
-    except:
-        df = pd.read_csv(csv_path, index_col=0)
-    
-    df = df.reset_index()
-    df.columns.values[0] = "Date"
+# (symbol, timeframe) -> {"pr": PatternRecognition, "lock": Lock, "results": kết quả theo phiên bản}
+_pattern_states = {}
+_states_lock = threading.Lock()
+
+def get_pattern_state(symbol: str, timeframe: str = "D") -> dict:
+    """Lấy trạng thái nhận diện của 1 mã theo khung thời gian (D/W/M)
+    Nến tuần/tháng lấy từ cache gộp nến của data_store; chỉ xử lý thêm nến mới khi dữ liệu đổi phiên bản"""
+    df, version = data_store.load_timeframe(symbol, timeframe)
+    if df is None:
+        return None
     
-    if df["Date"].dtype == object:
-        df = df[df["Date"].str.match(r"^\d{4}-\d{2}-\d{2}", na=False)].copy()
+    with _states_lock:
+        state = _pattern_states.get((symbol, timeframe))
+        if state is None:
+            state = {"pr": PatternRecognition(df, version, timeframe), "lock": threading.Lock(), "results": None}
+            _pattern_states[(symbol, timeframe)] = state
     
-    df["Date"] = pd.to_datetime(df["Date"])
-    for col in ["Open", "High", "Low", "Close", "Volume"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+    with state["lock"]:
+        pr = state["pr"]
+        if pr.version != version:
+            pr.update(df)
+            pr.version = version
+            state["results"] = None
     
-    df = df.set_index("Date").dropna()
-    return df
+    return state
 
-def analyze_patterns(symbol: str) -> dict:
-    """Phân tích mẫu hình cho 1 mã"""
-    csv_path = f"data/{symbol}.csv"
+def analyze_patterns(symbol: str, timeframe: str = "D") -> dict:
+    """Phân tích mẫu hình cho 1 mã theo khung thời gian (dùng lại kết quả nếu dữ liệu chưa đổi)"""
+    state = get_pattern_state(symbol, timeframe)
     
-    if not os.path.exists(csv_path):
+    if state is None:
         return {"error": f"Không tìm thấy {symbol}"}
     
-    df = load_data(csv_path)
+    with state["lock"]:
+        pr = state["pr"]
+        if len(pr.df) < 50:
+            return {"error": "Không đủ dữ liệu"}
+        
+        if state["results"] is None:
+            results = pr.analyze_all()
+            results["symbol"] = symbol
+            results["timeframe"] = timeframe
+            results["data_version"] = pr.version
+            results["last_date"] = pr.df.index[-1].strftime("%Y-%m-%d")
+            state["results"] = results
+        
+        return state["results"]
+
+# ============ QUÉT TOÀN BỘ DANH SÁCH MÃ ============
+
+# Kết quả quét theo mã: (symbol, timeframe) -> (version, results)
+_scan_results = {}
+
+def _scan_one(symbol: str, timeframe: str = "D"):
+    """Phân tích 1 mã trong tiến trình con (trả về kèm phiên bản dữ liệu)
+    Kết quả lỗi cũng gắn phiên bản dữ liệu lấy trước khi phân tích, không phân tích lại khi dữ liệu chưa đổi"""
+    version = data_store.data_version(symbol)
+    results = analyze_patterns(symbol, timeframe)
+    return symbol, results.get("data_version", version), results
+
+def _cached_results(symbol: str, version: str, timeframe: str = "D") -> dict:
+    """Kết quả đã có của 1 mã nếu đúng phiên bản dữ liệu (từ lần quét trước hoặc /api/patterns)"""
+    state = _pattern_states.get((symbol, timeframe))
+    if state is not None and state["pr"].version == version and state["results"] is not None:
+        return state["results"]
+    cached = _scan_results.get((symbol, timeframe))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    return None
+
+# Pool tiến trình dùng chung cho mọi lượt quét: {"executor", "jobs"}
+_scan_pool = {"executor": None, "jobs": None}
+_scan_pool_lock = threading.Lock()
+
+def _get_scan_pool(jobs: int) -> ProcessPoolExecutor:
+    """Pool quét mẫu hình, tạo 1 lần và dùng lại (tạo lại nếu đổi số tiến trình)
+    Tiến trình con khởi động bằng spawn, không fork tiến trình web nhiều thread đang giữ lock"""
+    with _scan_pool_lock:
+        if _scan_pool["executor"] is None or _scan_pool["jobs"] != jobs:
+            if _scan_pool["executor"] is not None:
+                _scan_pool["executor"].shutdown(wait=False)
+            _scan_pool["executor"] = ProcessPoolExecutor(max_workers=jobs,
+                                                         mp_context=multiprocessing.get_context("spawn"))
+            _scan_pool["jobs"] = jobs
+        return _scan_pool["executor"]
+
+def _reset_scan_pool():
+    """Bỏ pool bị hỏng (tiến trình con chết), lượt quét sau tạo pool mới"""
+    with _scan_pool_lock:
+        if _scan_pool["executor"] is not None:
+            _scan_pool["executor"].shutdown(wait=False)
+        _scan_pool.update({"executor": None, "jobs": None})
+
+def scan_patterns(symbols: list = None, patterns: list = None, signal: str = None,
+                  pattern_type: str = None, days: int = 10, jobs: int = None, timeframe: str = "D") -> list:
+    """Quét mẫu hình cho nhiều mã song song (pool tiến trình dùng chung, xem _get_scan_pool)
+    Chỉ phân tích lại các mã có phiên bản dữ liệu mới, lọc theo tên mẫu hình, tín hiệu,
+    loại (candle/chart) và độ mới (số ngày tính tới phiên cuối của mã), xếp hạng theo độ mạnh
+    timeframe W/M: quét trên nến tuần/tháng (days vẫn tính theo ngày lịch)"""
+    if timeframe not in data_store.TIMEFRAMES:
+        raise ValueError(f"Khung thời gian không hợp lệ: {timeframe}")
+    symbols = data_store.list_symbols() if symbols is None else symbols
+    
+    all_results = {}
+    stale = []
+    for symbol in symbols:
+        cached = _cached_results(symbol, data_store.data_version(symbol), timeframe)
+        if cached is not None:
+            all_results[symbol] = cached
+        else:
+            stale.append(symbol)
     
-    if len(df) < 50:
-        return {"error": "Không đủ dữ liệu"}
+    if stale:
+        jobs = jobs or os.cpu_count() or 1
+        if jobs <= 1 or len(stale) == 1:
+            outputs = map(_scan_one, stale, [timeframe] * len(stale))
+            for symbol, version, results in outputs:
+                all_results[symbol] = results
+        else:
+            chunksize = max(1, len(stale) // (jobs * 4))
+            try:
+                executor = _get_scan_pool(jobs)
+                for symbol, version, results in executor.map(_scan_one, stale, [timeframe] * len(stale),
+                                                             chunksize=chunksize):
+                    _scan_results[(symbol, timeframe)] = (version, results)
+                    all_results[symbol] = results
+            except BrokenProcessPool:
+                _reset_scan_pool()
+                for symbol, version, results in map(_scan_one, [s for s in stale if s not in all_results],
+                                                    [timeframe] * len(stale)):
+                    all_results[symbol] = results
     
-    pr = PatternRecognition(df)
-    results = pr.analyze_all()
-    results["symbol"] = symbol
+    wanted = {p.lower() for p in patterns} if patterns else None
+    hits = []
+    for symbol in symbols:
+        results = all_results.get(symbol)
+        if not results or "error" in results:
+            continue
+        
+        last_date = pd.Timestamp(results["last_date"])
+        for p in results["candle_patterns"] + results["chart_patterns"]:
+            if wanted and p["pattern"].lower() not in wanted:
+                continue
+            if signal and p["signal"] != signal:
+                continue
+            if pattern_type and p["type"] != pattern_type:
+                continue
+            days_ago = (last_date - pd.Timestamp(p["date"])).days
+            if days is not None and days_ago > days:
+                continue
+            hits.append({**p, "symbol": symbol, "days_ago": days_ago})
     
-    return results
+    # Xếp hạng: mạnh hơn trước, mới hơn trước
+    hits.sort(key=lambda h: (-h["strength"], h["days_ago"], h["symbol"]))
+    return hits
 
 def print_analysis(results: dict):
     """In kết quả phân tích"""
@@ -585,14 +1160,47 @@ def print_analysis(results: dict):
     print(f"  Điểm Bullish: {summary['bullish_score']}")
     print(f"  Điểm Bearish: {summary['bearish_score']}")
 
+def print_scan(hits: list):
+    """In kết quả quét mẫu hình"""
+    print(f"\n{'='*80}")
+    print(f"   QUET MAU HINH - {len(hits)} ket qua")
+    print(f"{'='*80}")
+    print(f"{'STT':<4} {'Ma':<8} {'Mau hinh':<28} {'Tin hieu':<9} {'Do manh':>7} {'Ngay':<11} {'Cach':>5}")
+    print("-" * 80)
+    for i, h in enumerate(hits, 1):
+        print(f"{i:<4} {h['symbol']:<8} {h['pattern']:<28} {h['signal']:<9} {h['strength']:>7} {h['date']:<11} {h['days_ago']:>4}d")
+
 if __name__ == "__main__":
-    data_dir = "data"
-    csv_files = [f.replace(".csv", "") for f in os.listdir(data_dir) if f.endswith(".csv")]
-    
-    print("Các mã cổ phiếu đã tải:")
-    print(", ".join(csv_files))
+    # Phân tích 1 mã: python pattern_recognition.py [MA] [--timeframe W]
+    # Quét toàn bộ:   python pattern_recognition.py --scan [--pattern "Double Bottom,Inverse Head and Shoulders"]
+    #                 [--signal bullish] [--type chart] [--days 10] [--jobs 4] [--timeframe W]
+    import argparse
     
-    symbol = input("\nNhập mã muốn phân tích (VD: FPT): ").strip().upper()
+    parser = argparse.ArgumentParser(description="Nhan dien mau hinh 1 ma hoac quet toan bo ma")
+    parser.add_argument("symbol", nargs="?", default=None, help="Ma can phan tich (bo trong thi nhap tu ban phim)")
+    parser.add_argument("--scan", action="store_true", help="Quet toan bo ma")
+    parser.add_argument("--pattern", default=None, help="Ten mau hinh, cach nhau boi dau phay")
+    parser.add_argument("--signal", default=None, choices=["bullish", "bearish", "neutral"])
+    parser.add_argument("--type", default=None, choices=["candle", "chart"])
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--timeframe", default="D", choices=list(data_store.TIMEFRAMES))
+    args = parser.parse_args()
     
-    results = analyze_patterns(symbol)
-    print_analysis(results)
+    if args.scan:
+        start = time.time()
+        hits = scan_patterns(
+            patterns=args.pattern.split(",") if args.pattern else None,
+            signal=args.signal, pattern_type=args.type, days=args.days, jobs=args.jobs,
+            timeframe=args.timeframe
+        )
+        print_scan(hits)
+        print(f"\nThoi gian: {time.time() - start:.1f}s")
+    else:
+        symbol = args.symbol
+        if not symbol:
+            print("Các mã cổ phiếu đã tải:")
+            print(", ".join(data_store.list_symbols()))
+            symbol = input("\nNhập mã muốn phân tích (VD: FPT): ")
+        results = analyze_patterns(symbol.strip().upper(), args.timeframe)
+        print_analysis(results)
@@ -0,0 +1,187 @@
+"""
+Thống kê sự kiện mẫu hình (Event Study) - Độ mạnh thực nghiệm của từng mẫu hình
+Lấy mọi lần xuất hiện mẫu hình trong lịch sử của toàn bộ mã, tính lợi nhuận 1/5/10/20 phiên sau đó
+và tổng hợp tỷ lệ đúng hướng, lợi nhuận trung bình/trung vị, độ phân tán theo mẫu hình và theo ngành
+Sử dụng: python pattern_stats.py [--sector]
+"""
+
+import numpy as np
+import pandas as pd
+import threading
+import time
+import data_store
+from pattern_recognition import get_pattern_state
+from download_all_vn import get_sector
+
+# Số phiên tính lợi nhuận sau mẫu hình
+HORIZONS = [1, 5, 10, 20]
+
+# Hướng kỳ vọng của tín hiệu (neutral tính theo hướng tăng)
+SIGNAL_DIRECTION = {"bullish": 1, "bearish": -1, "neutral": 1}
+
+# Kết quả thống kê gần nhất: {"versions": tuple, "result": dict}
+_study_cache = {}
+_study_lock = threading.Lock()
+
+def collect_events(symbols: list = None) -> pd.DataFrame:
+    """Mọi mẫu hình trong lịch sử của các mã (dùng trạng thái nhận diện tăng dần theo mã)"""
+    symbols = data_store.list_symbols() if symbols is None else symbols
+    frames = []
+
+    for symbol in symbols:
+        state = get_pattern_state(symbol)
+        if state is None:
+            continue
+        with state["lock"]:
+            if len(state["pr"].df) < 50:
+                continue
+            events = state["pr"].pattern_history()
+        if events:
+            frame = pd.DataFrame(events, columns=["date", "pattern", "type", "signal", "lag"])
+            frame["symbol"] = symbol
+            frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=["date", "pattern", "type", "signal", "lag", "symbol"])
+    events = pd.concat(frames, ignore_index=True)
+    events["date"] = pd.to_datetime(events["date"])
+    return events
+
+def forward_returns(events: pd.DataFrame, close: pd.DataFrame, horizons: list = HORIZONS) -> pd.DataFrame:
+    """Lợi nhuận (%) sau mỗi sự kiện, lấy bằng chỉ số mảng trên panel giá đóng cửa
+    Tính từ phiên xác nhận (ngày sự kiện + lag) theo phiên của chính mã đó; thiếu dữ liệu thì là NaN"""
+    compact, rank, valid = data_store.compact_columns(close)
+    lag = events["lag"].values.astype(int) if "lag" in events else np.zeros(len(events), dtype=int)
+    padded = np.vstack([compact, np.full((max(horizons) + lag.max(initial=0), compact.shape[1]), np.nan)])
+
+    col = close.columns.get_indexer(events["symbol"])
+    row = close.index.get_indexer(events["date"])
+    pos = rank[row, col] + lag
+    base = padded[pos, col]
+
+    out = pd.DataFrame(index=events.index)
+    for h in horizons:
+        out[f"ret_{h}d"] = (padded[pos + h, col] / base - 1) * 100
+    return out
+
+def summarize(events: pd.DataFrame, by: list, horizons: list = HORIZONS) -> pd.DataFrame:
+    """Tổng hợp theo nhóm: số lần, tỷ lệ đúng hướng, TB, trung vị, độ lệch chuẩn của lợi nhuận"""
+    direction = events["signal"].map(SIGNAL_DIRECTION).fillna(1)
+    data = events[by].copy()
+    aggs = {"count": (by[0], "size")}
+
+    for h in horizons:
+        ret = events[f"ret_{h}d"]
+        data[f"ret_{h}d"] = ret
+        data[f"hit_{h}d"] = ((ret * direction) > 0).astype(float).where(ret.notna())
+        aggs[f"n_{h}d"] = (f"ret_{h}d", "count")
+        aggs[f"hit_rate_{h}d"] = (f"hit_{h}d", "mean")
+        aggs[f"mean_{h}d"] = (f"ret_{h}d", "mean")
+        aggs[f"median_{h}d"] = (f"ret_{h}d", "median")
+        aggs[f"std_{h}d"] = (f"ret_{h}d", "std")
+
+    table = data.groupby(by).agg(**aggs)
+    for h in horizons:
+        table[f"hit_rate_{h}d"] *= 100
+    return table
+
+def row_to_dict(row: pd.Series, horizons: list = HORIZONS) -> dict:
+    """Chuyển 1 dòng thống kê sang dict JSON"""
+    def num(v):
+        return None if pd.isna(v) else float(v)
+
+    return {
+        "count": int(row["count"]),
+        "horizons": {
+            f"{h}d": {
+                "count": int(row[f"n_{h}d"]),
+                "hit_rate": num(row[f"hit_rate_{h}d"]),
+                "mean": num(row[f"mean_{h}d"]),
+                "median": num(row[f"median_{h}d"]),
+                "std": num(row[f"std_{h}d"])
+            } for h in horizons
+        }
+    }
+
+def run_event_study(symbols: list = None) -> dict:
+    """Chạy thống kê sự kiện cho toàn bộ mẫu hình"""
+    symbols = data_store.list_symbols() if symbols is None else symbols
+    events = collect_events(symbols)
+    if events.empty:
+        return {"patterns": {}, "sectors": {}, "total_events": 0}
+
+    close = data_store.load_panel(symbols)["Close"]
+    events = events.join(forward_returns(events, close))
+    events["sector"] = events["symbol"].map(get_sector)
+
+    by_pattern = summarize(events, ["pattern", "signal"])
+    by_sector = summarize(events, ["sector", "pattern", "signal"])
+
+    patterns = {}
+    for (pattern, signal), row in by_pattern.iterrows():
+        patterns[pattern] = {"signal": signal, **row_to_dict(row)}
+
+    sectors = {}
+    for (sector, pattern, signal), row in by_sector.iterrows():
+        sectors.setdefault(sector, {})[pattern] = {"signal": signal, **row_to_dict(row)}
+
+    return {
+        "patterns": patterns,
+        "sectors": sectors,
+        "total_events": int(len(events)),
+        "symbols": len(symbols),
+        "updated": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def get_pattern_stats(symbols: list = None) -> dict:
+    """Thống kê sự kiện, chỉ tính lại khi có mã đổi phiên bản dữ liệu"""
+    symbols = data_store.list_symbols() if symbols is None else symbols
+    versions = tuple((s, data_store.data_version(s)) for s in symbols)
+
+    with _study_lock:
+        if _study_cache.get("versions") != versions:
+            _study_cache["result"] = run_event_study(symbols)
+            _study_cache["versions"] = versions
+        return _study_cache["result"]
+
+def peek_pattern_stats() -> dict:
+    """Kết quả thống kê đã tính gần nhất (None nếu chưa tính), không chờ tính lại"""
+    return _study_cache.get("result")
+
+def attach_empirical(results: dict, stats: dict) -> dict:
+    """Gắn thống kê thực nghiệm vào từng mẫu hình trong kết quả analyze_all (không sửa bản gốc)"""
+    results = dict(results)
+    for key in ["candle_patterns", "chart_patterns"]:
+        results[key] = [{**p, "empirical": stats["patterns"].get(p["pattern"])} for p in results.get(key, [])]
+    return results
+
+def print_stats(stats: dict, show_sectors: bool = False):
+    """In bảng thống kê"""
+    def print_table(patterns: dict):
+        print(f"{'Mau hinh':<28} {'Tin hieu':<9} {'So lan':>7} " +
+              " ".join(f"{str(h) + 'd dung/TB':>16}" for h in HORIZONS))
+        print("-" * 110)
+        for name, s in sorted(patterns.items(), key=lambda x: -x[1]["count"]):
+            cells = []
+            for h in HORIZONS:
+                v = s["horizons"][f"{h}d"]
+                cells.append(f"{v['hit_rate']:>5.0f}% {v['mean']:>+7.2f}%  " if v["count"] else f"{'N/A':>16}")
+            print(f"{name:<28} {s['signal']:<9} {s['count']:>7} " + " ".join(cells))
+
+    print(f"\n{'='*110}")
+    print(f"   THONG KE SU KIEN MAU HINH - {stats['total_events']} su kien")
+    print(f"{'='*110}")
+    print_table(stats["patterns"])
+
+    if show_sectors:
+        for sector, patterns in stats["sectors"].items():
+            print(f"\n--- {sector} ---")
+            print_table(patterns)
+
+if __name__ == "__main__":
+    import sys
+
+    start = time.time()
+    stats = get_pattern_stats()
+    print_stats(stats, show_sectors="--sector" in sys.argv)
+    print(f"\nThoi gian: {time.time() - start:.1f}s")
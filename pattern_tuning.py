@@ -0,0 +1,197 @@
+"""
+Độ nhạy tham số mẫu hình - Chạy mỗi bộ nhận diện trên lưới tham số cho toàn bộ mã trong 1 lần
+Đỉnh/đáy (theo bậc) và hồi quy trượt (theo cửa sổ) tính 1 lần rồi dùng lại cho mọi điểm lưới:
+mỗi ứng viên mẫu hình được tính sẵn "tolerance cần có", nên đổi tolerance chỉ là so sánh ngưỡng
+Độ dốc tam giác được chuẩn hóa theo % giá mỗi nến để cùng ngưỡng dùng được cho cả VND và USD
+Sử dụng: python pattern_tuning.py [--detector double_bottom] [--horizon 10]
+"""
+
+import itertools
+import numpy as np
+import pandas as pd
+import time
+import data_store
+import pattern_stats
+from pattern_recognition import get_pattern_state, classify_triangle, TRIANGLE_SIGNALS
+
+# Lưới tham số mặc định cho từng bộ nhận diện
+DEFAULT_GRID = {
+    "double_top": {"order": [3, 5, 7], "tolerance": [0.01, 0.02, 0.03, 0.05]},
+    "double_bottom": {"order": [3, 5, 7], "tolerance": [0.01, 0.02, 0.03, 0.05]},
+    "head_shoulders": {"order": [3, 5, 7], "tolerance": [0.01, 0.02, 0.03, 0.05]},
+    "inverse_head_shoulders": {"order": [3, 5, 7], "tolerance": [0.01, 0.02, 0.03, 0.05]},
+    # slope_pct: ngưỡng độ dốc tính theo % giá mỗi nến
+    "triangle": {"window": [20, 30, 40], "slope_pct": [0.02, 0.05, 0.1, 0.2]},
+}
+
+# Tên và tín hiệu của các mẫu hình theo đỉnh/đáy
+PIVOT_PATTERNS = {
+    "double_top": ("Double Top", "bearish"),
+    "double_bottom": ("Double Bottom", "bullish"),
+    "head_shoulders": ("Head and Shoulders", "bearish"),
+    "inverse_head_shoulders": ("Inverse Head and Shoulders", "bullish"),
+}
+
+def setting_label(params: dict) -> str:
+    """Nhãn của 1 điểm lưới, vd "order=5,tolerance=0.03" """
+    return ",".join(f"{k}={v}" for k, v in params.items())
+
+# ============ ỨNG VIÊN MẪU HÌNH (TÍNH 1 LẦN / BẬC) ============
+
+def pivot_candidates(detector: str, peaks_idx: np.ndarray, troughs_idx: np.ndarray, close: np.ndarray):
+    """Ứng viên của 1 mẫu hình đỉnh/đáy, cùng điều kiện với detect_* của PatternRecognition
+    Trả về (nến hoàn thành mẫu hình, tolerance nhỏ nhất để được chấp nhận)"""
+    idx = peaks_idx if detector in ("double_top", "head_shoulders") else troughs_idx
+    idx = np.asarray(idx, dtype=int)
+    empty = np.array([], dtype=int), np.array([], dtype=float)
+
+    if detector in ("double_top", "double_bottom"):
+        if len(idx) < 2:
+            return empty
+        i1, i2 = idx[:-1], idx[1:]
+        p1, p2 = close[i1], close[i2]
+        # Giá thấp nhất/cao nhất trong đoạn [i1, i2) giữa 2 pivot liên tiếp
+        if detector == "double_top":
+            between = np.minimum.reduceat(close, idx)[:-1]
+            deep = (p1 - between) / p1 >= 0.03
+        else:
+            between = np.maximum.reduceat(close, idx)[:-1]
+            deep = (between - p1) / p1 >= 0.03
+        ok = (i2 - i1 >= 10) & (i2 - i1 <= 50) & deep
+        return i2[ok], (np.abs(p1 - p2) / p1)[ok]
+
+    if len(idx) < 3:
+        return empty
+    left, head, right = close[idx[:-2]], close[idx[1:-1]], close[idx[2:]]
+    if detector == "head_shoulders":
+        ok = (head > left) & (head > right) & ((head - left) / left >= 0.03)
+    else:
+        ok = (head < left) & (head < right) & ((left - head) / head >= 0.03)
+    return idx[2:][ok], (np.abs(left - right) / left)[ok]
+
+def _pivot_events(pr, detector: str, grid: dict) -> list:
+    """Sự kiện của mẫu hình đỉnh/đáy cho mọi điểm lưới của 1 mã"""
+    pattern, signal = PIVOT_PATTERNS[detector]
+    close = pr.df["Close"].values
+    dates = pr.df.index
+    pivots = pr.get_pivot_index()
+    rows = []
+
+    for order in grid["order"]:
+        bars, need = pivot_candidates(detector, *pivots.peaks_troughs(order), close)
+        for tol in grid["tolerance"]:
+            label = setting_label({"order": order, "tolerance": tol})
+            for bar in bars[need <= tol]:
+                # Pivot bậc `order` chỉ xác nhận được sau `order` nến
+                rows.append((dates[bar], pattern, signal, order, detector, label))
+    return rows
+
+def _triangle_events(pr, grid: dict) -> list:
+    """Sự kiện tam giác (ngày bắt đầu hình thành) cho mọi điểm lưới của 1 mã"""
+    close = pr.df["Close"].values
+    rows = []
+
+    for window in grid["window"]:
+        fit = pr.rolling_fit(window)
+        # Độ dốc theo % giá đóng cửa cuối cửa sổ
+        high_pct = fit["high_slope"].values / close * 100
+        low_pct = fit["low_slope"].values / close * 100
+        for cutoff in grid["slope_pct"]:
+            label = setting_label({"window": window, "slope_pct": cutoff})
+            kinds = pd.Series(classify_triangle(high_pct, low_pct, cutoff), index=fit.index)
+            first_day = (kinds != "") & (kinds != kinds.shift(1))
+            for date, name in kinds[first_day].items():
+                rows.append((date, name, TRIANGLE_SIGNALS[name], 0, "triangle", label))
+    return rows
+
+# ============ ĐÁNH GIÁ LƯỚI ============
+
+def collect_grid_events(grid: dict = None, symbols: list = None) -> pd.DataFrame:
+    """Mọi sự kiện của mọi điểm lưới trên toàn bộ mã"""
+    grid = DEFAULT_GRID if grid is None else grid
+    symbols = data_store.list_symbols() if symbols is None else symbols
+    frames = []
+
+    for symbol in symbols:
+        state = get_pattern_state(symbol)
+        if state is None:
+            continue
+        with state["lock"]:
+            pr = state["pr"]
+            if len(pr.df) < 50:
+                continue
+            rows = []
+            for detector, params in grid.items():
+                if detector == "triangle":
+                    rows.extend(_triangle_events(pr, params))
+                else:
+                    rows.extend(_pivot_events(pr, detector, params))
+        if rows:
+            frame = pd.DataFrame(rows, columns=["date", "pattern", "signal", "lag", "detector", "setting"])
+            frame["symbol"] = symbol
+            frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=["date", "pattern", "signal", "lag", "detector", "setting", "symbol"])
+    return pd.concat(frames, ignore_index=True)
+
+def run_grid(grid: dict = None, symbols: list = None) -> dict:
+    """Số lần phát hiện và lợi nhuận sau sự kiện cho từng điểm lưới của từng bộ nhận diện
+    Trả về {detector: {setting: {"count", "symbols", "horizons": {...}}}}"""
+    grid = DEFAULT_GRID if grid is None else grid
+    symbols = data_store.list_symbols() if symbols is None else symbols
+    events = collect_grid_events(grid, symbols)
+
+    result = {}
+    for detector, params in grid.items():
+        settings = [dict(zip(params, values)) for values in itertools.product(*params.values())]
+        result[detector] = {setting_label(s): {"params": s, "count": 0, "symbols": 0, "horizons": {}}
+                            for s in settings}
+
+    if events.empty:
+        return result
+
+    close = data_store.load_panel(symbols)["Close"]
+    events = events.join(pattern_stats.forward_returns(events, close))
+    table = pattern_stats.summarize(events, ["detector", "setting"])
+    n_symbols = events.groupby(["detector", "setting"])["symbol"].nunique()
+
+    for (detector, label), row in table.iterrows():
+        entry = result[detector][label]
+        entry.update(pattern_stats.row_to_dict(row))
+        entry["symbols"] = int(n_symbols[(detector, label)])
+    return result
+
+def print_grid(result: dict, horizon: int = 10):
+    """In bảng độ nhạy tham số"""
+    key = f"{horizon}d"
+    for detector, settings in result.items():
+        print(f"\n{'='*84}")
+        print(f"   {detector.upper()} - loi nhuan sau {horizon} phien")
+        print(f"{'='*84}")
+        print(f"{'Tham so':<32} {'So lan':>7} {'So ma':>6} {'Dung huong':>11} {'TB':>9} {'Trung vi':>9}")
+        print("-" * 84)
+        for label, s in settings.items():
+            h = s["horizons"].get(key)
+            if not h or not h["count"]:
+                print(f"{label:<32} {s['count']:>7} {s['symbols']:>6} {'N/A':>11}")
+                continue
+            print(f"{label:<32} {s['count']:>7} {s['symbols']:>6} {h['hit_rate']:>10.1f}% "
+                  f"{h['mean']:>+8.2f}% {h['median']:>+8.2f}%")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Do nhay tham so cua cac bo nhan dien mau hinh")
+    parser.add_argument("--detector", default=None, help="Ten bo nhan dien, cach nhau boi dau phay (mac dinh: tat ca)")
+    parser.add_argument("--horizon", type=int, default=10, choices=pattern_stats.HORIZONS)
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.detector:
+        grid = {d: DEFAULT_GRID[d] for d in args.detector.split(",")}
+
+    start = time.time()
+    result = run_grid(grid)
+    print_grid(result, args.horizon)
+    print(f"\nThoi gian: {time.time() - start:.1f}s")
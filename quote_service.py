@@ -0,0 +1,186 @@
+"""
+Dịch vụ giá realtime - Lấy giá nhiều mã trong 1 lần gọi Yahoo Finance và cache theo TTL
+Screener / phân tích đọc giá từ cache thay vì gọi mạng cho từng mã
+Sử dụng: python quote_service.py [MA ...]
+"""
+
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+import yfinance as yf
+
+# Thời gian sống của giá trong cache (giây), khớp chu kỳ auto update của app (15 phút)
+QUOTE_TTL = 15 * 60
+
+# Cache: symbol -> (thời điểm lấy, quote hoặc None nếu không lấy được)
+_quotes = {}
+_quotes_lock = threading.Lock()
+
+# Chỉ 1 lượt lấy giá chạy cùng lúc
+_fetch_lock = threading.Lock()
+
+# Mã đang được lấy giá trong lượt đang chạy -> Event báo lượt đó xong
+_inflight = {}
+
+# Mã Yahoo đã biết của từng mã (mã VN có hậu tố .VN, mã US thì không)
+_yahoo_symbols = {}
+
+def _history_of(data: pd.DataFrame, ticker: str) -> pd.DataFrame:
+    """Lịch sử giá của 1 mã trong kết quả yf.download nhiều mã"""
+    if data is None or data.empty:
+        return None
+    if isinstance(data.columns, pd.MultiIndex):
+        if ticker not in data.columns.get_level_values(0):
+            return None
+        data = data[ticker]
+    hist = data.dropna(subset=["Close"])
+    return hist if not hist.empty else None
+
+def _make_quote(symbol: str, hist: pd.DataFrame) -> dict:
+    """Quote từ lịch sử vài phiên gần nhất (cùng định dạng get_realtime_price cũ)"""
+    latest = hist.iloc[-1]
+    prev = hist.iloc[-2] if len(hist) > 1 else hist.iloc[-1]
+
+    current_price = float(latest["Close"])
+    prev_close = float(prev["Close"])
+    change = current_price - prev_close
+    change_pct = (change / prev_close) * 100
+
+    return {
+        "symbol": symbol,
+        "price": current_price,
+        "change": change,
+        "change_pct": change_pct,
+        "open": float(latest["Open"]),
+        "high": float(latest["High"]),
+        "low": float(latest["Low"]),
+        "volume": int(latest["Volume"]),
+        "prev_close": prev_close,
+        "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def _download(tickers: list) -> pd.DataFrame:
+    """1 lần gọi yf.download cho nhiều mã"""
+    try:
+        return yf.download(tickers, period="5d", group_by="ticker", progress=False, threads=True)
+    except Exception as e:
+        print(f"Lỗi lấy giá {len(tickers)} mã: {e}")
+        return None
+
+def fetch_quotes(symbols: list) -> dict:
+    """Lấy giá nhiều mã từ Yahoo Finance (không qua cache)
+    Mã chưa biết thử với .VN trước, mã không có dữ liệu thử lại không có .VN (mã US) trong lượt thứ 2"""
+    quotes = {}
+    pending = list(symbols)
+
+    for attempt in range(2):
+        if not pending:
+            break
+        tickers = {}
+        for symbol in pending:
+            known = _yahoo_symbols.get(symbol)
+            if attempt == 0:
+                tickers[known or symbol + ".VN"] = symbol
+            elif known is None:
+                tickers[symbol] = symbol
+
+        data = _download(list(tickers)) if tickers else None
+        for ticker, symbol in tickers.items():
+            hist = _history_of(data, ticker)
+            if hist is not None:
+                quotes[symbol] = _make_quote(symbol, hist)
+                _yahoo_symbols[symbol] = ticker
+        pending = [s for s in pending if s not in quotes]
+
+    return quotes
+
+def refresh(symbols: list) -> dict:
+    """Lấy lại giá các mã và ghi vào cache (mã lỗi được ghi None để không gọi lại trước khi hết TTL)"""
+    with _fetch_lock:
+        done = threading.Event()
+        with _quotes_lock:
+            _inflight.update((symbol, done) for symbol in symbols)
+        try:
+            quotes = fetch_quotes(symbols)
+            now = time.time()
+            with _quotes_lock:
+                for symbol in symbols:
+                    _quotes[symbol] = (now, quotes.get(symbol))
+        finally:
+            with _quotes_lock:
+                for symbol in symbols:
+                    if _inflight.get(symbol) is done:
+                        del _inflight[symbol]
+            done.set()
+    return quotes
+
+def _stale(symbols: list, ttl: float) -> list:
+    """Các mã chưa có giá hoặc giá đã quá TTL"""
+    now = time.time()
+    with _quotes_lock:
+        return [s for s in symbols if s not in _quotes or now - _quotes[s][0] > ttl]
+
+def peek_quotes(symbols: list) -> dict:
+    """Giá đang có trong cache (không gọi mạng, kể cả giá đã quá TTL)"""
+    with _quotes_lock:
+        return {s: _quotes[s][1] for s in symbols if s in _quotes and _quotes[s][1] is not None}
+
+def peek_quote(symbol: str) -> tuple:
+    """(đã từng lấy giá mã này chưa, quote trong cache hoặc None) - không gọi mạng"""
+    with _quotes_lock:
+        entry = _quotes.get(symbol)
+    return (entry is not None, entry[1] if entry else None)
+
+def refresh_async(symbols: list, ttl: float = None):
+    """Lấy lại giá các mã quá TTL trong thread nền (bỏ qua nếu đang có lượt lấy giá khác)"""
+    stale = _stale(symbols, QUOTE_TTL if ttl is None else ttl)
+    if not stale or _fetch_lock.locked():
+        return
+    threading.Thread(target=refresh, args=(stale,), daemon=True).start()
+
+def get_quotes(symbols: list, ttl: float = None, wait: bool = True) -> dict:
+    """Giá của nhiều mã: mã còn hạn lấy từ cache, mã quá TTL được lấy lại trong 1 lần gọi
+    wait=False: trả ngay giá đang có, phần quá hạn cập nhật trong nền"""
+    ttl = QUOTE_TTL if ttl is None else ttl
+    if wait:
+        stale = _stale(symbols, ttl)
+        if stale:
+            refresh(stale)
+    else:
+        refresh_async(symbols, ttl)
+    return peek_quotes(symbols)
+
+def get_quote(symbol: str, ttl: float = None) -> dict:
+    """Giá của 1 mã (None nếu không lấy được), không xếp hàng sau lượt lấy giá nhiều mã đang chạy
+    Đã có giá: trả ngay (giá quá TTL được lấy lại trong nền); chưa có: chờ lượt đang lấy mã này nếu có,
+    nếu không thì lấy riêng mã này"""
+    known, quote = peek_quote(symbol)
+    if known:
+        refresh_async([symbol], ttl)
+        return quote
+
+    with _quotes_lock:
+        pending = _inflight.get(symbol)
+    if pending is not None:
+        pending.wait()
+        return peek_quote(symbol)[1]
+
+    quote = fetch_quotes([symbol]).get(symbol)
+    with _quotes_lock:
+        _quotes[symbol] = (time.time(), quote)
+    return quote
+
+if __name__ == "__main__":
+    import sys
+    import data_store
+
+    symbols = [a.upper() for a in sys.argv[1:]] or data_store.list_symbols()
+    start = time.time()
+    quotes = get_quotes(symbols)
+    print(f"{'Ma':<8} {'Gia':>12} {'Thay doi':>9}")
+    print("-" * 31)
+    for symbol in symbols:
+        q = quotes.get(symbol)
+        print(f"{symbol:<8} {q['price']:>12,.2f} {q['change_pct']:>+8.2f}%" if q else f"{symbol:<8} {'N/A':>12}")
+    print(f"\n{len(quotes)}/{len(symbols)} ma, thoi gian: {time.time() - start:.1f}s")
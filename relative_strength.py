@@ -0,0 +1,114 @@
+"""
+Sức mạnh tương đối (RS) - Lợi nhuận nhiều khung (3/6/9/12 tháng) có trọng số của mọi mã,
+xếp hạng phần trăm (1-99) giữa các mã tại từng ngày
+Tính 1 lần trên cả bảng nhiều mã và giữ toàn bộ lịch sử xếp hạng theo phiên bản dữ liệu
+Sử dụng: python relative_strength.py [MA ...]
+"""
+
+import threading
+import time
+import numpy as np
+import pandas as pd
+import data_store
+
+# Khung lợi nhuận (số nến) -> trọng số; 3 tháng gần nhất nặng gấp đôi
+RS_HORIZONS = {63: 0.4, 126: 0.2, 189: 0.2, 252: 0.2}
+
+# Số phiên tối đa dùng lại điểm của nến trước khi mã không có nến (nghỉ giao dịch / dữ liệu chậm vài phiên)
+RS_FILL_LIMIT = 5
+
+# Cache: tuple((mã, phiên bản)) -> {"score", "rank"}
+_rs = {"versions": None, "result": None}
+_rs_lock = threading.Lock()
+
+def weighted_returns(close: np.ndarray) -> np.ndarray:
+    """Lợi nhuận có trọng số (%) theo RS_HORIZONS trên mảng nến x mã (chuỗi nến riêng từng mã)
+    Mã chưa đủ 12 tháng dùng các khung đã có (chuẩn hóa lại trọng số); chưa đủ khung ngắn nhất thì NaN"""
+    total = np.zeros(close.shape)
+    weight = np.zeros(close.shape)
+    for bars, w in RS_HORIZONS.items():
+        past = np.full(close.shape, np.nan)
+        past[bars:] = close[:-bars]
+        ret = (close / past - 1) * 100
+        ok = ~np.isnan(ret)
+        total[ok] += w * ret[ok]
+        weight[ok] += w
+    with np.errstate(invalid="ignore"):
+        score = total / weight
+    score[np.isnan(close) | (weight == 0)] = np.nan
+    return score
+
+def compute_rs(panel: dict) -> dict:
+    """Điểm RS và xếp hạng RS (ngày x mã) cho cả bảng
+    Ngày mã không giao dịch dùng giá trị nến trước (tối đa RS_FILL_LIMIT phiên) để vẫn được xếp hạng; chỉ dùng dữ liệu đến ngày đó"""
+    close_frame = panel["Close"]
+    close, rank, valid = data_store.compact_columns(close_frame)
+    score = data_store.expand_columns(weighted_returns(close), rank, valid, close_frame)
+
+    # Chỉ lấp tối đa RS_FILL_LIMIT phiên liền sau nến gần nhất (chỉ dùng dữ liệu quá khứ), lâu hơn thì bỏ khỏi xếp hạng
+    score = score.ffill(limit=RS_FILL_LIMIT)
+
+    # Xếp hạng phần trăm giữa các mã có điểm tại mỗi ngày, thang 1-99
+    pct = score.rank(axis=1, pct=True)
+    rs_rank = (pct * 98 + 1).round()
+    return {"score": score, "rank": rs_rank}
+
+def get_rs() -> dict:
+    """Điểm / xếp hạng RS toàn lịch sử của mọi mã (tính lại khi dữ liệu có mã đổi phiên bản)"""
+    symbols = data_store.list_symbols()
+    versions = tuple((s, data_store.data_version(s)) for s in symbols)
+    with _rs_lock:
+        if _rs["versions"] == versions:
+            return _rs["result"]
+
+    result = compute_rs(data_store.load_panel(symbols, columns=["Close"]))
+    with _rs_lock:
+        _rs["versions"] = versions
+        _rs["result"] = result
+    return result
+
+def rs_history(symbol: str) -> pd.DataFrame:
+    """Lịch sử điểm và xếp hạng RS của 1 mã theo ngày giao dịch của mã (None nếu không có)"""
+    rs = get_rs()
+    if symbol not in rs["rank"].columns:
+        return None
+    df, _ = data_store.load_symbol(symbol)
+    return pd.DataFrame({
+        "rs_score": rs["score"][symbol].reindex(df.index),
+        "rs_rank": rs["rank"][symbol].reindex(df.index),
+    })
+
+def rs_at(symbols, dates) -> dict:
+    """Điểm và xếp hạng RS của từng mã tại ngày tương ứng (mảng cùng độ dài, NaN nếu không có)"""
+    rs = get_rs()
+    rows = rs["rank"].index.get_indexer(pd.to_datetime(pd.Index(dates)))
+    cols = rs["rank"].columns.get_indexer(pd.Index(symbols))
+    ok = (rows >= 0) & (cols >= 0)
+    out = {}
+    for key in ("score", "rank"):
+        values = np.full(len(rows), np.nan)
+        values[ok] = rs[key].values[rows[ok], cols[ok]]
+        out[key] = values
+    return out
+
+if __name__ == "__main__":
+    import sys
+
+    start = time.time()
+    rs = get_rs()
+    print(f"RS {rs['rank'].shape[1]} ma x {rs['rank'].shape[0]} ngay, {time.time() - start:.2f}s")
+
+    symbols = [a.upper() for a in sys.argv[1:]]
+    if symbols:
+        for symbol in symbols:
+            history = rs_history(symbol)
+            if history is None:
+                print(f"{symbol}: khong co du lieu")
+                continue
+            print(f"\n{symbol}")
+            print(history.dropna().tail(10).to_string())
+    else:
+        latest = rs["rank"].ffill().iloc[-1].dropna().sort_values(ascending=False)
+        print(f"\n{'Ma':<8} {'RS':>4} {'Diem':>9}")
+        for symbol, value in latest.head(20).items():
+            print(f"{symbol:<8} {value:>4.0f} {rs['score'][symbol].dropna().iloc[-1]:>+8.1f}%")
@@ -1,16 +1,66 @@
 """
-Quét và lọc cổ phiếu theo tín hiệu kỹ thuật
-Sử dụng: python scan_stocks.py
+Quét và lọc cổ phiếu theo tín hiệu kỹ thuật (tín hiệu và đánh giá khai báo ở SCAN_RULES)
+Sử dụng: python scan_stocks.py [--jobs 4] [--timing] | --benchmark [N]
 """
 
 import pandas as pd
+import numpy as np
 import os
+import time
 import yfinance as yf
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import scoring_rules
+from data_store import load_data
 
 # Danh sách mã cần quét
 SCAN_SYMBOLS = ["FPT", "VHM", "ANV", "VCB", "SCB", "VNM"]
 
+# Mẫu nến (tên luật trong SCAN_RULES), theo thứ tự hiển thị
+CANDLE_PATTERNS = ["doji", "hammer", "bullish_engulfing", "bearish_engulfing"]
+
+# Tín hiệu quét: mỗi luật cộng 1 điểm đánh giá nếu là tín hiệu tốt; từ 3 điểm là "CO THE MUA"
+SCAN_RULES = scoring_rules.compile_rules({
+    "max_score": 4,
+    "variables": {
+        "vol_ratio": lambda v: np.where(v["vol_ma20"] > 0, v["volume"] / v["vol_ma20"], 0),
+        "golden_cross": "ma20 > ma50 and prev_ma20 <= prev_ma50",
+        "death_cross": "ma20 < ma50 and prev_ma20 >= prev_ma50",
+        "is_hammer": "lower_shadow > body_abs * 2 and upper_shadow < body_abs * 0.5",
+        "is_bullish_engulfing": "body > 0 and prev_body < 0 and open < prev_close and close > prev_open",
+    },
+    "rules": [
+        {"name": "ma_signal", "bands": [
+            ("golden_cross", 1, "bullish", "BUY (Golden Cross)"),
+            ("death_cross", 0, "bearish", "SELL (Death Cross)"),
+            ("ma20 > ma50", 1, "bullish", "BULLISH"),
+            ("ma20 < ma50", 0, "bearish", "BEARISH"),
+        ], "default": (0, "neutral", "NEUTRAL")},
+        {"name": "rsi_signal", "bands": [
+            ("rsi < 30", 1, "bullish", "OVERSOLD (Qua ban)"),
+            ("rsi > 70", 0, "bearish", "OVERBOUGHT (Qua mua)"),
+        ], "default": (0, "neutral", "NEUTRAL")},
+        # Mẫu nến
+        {"name": "doji", "bands": [("body_abs < range * 0.1", 0, "neutral", "Doji")]},
+        {"name": "hammer", "bands": [("is_hammer", 0, "bullish", "Hammer")]},
+        {"name": "bullish_engulfing", "bands": [("is_bullish_engulfing", 0, "bullish", "Bullish Engulfing")]},
+        {"name": "bearish_engulfing", "bands": [
+            ("body < 0 and prev_body > 0 and open > prev_close and close < prev_open", 0, "bearish", "Bearish Engulfing"),
+        ]},
+        {"name": "bullish_candle", "bands": [("is_hammer or is_bullish_engulfing", 1, None, None)]},
+        {"name": "vol_signal", "bands": [
+            ("vol_ratio > 2", 0, "bullish", "VERY HIGH"),
+            ("vol_ratio > 1.5", 0, "bullish", "HIGH"),
+            ("vol_ratio < 0.5", 0, "bearish", "LOW"),
+        ], "default": (0, "neutral", "NORMAL")},
+        {"name": "trend", "bands": [("ret_5d > 0", 1, None, None)]},
+        # Cảnh báo khi đánh giá thấp: quá mua hoặc vừa Death Cross
+        {"name": "caution", "bands": [("rsi > 70 or death_cross", 0, "bearish", "CAN THAN")]},
+    ],
+    "ratings": [(3, "CO THE MUA"), (-np.inf, None)],
+    "rating_keys": ["verdict"],
+})
+
 def download_if_needed(symbol: str):
     """Tải dữ liệu nếu chưa có"""
     csv_path = f"data/{symbol}.csv"
@@ -28,130 +78,33 @@ def download_if_needed(symbol: str):
             return False
     return True
 
-def load_data(csv_path: str) -> pd.DataFrame:
-    """Đọc CSV từ yfinance"""
-    try:
-        df = pd.read_csv(csv_path, header=[0, 1], index_col=0)
-        df.columns = [col[0] for col in df.columns]
-    except:
-        df = pd.read_csv(csv_path, index_col=0)
-    
-    df = df.reset_index()
-    df.columns.values[0] = "Date"
-    
-    if df["Date"].dtype == object:
-        df = df[df["Date"].str.match(r"^\d{4}-\d{2}-\d{2}", na=False)].copy()
-    
-    df["Date"] = pd.to_datetime(df["Date"])
-    for col in ["Open", "High", "Low", "Close", "Volume"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    
-    df = df.set_index("Date")
-    return df
-
 def analyze_stock(df: pd.DataFrame, symbol: str) -> dict:
     """Phân tích kỹ thuật cho 1 mã"""
     if len(df) < 50:
         return None
     
-    df = df.copy()
-    
-    # Giá hiện tại
-    current_price = df["Close"].iloc[-1]
-    prev_price = df["Close"].iloc[-2]
-    change_pct = (current_price - prev_price) / prev_price * 100
-    
-    # MA
-    df["MA20"] = df["Close"].rolling(20).mean()
-    df["MA50"] = df["Close"].rolling(50).mean()
-    
-    ma20 = df["MA20"].iloc[-1]
-    ma50 = df["MA50"].iloc[-1]
-    
-    # Tín hiệu MA crossover
-    ma_signal = "NEUTRAL"
-    if df["MA20"].iloc[-1] > df["MA50"].iloc[-1] and df["MA20"].iloc[-2] <= df["MA50"].iloc[-2]:
-        ma_signal = "BUY (Golden Cross)"
-    elif df["MA20"].iloc[-1] < df["MA50"].iloc[-1] and df["MA20"].iloc[-2] >= df["MA50"].iloc[-2]:
-        ma_signal = "SELL (Death Cross)"
-    elif df["MA20"].iloc[-1] > df["MA50"].iloc[-1]:
-        ma_signal = "BULLISH"
-    elif df["MA20"].iloc[-1] < df["MA50"].iloc[-1]:
-        ma_signal = "BEARISH"
-    
-    # RSI
-    delta = df["Close"].diff()
-    gain = delta.where(delta > 0, 0).rolling(14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-    rs = gain / loss
-    df["RSI"] = 100 - (100 / (1 + rs))
-    rsi = df["RSI"].iloc[-1]
-    
-    rsi_signal = "NEUTRAL"
-    if rsi < 30:
-        rsi_signal = "OVERSOLD (Qua ban)"
-    elif rsi > 70:
-        rsi_signal = "OVERBOUGHT (Qua mua)"
-    
-    # Mẫu nến
-    df["body"] = df["Close"] - df["Open"]
-    df["body_abs"] = abs(df["body"])
-    df["upper_shadow"] = df["High"] - df[["Open", "Close"]].max(axis=1)
-    df["lower_shadow"] = df[["Open", "Close"]].min(axis=1) - df["Low"]
-    df["range"] = df["High"] - df["Low"]
-    
-    candle_patterns = []
-    last = df.iloc[-1]
-    prev = df.iloc[-2]
-    
-    # Doji
-    if last["body_abs"] < last["range"] * 0.1:
-        candle_patterns.append("Doji")
-    
-    # Hammer
-    if last["lower_shadow"] > last["body_abs"] * 2 and last["upper_shadow"] < last["body_abs"] * 0.5:
-        candle_patterns.append("Hammer")
-    
-    # Bullish Engulfing
-    if last["body"] > 0 and prev["body"] < 0:
-        if last["Open"] < prev["Close"] and last["Close"] > prev["Open"]:
-            candle_patterns.append("Bullish Engulfing")
-    
-    # Bearish Engulfing
-    if last["body"] < 0 and prev["body"] > 0:
-        if last["Open"] > prev["Close"] and last["Close"] < prev["Open"]:
-            candle_patterns.append("Bearish Engulfing")
-    
-    # Volume
-    avg_vol = df["Volume"].rolling(20).mean().iloc[-1]
-    current_vol = df["Volume"].iloc[-1]
-    vol_ratio = current_vol / avg_vol if avg_vol > 0 else 0
-    
-    vol_signal = "NORMAL"
-    if vol_ratio > 2:
-        vol_signal = "VERY HIGH"
-    elif vol_ratio > 1.5:
-        vol_signal = "HIGH"
-    elif vol_ratio < 0.5:
-        vol_signal = "LOW"
-    
-    # Xu hướng 5 ngày
-    trend_5d = (df["Close"].iloc[-1] - df["Close"].iloc[-5]) / df["Close"].iloc[-5] * 100
+    data = {col.lower(): df[col] for col in ["Open", "High", "Low", "Close", "Volume"]}
+    result = scoring_rules.evaluate(SCAN_RULES, data)
+    values = result["values"]
+    details = scoring_rules.details(SCAN_RULES, result, -1)
+    score = int(result["score"][-1])
     
     return {
         "symbol": symbol,
-        "price": current_price,
-        "change_pct": change_pct,
-        "ma20": ma20,
-        "ma50": ma50,
-        "ma_signal": ma_signal,
-        "rsi": rsi,
-        "rsi_signal": rsi_signal,
-        "candle_patterns": candle_patterns,
-        "vol_ratio": vol_ratio,
-        "vol_signal": vol_signal,
-        "trend_5d": trend_5d,
+        "price": df["Close"].iloc[-1],
+        "change_pct": values["change"][-1],
+        "ma20": values["ma20"][-1],
+        "ma50": values["ma50"][-1],
+        "ma_signal": details["ma_signal"],
+        "rsi": values["rsi"][-1],
+        "rsi_signal": details["rsi_signal"],
+        "candle_patterns": [details[name] for name in CANDLE_PATTERNS if name in details],
+        "vol_ratio": values["vol_ratio"][-1],
+        "vol_signal": details["vol_signal"],
+        "trend_5d": values["ret_5d"][-1],
+        "score": score,
+        "verdict": scoring_rules.rate(SCAN_RULES, [score])["verdict"][0],
+        "caution": "caution" in details,
         "last_date": df.index[-1].strftime("%Y-%m-%d")
     }
 
@@ -170,41 +123,73 @@ def print_analysis(result: dict):
     if result['candle_patterns']:
         print(f"  Mau nen: {', '.join(result['candle_patterns'])}")
     
-    # Đánh giá tổng hợp
-    score = 0
-    if "BUY" in result['ma_signal'] or result['ma_signal'] == "BULLISH":
-        score += 1
-    if result['rsi_signal'] == "OVERSOLD (Qua ban)":
-        score += 1
-    if "Bullish" in str(result['candle_patterns']) or "Hammer" in str(result['candle_patterns']):
-        score += 1
-    if result['trend_5d'] > 0:
-        score += 1
-    
-    if score >= 3:
-        print(f"  >>> DANH GIA: CO THE MUA <<<")
-    elif score <= 1 and (result['rsi_signal'] == "OVERBOUGHT (Qua mua)" or "SELL" in result['ma_signal']):
+    # Đánh giá tổng hợp (điểm theo SCAN_RULES)
+    if result['verdict']:
+        print(f"  >>> DANH GIA: {result['verdict']} <<<")
+    elif result['score'] <= 1 and result['caution']:
         print(f"  >>> DANH GIA: CAN THAN <<<")
 
-def scan_all():
-    """Quét tất cả các mã"""
+def _analyze_one(symbol: str):
+    """Phân tích 1 mã (chạy được trong tiến trình con), trả về (mã, kết quả, lỗi, số giây)"""
+    start = time.perf_counter()
+    try:
+        df = load_data(f"data/{symbol}.csv")
+        result, error = analyze_stock(df, symbol), None
+    except Exception as e:
+        result, error = None, str(e)
+    return symbol, result, error, time.perf_counter() - start
+
+def analyze_all(symbols: list, jobs: int = 1) -> list:
+    """Phân tích nhiều mã, jobs > 1 thì chia cho ProcessPoolExecutor theo từng lô
+    Kết quả giữ đúng thứ tự `symbols`: [(mã, kết quả, lỗi, số giây)]"""
+    if jobs <= 1 or len(symbols) <= 1:
+        return list(map(_analyze_one, symbols))
+    chunksize = max(1, len(symbols) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(_analyze_one, symbols, chunksize=chunksize))
+
+def benchmark(max_jobs: int = None, symbols: list = None):
+    """Đo thời gian phân tích với 1, 2, 4, ... tiến trình (mặc định: mọi mã đã có dữ liệu)"""
+    symbols = symbols or sorted(f.replace(".csv", "") for f in os.listdir("data") if f.endswith(".csv"))
+    max_jobs = max_jobs or os.cpu_count() or 1
+    
+    jobs_list = [1]
+    while jobs_list[-1] * 2 <= max_jobs:
+        jobs_list.append(jobs_list[-1] * 2)
+    if jobs_list[-1] != max_jobs:
+        jobs_list.append(max_jobs)
+    
+    print(f"\nBenchmark quet {len(symbols)} ma (CPU: {os.cpu_count()})")
+    print(f"{'Jobs':>5} {'Thoi gian':>10} {'Tang toc':>9}")
+    base = None
+    for jobs in jobs_list:
+        start = time.perf_counter()
+        analyze_all(symbols, jobs)
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print(f"{jobs:>5} {elapsed:>9.2f}s {base / elapsed:>8.2f}x")
+
+def scan_all(jobs: int = 1, show_timing: bool = False):
+    """Quét tất cả các mã (jobs > 1: phân tích song song nhiều tiến trình)"""
     print("\n" + "="*60)
     print("   QUET CO PHIEU - " + datetime.now().strftime("%Y-%m-%d %H:%M"))
     print("="*60)
     
     results = []
     
-    for symbol in SCAN_SYMBOLS:
-        if download_if_needed(symbol):
-            csv_path = f"data/{symbol}.csv"
-            try:
-                df = load_data(csv_path)
-                result = analyze_stock(df, symbol)
-                if result:
-                    results.append(result)
-                    print_analysis(result)
-            except Exception as e:
-                print(f"\nLoi khi phan tich {symbol}: {e}")
+    # Tải dữ liệu còn thiếu (tuần tự, theo mạng) rồi mới phân tích
+    symbols = [symbol for symbol in SCAN_SYMBOLS if download_if_needed(symbol)]
+    
+    start = time.perf_counter()
+    outputs = analyze_all(symbols, jobs)
+    elapsed = time.perf_counter() - start
+    
+    for symbol, result, error, _ in outputs:
+        if error:
+            print(f"\nLoi khi phan tich {symbol}: {error}")
+        elif result:
+            results.append(result)
+            print_analysis(result)
     
     # Tổng kết
     print("\n" + "="*60)
@@ -240,6 +225,24 @@ def scan_all():
         
         if notes:
             print(f"  - {r['symbol']}: {', '.join(notes)}")
+    
+    if show_timing:
+        total = sum(o[3] for o in outputs)
+        print(f"\nThoi gian: {elapsed:.2f}s thuc te, {total:.2f}s tong theo ma")
+        for symbol, _, _, seconds in sorted(outputs, key=lambda o: -o[3]):
+            print(f"  {symbol:<8} {seconds * 1000:>7.0f}ms")
 
 if __name__ == "__main__":
-    scan_all()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Quet co phieu theo tin hieu ky thuat")
+    parser.add_argument("--jobs", type=int, default=1, help="So tien trinh phan tich song song")
+    parser.add_argument("--timing", action="store_true", help="In thoi gian phan tich theo ma")
+    parser.add_argument("--benchmark", type=int, nargs="?", const=0, default=None,
+                        help="Do thoi gian voi 1..N tien trinh tren moi ma da co du lieu")
+    args = parser.parse_args()
+    
+    if args.benchmark is not None:
+        benchmark(args.benchmark or None)
+    else:
+        scan_all(jobs=args.jobs, show_timing=args.timing)
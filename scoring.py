@@ -0,0 +1,235 @@
+"""
+Chấm điểm cổ phiếu - Chỉ báo kỹ thuật và thang điểm AI (0-100) dùng chung cho web app và screener
+Thang điểm khai báo ở AI_RULES (scoring_rules), cùng 1 lần tính cho nến cuối, mọi ngày của 1 mã hoặc cả bảng nhiều mã
+Sử dụng: python scoring.py [MA ...] [--verify]
+"""
+
+import pandas as pd
+import numpy as np
+import data_store
+import scoring_rules
+
+# Xếp hạng theo điểm: (điểm tối thiểu, rating, khuyến nghị, class CSS), xét từ trên xuống
+RATINGS = [
+    (80, "A+", "MUA MẠNH", "buy-strong"),
+    (70, "A", "NÊN MUA", "buy"),
+    (60, "B+", "THEO DÕI ĐỂ MUA", "watch"),
+    (50, "B", "TRUNG LẬP", "neutral"),
+    (40, "C", "CẨN THẬN", "caution"),
+    (-np.inf, "D", "TRÁNH", "avoid"),
+]
+
+# Số nến tối thiểu để chấm điểm
+MIN_BARS = 50
+
+# Thang điểm AI: mỗi luật chọn mức đầu tiên thỏa điều kiện (so sánh với NaN là False nên rơi vào mặc định)
+AI_RULES = scoring_rules.compile_rules({
+    "max_score": 100,
+    "variables": {
+        "vol_ratio": lambda v: np.where(v["vol_ma20"] > 0, v["volume"] / v["vol_ma20"], 1),
+        "bb_pos": lambda v: np.where(v["bb_upper"] != v["bb_lower"],
+                                     (v["close"] - v["bb_lower"]) / (v["bb_upper"] - v["bb_lower"]), 0.5),
+        "ret_5d_abs": lambda v: np.abs(v["ret_5d"]),
+    },
+    "rules": [
+        # 1. Xu hướng MA (25 điểm)
+        {"name": "ma_trend", "bands": [
+            ("close > ma20 and ma20 > ma50", 25, "bullish", "Giá trên MA20 và MA50 - Xu hướng tăng mạnh"),
+            ("close > ma20", 15, "bullish", "Giá trên MA20 - Xu hướng tăng"),
+            ("close < ma20 and ma20 < ma50", 0, "bearish", "Giá dưới MA20 và MA50 - Xu hướng giảm"),
+        ], "default": (10, "neutral", "Xu hướng chưa rõ ràng")},
+        # Golden/Death Cross
+        {"name": "ma_cross", "bands": [
+            ("prev_ma20 <= prev_ma50 and ma20 > ma50", 10, "bullish", "🔥 GOLDEN CROSS - Tín hiệu mua mạnh!"),
+            ("prev_ma20 >= prev_ma50 and ma20 < ma50", -10, "bearish", "⚠️ DEATH CROSS - Tín hiệu bán!"),
+        ]},
+        # 2. RSI (20 điểm)
+        {"name": "rsi", "bands": [
+            ("rsi >= 30 and rsi <= 40", 20, "bullish", "RSI {rsi:.0f} - Gần vùng quá bán, cơ hội mua"),
+            ("rsi < 30", 15, "bullish", "RSI {rsi:.0f} - Quá bán, có thể hồi phục"),
+            ("rsi >= 40 and rsi <= 60", 15, "neutral", "RSI {rsi:.0f} - Vùng trung tính"),
+            ("rsi > 60 and rsi <= 70", 10, "neutral", "RSI {rsi:.0f} - Đang mạnh"),
+        ], "default": (5, "bearish", "RSI {rsi:.0f} - Quá mua, cẩn thận")},
+        # 3. MACD (20 điểm)
+        {"name": "macd", "bands": [
+            ("macd > macd_signal", 15, "bullish", "MACD trên Signal - Động lượng tăng"),
+        ], "default": (5, "bearish", "MACD dưới Signal - Động lượng giảm")},
+        {"name": "macd_cross", "bands": [
+            ("prev_macd <= prev_macd_signal and macd > macd_signal", 5, "bullish", "MACD vừa cắt lên Signal!"),
+        ]},
+        # 4. Volume (15 điểm)
+        {"name": "volume", "bands": [
+            ("vol_ratio > 1.5", 15, "bullish", "Volume cao gấp {vol_ratio:.1f}x - Có sự quan tâm"),
+            ("vol_ratio > 1", 10, "neutral", "Volume bình thường ({vol_ratio:.1f}x)"),
+        ], "default": (5, "bearish", "Volume thấp ({vol_ratio:.1f}x)")},
+        # 5. Bollinger Bands (10 điểm)
+        {"name": "bollinger", "bands": [
+            ("bb_pos < 0.2", 10, "bullish", "Giá gần đáy Bollinger - Cơ hội mua"),
+            ("bb_pos > 0.8", 3, "bearish", "Giá gần đỉnh Bollinger - Cẩn thận"),
+        ], "default": (7, "neutral", "Giá trong vùng Bollinger an toàn")},
+        # 6. Xu hướng ngắn hạn (10 điểm)
+        {"name": "trend_5d", "bands": [
+            ("ret_5d > 3", 10, "bullish", "Tăng {ret_5d:.1f}% trong 5 ngày"),
+            ("ret_5d > 0", 7, "neutral", "Tăng nhẹ {ret_5d:.1f}% trong 5 ngày"),
+        ], "default": (3, "bearish", "Giảm {ret_5d_abs:.1f}% trong 5 ngày")},
+    ],
+    "ratings": RATINGS,
+    "rating_keys": ["rating", "recommendation", "rec_class"],
+})
+
+# Cột chỉ báo của calculate_indicators -> tên biến trong scoring_rules.INDICATORS
+INDICATOR_COLUMNS = {
+    "MA20": "ma20", "MA50": "ma50", "RSI": "rsi", "MACD": "macd", "MACD_Signal": "macd_signal",
+    "BB_Mid": "bb_mid", "BB_Upper": "bb_upper", "BB_Lower": "bb_lower", "Vol_MA20": "vol_ma20",
+}
+
+def indicator_columns(close, volume) -> dict:
+    """Các cột chỉ báo từ giá đóng cửa và khối lượng
+    Dùng được cho 1 mã (Series) hoặc nhiều mã cùng lúc (DataFrame, mỗi cột 1 mã)"""
+    v = scoring_rules.Variables({"close": close, "volume": volume})
+    if isinstance(close, pd.DataFrame):
+        wrap = lambda values: pd.DataFrame(values, index=close.index, columns=close.columns)
+    else:
+        wrap = lambda values: pd.Series(values, index=close.index)
+    return {col: wrap(v[name]) for col, name in INDICATOR_COLUMNS.items()}
+
+def calculate_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    """Tính các chỉ báo kỹ thuật"""
+    df = df.copy()
+    for name, values in indicator_columns(df["Close"], df["Volume"]).items():
+        df[name] = values
+    return df
+
+def ai_analyze(df: pd.DataFrame, symbol: str, realtime_price: dict = None) -> dict:
+    """AI phân tích và đánh giá cổ phiếu"""
+    if len(df) < MIN_BARS:
+        return {"error": "Không đủ dữ liệu"}
+    
+    return analyze_indicators(calculate_indicators(df), symbol, realtime_price)
+
+def analyze_indicators(df: pd.DataFrame, symbol: str, realtime_price: dict = None) -> dict:
+    """Chấm điểm từ dữ liệu đã có chỉ báo (kết quả calculate_indicators, ít nhất 5 nến)"""
+    # 5 nến cuối (đủ cho cắt MA/MACD và xu hướng 5 ngày): giá, khối lượng và các cột chỉ báo
+    cols = ["Close", "Volume"] + list(INDICATOR_COLUMNS)
+    tail = df.to_numpy(dtype=float)[-5:, df.columns.get_indexer(cols)].T
+    close, volume = tail[0], tail[1]
+    seed = dict(zip(INDICATOR_COLUMNS.values(), tail[2:]))
+    
+    # Sử dụng giá realtime nếu có (thay giá nến cuối khi chấm)
+    if realtime_price:
+        current_price = realtime_price["price"]
+        price_change = realtime_price["change_pct"]
+        updated_time = realtime_price["updated"]
+    else:
+        current_price = float(close[-1])
+        price_change = float((close[-1] - close[-2]) / close[-2] * 100)
+        updated_time = df.index[-1].strftime("%Y-%m-%d")
+    close[-1] = current_price
+    
+    result = scoring_rules.evaluate(AI_RULES, {"close": close, "volume": volume}, seed)
+    score = int(result["score"][-1])
+    
+    # Xếp hạng
+    _, rating, recommendation, rec_class = next(r for r in RATINGS if score >= r[0])
+    
+    return {
+        "symbol": symbol,
+        "price": current_price,
+        "change": price_change,
+        "score": score,
+        "max_score": AI_RULES["max_score"],
+        "rating": rating,
+        "recommendation": recommendation,
+        "rec_class": rec_class,
+        "signals": scoring_rules.signals(AI_RULES, result, -1),
+        "indicators": {
+            "rsi": float(seed["rsi"][-1]),
+            "macd": float(seed["macd"][-1]),
+            "macd_signal": float(seed["macd_signal"][-1]),
+            "ma20": float(seed["ma20"][-1]),
+            "ma50": float(seed["ma50"][-1]),
+            "vol_ratio": float(result["values"]["vol_ratio"][-1])
+        },
+        "updated": updated_time
+    }
+
+# ============ CHẤM ĐIỂM VECTOR HÓA (LỊCH SỬ ĐIỂM) ============
+
+def score_arrays(close, volume, ind: dict) -> np.ndarray:
+    """Điểm AI của mọi nến cùng lúc theo AI_RULES, dùng chỉ báo đã tính (kết quả indicator_columns)
+    Mảng 1 chiều (1 mã) hoặc 2 chiều (nến x mã); NaN khi chưa đủ MIN_BARS nến"""
+    seed = {INDICATOR_COLUMNS[col]: values for col, values in ind.items()}
+    score = scoring_rules.evaluate(AI_RULES, {"close": close, "volume": volume}, seed)["score"]
+    score[:MIN_BARS - 1] = np.nan
+    return score
+
+def rate_scores(score: np.ndarray) -> dict:
+    """Rating / khuyến nghị / class của mảng điểm (None ở chỗ không có điểm)"""
+    return scoring_rules.rate(AI_RULES, score)
+
+def score_history(df: pd.DataFrame) -> pd.DataFrame:
+    """Điểm và xếp hạng AI tại mọi ngày của 1 mã trong 1 lần tính
+    Dòng cuối trùng với ai_analyze(df); NaN / None khi chưa đủ MIN_BARS nến"""
+    ind = indicator_columns(df["Close"], df["Volume"])
+    score = score_arrays(df["Close"], df["Volume"], ind)
+    history = pd.DataFrame({"score": score}, index=df.index)
+    for key, values in rate_scores(score).items():
+        history[key] = values
+    return history
+
+def score_panel(panel: dict = None) -> dict:
+    """Điểm AI của mọi ngày x mọi mã trong 1 lần tính trên bảng nhiều mã (data_store.load_panel)
+    Mỗi mã tính trên chuỗi nến riêng (bỏ ngày chưa niêm yết / không giao dịch) nên trùng score_history từng mã
+    Trả về {"score": bảng điểm (ngày x mã), "rating": bảng rating}"""
+    panel = data_store.load_panel() if panel is None else panel
+    close, rank, valid = data_store.compact_columns(panel["Close"])
+    volume = data_store.compact_columns(panel["Volume"].where(panel["Close"].notna()))[0]
+    
+    ind = indicator_columns(pd.DataFrame(close), pd.DataFrame(volume))
+    score = data_store.expand_columns(score_arrays(close, volume, ind), rank, valid, panel["Close"])
+    rating = pd.DataFrame(rate_scores(score.values)["rating"], index=score.index, columns=score.columns)
+    return {"score": score, "rating": rating}
+
+def verify_history(symbols: list = None, cuts: int = 20) -> list:
+    """So lịch sử điểm vector hóa với ai_analyze tại `cuts` điểm cắt của mỗi mã và với score_panel
+    Trả về danh sách chỗ lệch (mã, ngày, điểm vector, điểm ai_analyze)"""
+    symbols = data_store.list_symbols() if symbols is None else symbols
+    panel = score_panel(data_store.load_panel(symbols))
+    mismatches = []
+    
+    for symbol in symbols:
+        df, _ = data_store.load_symbol(symbol)
+        if df is None or len(df) < MIN_BARS:
+            continue
+        history = score_history(df)
+        ends = np.unique(np.linspace(MIN_BARS, len(df), cuts).astype(int))
+        for end in ends:
+            expected = ai_analyze(df.iloc[:end], symbol)
+            row = history.iloc[end - 1]
+            if row["score"] != expected["score"] or row["rating"] != expected["rating"]:
+                mismatches.append((symbol, df.index[end - 1], row["score"], expected["score"]))
+        
+        from_panel = panel["score"][symbol].dropna()
+        if not from_panel.equals(history["score"].dropna()):
+            mismatches.append((symbol, "panel", None, None))
+    return mismatches
+
+if __name__ == "__main__":
+    import sys
+    import time
+    
+    symbols = [a.upper() for a in sys.argv[1:] if not a.startswith("--")] or None
+    
+    if "--verify" in sys.argv:
+        start = time.time()
+        bad = verify_history(symbols)
+        for symbol, date, got, expected in bad[:20]:
+            print(f"LECH {symbol} {date}: vector={got} ai_analyze={expected}")
+        print(f"{'OK' if not bad else f'{len(bad)} cho lech'} - {time.time() - start:.1f}s")
+        raise SystemExit(1 if bad else 0)
+    
+    start = time.time()
+    result = score_panel(data_store.load_panel(symbols))
+    latest = result["score"].ffill().iloc[-1].sort_values(ascending=False)
+    print(f"Lich su diem {result['score'].shape[1]} ma x {result['score'].shape[0]} ngay, {time.time() - start:.2f}s")
+    print(latest.head(20).to_string())
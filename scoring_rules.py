@@ -0,0 +1,244 @@
+"""
+Luật chấm điểm khai báo - Mỗi luật gồm các mức (điều kiện, điểm, loại tín hiệu, câu tín hiệu) xét từ trên xuống
+Điều kiện viết bằng biểu thức của screener_query (vd "close > ma20 and ma20 > ma50"), được biên dịch 1 lần
+rồi tính bằng NumPy trên cả mảng: 1 mã (mảng nến) hoặc nhiều mã cùng lúc (mảng nến x mã)
+Sử dụng: python scoring_rules.py  # In các bộ luật đang dùng
+"""
+
+import string
+import numpy as np
+import pandas as pd
+import screener_query
+from screener_query import QueryError
+
+# ============ CHỈ BÁO ============
+
+def _frame(values: np.ndarray):
+    """Series (1 mã) hoặc DataFrame (nến x mã) để dùng rolling / ewm của pandas"""
+    return pd.Series(values) if values.ndim == 1 else pd.DataFrame(values)
+
+def shift(values: np.ndarray, n: int) -> np.ndarray:
+    """Dời mảng xuống n nến theo trục thời gian (trục 0), đầu mảng là NaN"""
+    out = np.full(values.shape, np.nan)
+    out[n:] = values[:-n]
+    return out
+
+def _rsi(v) -> np.ndarray:
+    delta = _frame(v["close"]).diff()
+    gain = delta.where(delta > 0, 0).rolling(14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+    rs = gain / loss
+    return (100 - (100 / (1 + rs))).to_numpy()
+
+def _macd(v) -> np.ndarray:
+    close = _frame(v["close"])
+    return (close.ewm(span=12).mean() - close.ewm(span=26).mean()).to_numpy()
+
+# Chỉ báo dùng được trong điều kiện: tên -> hàm tính từ các biến khác (chỉ tính khi luật cần đến)
+# Thêm tiền tố prev_ để lấy giá trị của nến trước (vd prev_ma20)
+INDICATORS = {
+    "ma20": lambda v: _frame(v["close"]).rolling(20).mean().to_numpy(),
+    "ma50": lambda v: _frame(v["close"]).rolling(50).mean().to_numpy(),
+    "ma200": lambda v: _frame(v["close"]).rolling(200).mean().to_numpy(),
+    "rsi": _rsi,
+    "macd": _macd,
+    "macd_signal": lambda v: _frame(v["macd"]).ewm(span=9).mean().to_numpy(),
+    "bb_mid": lambda v: _frame(v["close"]).rolling(20).mean().to_numpy(),
+    "bb_std": lambda v: _frame(v["close"]).rolling(20).std().to_numpy(),
+    "bb_upper": lambda v: v["bb_mid"] + 2 * v["bb_std"],
+    "bb_lower": lambda v: v["bb_mid"] - 2 * v["bb_std"],
+    "bb_pos": lambda v: (v["close"] - v["bb_lower"]) / (v["bb_upper"] - v["bb_lower"]),
+    "vol_ma20": lambda v: _frame(v["volume"]).rolling(20).mean().to_numpy(),
+    "vol_ratio": lambda v: v["volume"] / v["vol_ma20"],
+    "low_14": lambda v: _frame(v["low"]).rolling(14).min().to_numpy(),
+    "high_14": lambda v: _frame(v["high"]).rolling(14).max().to_numpy(),
+    "stoch": lambda v: 100 * (v["close"] - v["low_14"]) / (v["high_14"] - v["low_14"]),
+    # Lợi nhuận so với giá đóng cửa 4 nến trước (5 phiên tính cả phiên hiện tại)
+    "ret_5d": lambda v: (v["close"] - shift(v["close"], 4)) / shift(v["close"], 4) * 100,
+    "change": lambda v: (v["close"] - v["prev_close"]) / v["prev_close"] * 100,
+    # Thân nến và bóng nến
+    "body": lambda v: v["close"] - v["open"],
+    "body_abs": lambda v: np.abs(v["body"]),
+    "upper_shadow": lambda v: v["high"] - np.fmax(v["open"], v["close"]),
+    "lower_shadow": lambda v: np.fmin(v["open"], v["close"]) - v["low"],
+    "range": lambda v: v["high"] - v["low"],
+}
+
+class Variables(dict):
+    """Các biến của 1 lần chấm: giá gốc, chỉ báo truyền sẵn và chỉ báo tính khi được dùng lần đầu
+    Thứ tự tìm: biến riêng của bộ luật, INDICATORS, tiền tố prev_"""
+
+    def __init__(self, data: dict, derived: dict = None):
+        super().__init__({name: np.asarray(values, dtype=float) for name, values in data.items()})
+        self.derived = derived or {}
+
+    def __missing__(self, name: str):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if name in self.derived:
+                value = self.derived[name](self)
+            elif name in INDICATORS:
+                value = INDICATORS[name](self)
+            elif name.startswith("prev_"):
+                value = shift(self[name[len("prev_"):]], 1)
+            else:
+                raise QueryError(f"Không có biến {name!r} (chỉ báo: {', '.join(sorted(INDICATORS))})")
+        value = np.asarray(value)
+        if value.dtype != bool:
+            value = value.astype(float)
+        self[name] = value
+        return value
+
+# ============ BIÊN DỊCH VÀ CHẤM ============
+
+_BINARY = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.true_divide}
+_COMPARE = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+            "==": np.equal, "!=": np.not_equal}
+
+def _compile_node(node):
+    """Biên dịch cây biểu thức của screener_query thành hàm NumPy f(v) (chỉ biến số, cùng ngữ nghĩa NaN)"""
+    kind = node[0]
+    if kind == "num":
+        value = node[1]
+        return lambda v: value
+    if kind == "col":
+        name = node[1]
+        return lambda v: v[name]
+    if kind == "neg":
+        inner = _compile_node(node[1])
+        return lambda v: -inner(v)
+    if kind == "bin":
+        op, left, right = _BINARY[node[1]], _compile_node(node[2]), _compile_node(node[3])
+        return lambda v: op(left(v), right(v))
+    if kind == "cmp":
+        op, left, right = _COMPARE[node[1]], _compile_node(node[2]), _compile_node(node[3])
+        if node[1] == "!=":
+            # Như screener_query: so sánh với NaN luôn là False, kể cả !=
+            return lambda v: _not_equal(left(v), right(v))
+        return lambda v: op(left(v), right(v))
+    if kind in ("and", "or"):
+        op, left, right = (np.logical_and if kind == "and" else np.logical_or), \
+            _compile_node(node[1]), _compile_node(node[2])
+        return lambda v: op(left(v), right(v))
+    if kind == "not":
+        inner = _compile_node(node[1])
+        return lambda v: np.logical_not(inner(v))
+    raise QueryError("Điều kiện của luật chỉ dùng biến số (không so sánh chuỗi)")
+
+def _not_equal(left, right):
+    return np.not_equal(left, right) & ~np.isnan(np.asarray(left, dtype=float) + np.asarray(right, dtype=float))
+
+def _compile_condition(text: str):
+    """Hàm f(v) -> mặt nạ bool của 1 điều kiện (phân tích bằng screener_query rồi biên dịch 1 lần)"""
+    node = screener_query.parse(text)
+    # Gốc phải cho kết quả đúng/sai: so sánh, and/or/not hoặc biến điều kiện của bộ luật
+    if node[0] not in ("cmp", "and", "or", "not", "col"):
+        raise QueryError(f"Điều kiện của luật phải là so sánh (and/or/not): {text!r}")
+    return _compile_node(node)
+
+def _fields(text: str) -> list:
+    """Tên biến dùng trong câu tín hiệu (vd "RSI {rsi:.0f}" -> ["rsi"])"""
+    if text is None:
+        return []
+    return [field for _, field, _, _ in string.Formatter().parse(text) if field]
+
+def compile_rules(spec: dict) -> dict:
+    """Biên dịch bộ luật khai báo: phân tích mọi điều kiện 1 lần, lỗi cú pháp báo ngay khi nạp module
+    spec: {"rules": [{"name", "bands": [(điều kiện, điểm, loại, câu)], "default": (điểm, loại, câu) | None}],
+           "variables": {tên: hàm(v) hoặc biểu thức điều kiện}, "max_score", "ratings", "rating_keys"}
+    Loại / câu là None nếu mức đó chỉ cộng điểm, không tạo tín hiệu"""
+    compiled = dict(spec)
+    compiled["variables"] = {
+        name: _compile_condition(value) if isinstance(value, str) else value
+        for name, value in spec.get("variables", {}).items()
+    }
+    rules = []
+    for rule in spec["rules"]:
+        outcomes = [band[1:] for band in rule["bands"]]
+        if rule.get("default") is not None:
+            outcomes.append(tuple(rule["default"]))
+        rules.append({
+            "name": rule["name"],
+            "conditions": [_compile_condition(band[0]) for band in rule["bands"]],
+            "has_default": rule.get("default") is not None,
+            # Điểm theo chỉ số mức được chọn, phần tử cuối (chỉ số -1) là 0 điểm khi không mức nào thỏa
+            "points": np.array([points for points, _, _ in outcomes] + [0], dtype=float),
+            "outcomes": [(kind, text, _fields(text)) for _, kind, text in outcomes],
+        })
+    compiled["rules"] = rules
+    compiled["spec_rules"] = spec["rules"]
+    return compiled
+
+def evaluate(rules: dict, data: dict, seed: dict = None) -> dict:
+    """Chấm bộ luật đã biên dịch trên mọi nến cùng lúc
+    data: giá gốc (close, open, high, low, volume) dạng mảng nến hoặc nến x mã; seed: chỉ báo đã tính sẵn
+    Trả về {"score": mảng điểm, "choice": {luật: chỉ số mức được chọn (-1: không mức nào)}, "values": Variables}"""
+    v = Variables(data, rules["variables"])
+    for name, values in (seed or {}).items():
+        v[name] = np.asarray(values, dtype=float)
+    shape = v["close"].shape
+
+    score = np.zeros(shape)
+    choice = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for rule in rules["rules"]:
+            # Mức đầu tiên thỏa điều kiện được chọn: gán từ mức cuối lên mức đầu
+            picked = np.full(shape, len(rule["conditions"]) if rule["has_default"] else -1)
+            for i in range(len(rule["conditions"]) - 1, -1, -1):
+                mask = rule["conditions"][i](v)
+                picked[mask if np.shape(mask) == shape else np.broadcast_to(mask, shape)] = i
+            score += rule["points"][picked]
+            choice[rule["name"]] = picked
+    return {"score": score, "choice": choice, "values": v}
+
+def _picked(rules: dict, result: dict, at):
+    """(tên luật, loại, câu đã điền giá trị) của mức được chọn ở từng luật tại 1 vị trí, bỏ mức không có câu"""
+    for rule in rules["rules"]:
+        picked = int(result["choice"][rule["name"]][at])
+        if picked < 0:
+            continue
+        kind, text, fields = rule["outcomes"][picked]
+        if text is not None:
+            values = {name: float(result["values"][name][at]) for name in fields}
+            yield rule["name"], kind, text.format(**values)
+
+def signals(rules: dict, result: dict, at) -> list:
+    """Tín hiệu [{"type", "text"}] tại 1 vị trí (vd -1 hoặc (nến, mã)) theo thứ tự luật"""
+    return [{"type": kind, "text": text} for _, kind, text in _picked(rules, result, at)]
+
+def details(rules: dict, result: dict, at) -> dict:
+    """Câu tín hiệu theo tên luật tại 1 vị trí (chỉ các luật có mức được chọn và có câu)"""
+    return {name: text for name, _, text in _picked(rules, result, at)}
+
+def rate(rules: dict, score: np.ndarray) -> dict:
+    """Xếp hạng theo bảng ratings của bộ luật (điểm tối thiểu, nhãn...), None ở chỗ không có điểm"""
+    score = np.asarray(score, dtype=float)
+    with np.errstate(invalid="ignore"):
+        conds = [score >= r[0] for r in rules["ratings"]]
+    out = {}
+    for i, key in enumerate(rules["rating_keys"], start=1):
+        values = np.select(conds, [np.array(r[i], dtype=object) for r in rules["ratings"]], None)
+        values[np.isnan(score)] = None
+        out[key] = values
+    return out
+
+def describe(rules: dict) -> str:
+    """Bảng luật dạng chữ (tên luật, điều kiện, điểm, câu tín hiệu)"""
+    lines = []
+    for spec_rule, rule in zip(rules["spec_rules"], rules["rules"]):
+        lines.append(f"  {rule['name']}")
+        for band in spec_rule["bands"]:
+            lines.append(f"    {band[1]:>+4}  {band[0]:<60} {band[3] or ''}")
+        if spec_rule.get("default") is not None:
+            lines.append(f"    {spec_rule['default'][0]:>+4}  {'(con lai)':<60} {spec_rule['default'][2] or ''}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    import scoring
+    import stock_screener
+    import scan_stocks
+
+    for title, rules in [("scoring.AI_RULES (web app, screener snapshot)", scoring.AI_RULES),
+                         ("stock_screener.SCREENER_RULES", stock_screener.SCREENER_RULES),
+                         ("scan_stocks.SCAN_RULES", scan_stocks.SCAN_RULES)]:
+        print(f"\n{title}")
+        print(describe(rules))
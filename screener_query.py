@@ -0,0 +1,303 @@
+"""
+Ngôn ngữ lọc/sắp xếp cho screener - vd: where=rsi<35 and vol_ratio>1.5 and close>ma50&sort=-ret_20d
+Biểu thức được phân tích thành cây (không dùng eval) rồi tính bằng phép toán NumPy trên cả cột
+của bảng snapshot, không lặp từng dòng
+Sử dụng: python screener_query.py "rsi<35 and close>ma50" [--sort=-ret_20d] [--limit 20] [--asof 2025-06-02[:2025-06-30]]
+"""
+
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Cột dạng chuỗi (so sánh ==, != với chuỗi trong dấu nháy); các cột còn lại là số
+STRING_COLUMNS = {"symbol", "date", "rating", "recommendation", "rec_class", "data_version", "sector"}
+
+# Cột không dùng được trong biểu thức
+HIDDEN_COLUMNS = {"signals"}
+
+# Tên gọi khác của cột
+ALIASES = {"price": "close", "vol": "volume"}
+
+class QueryError(ValueError):
+    """Biểu thức lọc/sắp xếp không hợp lệ"""
+
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<num>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<op><=|>=|==|!=|<|>|=|\(|\)|\+|-|\*|/)
+  | '(?P<sq>[^']*)'
+  | "(?P<dq>[^"]*)"
+)""", re.VERBOSE)
+
+_COMPARE = {"<", "<=", ">", ">=", "==", "!=", "="}
+_KEYWORDS = {"and", "or", "not"}
+
+def tokenize(text: str) -> list:
+    """Tách biểu thức thành các token (loại, giá trị)"""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if not m or m.end() == pos:
+            raise QueryError(f"Ký tự không hợp lệ tại vị trí {pos}: {text[pos:pos + 10]!r}")
+        pos = m.end()
+        if m.group("num") is not None:
+            tokens.append(("num", float(m.group("num"))))
+        elif m.group("name") is not None:
+            name = m.group("name")
+            tokens.append(("kw", name.lower()) if name.lower() in _KEYWORDS else ("name", name))
+        elif m.group("op") is not None:
+            tokens.append(("op", m.group("op")))
+        else:
+            tokens.append(("str", m.group("sq") if m.group("sq") is not None else m.group("dq")))
+    return tokens
+
+class _Parser:
+    """Phân tích cú pháp đệ quy: or > and > not > so sánh > cộng/trừ > nhân/chia > dấu âm"""
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        tok = self.peek()
+        if tok[0] is None or (kind and tok[0] != kind) or (value and tok[1] != value):
+            expected = value or kind or "token"
+            raise QueryError(f"Cần {expected!r} nhưng gặp {tok[1]!r}")
+        self.i += 1
+        return tok
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek()[0] is not None:
+            raise QueryError(f"Thừa {self.peek()[1]!r} ở cuối biểu thức")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == ("kw", "or"):
+            self.take()
+            node = ("or", node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() == ("kw", "and"):
+            self.take()
+            node = ("and", node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.peek() == ("kw", "not"):
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_compare()
+
+    def parse_compare(self):
+        node = self.parse_sum()
+        kind, value = self.peek()
+        if kind == "op" and value in _COMPARE:
+            self.take()
+            node = ("cmp", "==" if value == "=" else value, node, self.parse_sum())
+        return node
+
+    def parse_sum(self):
+        node = self.parse_term()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            op = self.take()[1]
+            node = ("bin", op, node, self.parse_term())
+        return node
+
+    def parse_term(self):
+        node = self.parse_unary()
+        while self.peek() in (("op", "*"), ("op", "/")):
+            op = self.take()[1]
+            node = ("bin", op, node, self.parse_unary())
+        return node
+
+    def parse_unary(self):
+        if self.peek() == ("op", "-"):
+            self.take()
+            return ("neg", self.parse_unary())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, value = self.peek()
+        if kind == "num":
+            self.take()
+            return ("num", value)
+        if kind == "str":
+            self.take()
+            return ("str", value)
+        if kind == "name":
+            self.take()
+            return ("col", ALIASES.get(value.lower(), value.lower()))
+        if (kind, value) == ("op", "("):
+            self.take()
+            node = self.parse_or()
+            self.take("op", ")")
+            return node
+        raise QueryError(f"Biểu thức không hợp lệ gần {value!r}" if kind else "Biểu thức kết thúc đột ngột")
+
+@lru_cache(maxsize=256)
+def parse(text: str):
+    """Cây biểu thức của 1 chuỗi lọc (cache theo chuỗi)"""
+    tokens = tokenize(text)
+    if not tokens:
+        raise QueryError("Biểu thức rỗng")
+    return _Parser(tokens).parse()
+
+def column_values(table: pd.DataFrame, name: str) -> np.ndarray:
+    """Mảng giá trị của 1 cột (số: float với NaN; chuỗi: mảng object)"""
+    if name == "symbol":
+        return np.asarray(table.index, dtype=object)
+    if name not in table.columns or name in HIDDEN_COLUMNS:
+        usable = sorted(c for c in table.columns if c not in HIDDEN_COLUMNS)
+        raise QueryError(f"Không có cột {name!r} (các cột: symbol, {', '.join(usable)})")
+    if name in STRING_COLUMNS:
+        return table[name].to_numpy(dtype=object)
+    return pd.to_numeric(table[name], errors="coerce").to_numpy(dtype=float)
+
+def evaluate(node, table: pd.DataFrame, columns: dict = None):
+    """Tính cây biểu thức trên cả bảng, trả về mảng (hoặc số/chuỗi nếu là hằng)"""
+    columns = {} if columns is None else columns
+    kind = node[0]
+
+    if kind in ("num", "str"):
+        return node[1]
+    if kind == "col":
+        if node[1] not in columns:
+            columns[node[1]] = column_values(table, node[1])
+        return columns[node[1]]
+    if kind == "neg":
+        value = evaluate(node[1], table, columns)
+        _require_numeric(value, "-")
+        return -value
+    if kind == "bin":
+        left, right = evaluate(node[2], table, columns), evaluate(node[3], table, columns)
+        _require_numeric(left, node[1])
+        _require_numeric(right, node[1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.true_divide}[node[1]](left, right)
+    if kind == "cmp":
+        op, left, right = node[1], evaluate(node[2], table, columns), evaluate(node[3], table, columns)
+        if _is_string(left) or _is_string(right):
+            if op not in ("==", "!="):
+                raise QueryError("Cột chuỗi chỉ so sánh được bằng == hoặc !=")
+            equal = np.equal(np.asarray(left, dtype=object), np.asarray(right, dtype=object))
+            return equal if op == "==" else ~equal
+        with np.errstate(invalid="ignore"):
+            # So sánh với NaN luôn là False (kể cả !=) để dòng thiếu dữ liệu bị loại
+            result = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+                      "==": np.equal, "!=": np.not_equal}[op](left, right)
+            if op == "!=":
+                result = result & ~np.isnan(np.asarray(left, dtype=float) + np.asarray(right, dtype=float))
+            return result
+    if kind in ("and", "or"):
+        left, right = evaluate(node[1], table, columns), evaluate(node[2], table, columns)
+        _require_bool(left, kind)
+        _require_bool(right, kind)
+        return (np.logical_and if kind == "and" else np.logical_or)(left, right)
+    if kind == "not":
+        value = evaluate(node[1], table, columns)
+        _require_bool(value, "not")
+        return np.logical_not(value)
+    raise QueryError(f"Nút không hợp lệ: {kind}")
+
+def _is_string(value) -> bool:
+    return isinstance(value, str) or (isinstance(value, np.ndarray) and value.dtype == object)
+
+def _require_numeric(value, op: str):
+    if _is_string(value):
+        raise QueryError(f"Phép {op!r} chỉ dùng cho cột số")
+
+def _require_bool(value, op: str):
+    if np.asarray(value).dtype != bool:
+        raise QueryError(f"Hai vế của {op!r} phải là điều kiện so sánh")
+
+def filter_mask(table: pd.DataFrame, where: str = None) -> np.ndarray:
+    """Mặt nạ các dòng thỏa biểu thức lọc (tất cả nếu không có biểu thức)"""
+    if not where or not where.strip():
+        return np.ones(len(table), dtype=bool)
+    mask = evaluate(parse(where.strip()), table)
+    if np.asarray(mask).dtype != bool:
+        raise QueryError("Biểu thức lọc phải là điều kiện (so sánh, and/or/not)")
+    return np.broadcast_to(mask, (len(table),))
+
+def sort_order(table: pd.DataFrame, sort: str = None) -> np.ndarray:
+    """Thứ tự dòng theo danh sách khóa "a,-b" (dấu - là giảm dần); NaN luôn xếp cuối"""
+    keys = [k.strip() for k in (sort or "").split(",") if k.strip()]
+    if not keys or len(table) == 0:
+        return np.arange(len(table))
+
+    # np.lexsort: khóa cuối là khóa chính; thêm mã làm khóa phụ để thứ tự ổn định
+    lex = [np.asarray(table.index, dtype=str)]
+    for key in reversed(keys):
+        desc = key.startswith("-")
+        name = key.lstrip("+-").lower()
+        name = ALIASES.get(name, name)
+        values = column_values(table, name)
+        if name in STRING_COLUMNS:
+            codes = pd.factorize(values, sort=True)[0].astype(float)
+            codes[codes < 0] = np.nan
+            values = codes
+        values = -values if desc else values
+        lex.append(values)
+        lex.append(np.isnan(values))
+    return np.lexsort(lex)
+
+def run_query(table: pd.DataFrame, where: str = None, sort: str = None,
+              limit: int = None, offset: int = 0):
+    """Lọc, sắp xếp và phân trang bảng snapshot
+    Trả về (bảng kết quả của trang, tổng số dòng thỏa điều kiện)"""
+    matched = table[filter_mask(table, where)]
+    ordered = matched.iloc[sort_order(matched, sort)]
+    offset = max(0, offset or 0)
+    end = None if limit is None else offset + max(0, limit)
+    return ordered.iloc[offset:end], len(matched)
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import screener_snapshot
+
+    parser = argparse.ArgumentParser(description="Loc snapshot screener bang bieu thuc")
+    parser.add_argument("where", nargs="?", default=None, help='vd: "rsi<35 and vol_ratio>1.5 and close>ma50"')
+    parser.add_argument("--sort", default="-score")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--asof", default=None,
+                        help="Loc tren bang tai 1 ngay qua khu (YYYY-MM-DD) hoac moi ngay giao dich trong khoang START:END")
+    args = parser.parse_args()
+
+    if args.asof:
+        start, _, end = args.asof.partition(":")
+        try:
+            dates = pd.bdate_range(start, end or start)
+        except ValueError as e:
+            print(f"Lỗi: {e}")
+            raise SystemExit(1)
+        began = time.time()
+        for date in dates:
+            try:
+                page, total = run_query(screener_snapshot.snapshot_asof(date), args.where, args.sort, args.limit, args.offset)
+            except QueryError as e:
+                print(f"Lỗi: {e}")
+                raise SystemExit(1)
+            picks = ", ".join(f"{s}({int(sc)})" for s, sc in zip(page.index, page["score"]))
+            print(f"{date:%Y-%m-%d}  {total:>4} ma  {picks}")
+        print(f"\n{len(dates)} ngay, thoi gian: {time.time() - began:.2f}s")
+        raise SystemExit(0)
+
+    try:
+        page, total = run_query(screener_snapshot.get_snapshot(), args.where, args.sort, args.limit, args.offset)
+    except QueryError as e:
+        print(f"Lỗi: {e}")
+        raise SystemExit(1)
+    print(f"{total} ma thoa dieu kien")
+    print(page[["close", "rsi", "vol_ratio", "ret_5d", "ret_20d", "score", "rating"]].to_string())
@@ -0,0 +1,686 @@
+"""
+Bảng snapshot của screener - Mỗi mã 1 dòng: nến cuối, giá trị chỉ báo, điểm, xếp hạng, tín hiệu
+Chỉ chấm lại các mã có phiên bản dữ liệu mới; bảng giữ trong bộ nhớ và lưu xuống đĩa (cache/)
+nên /api/screener chỉ còn là sắp xếp bảng có sẵn
+Bảng tại 1 ngày trong quá khứ (snapshot_asof) cắt từ mảng chỉ báo toàn lịch sử, không tính lại
+Sử dụng: python screener_snapshot.py [--rebuild | --changes | --benchmark [N]]
+"""
+
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+import data_store
+import volume_profile
+import relative_strength
+from download_all_vn import get_sector
+from scoring import (calculate_indicators, analyze_indicators, indicator_columns, score_arrays,
+                     rate_scores, MIN_BARS, RATINGS, AI_RULES, INDICATOR_COLUMNS)
+import scoring_rules
+
+CACHE_DIR = "cache"
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, "screener_snapshot.pkl")
+# Dòng trước lần chấm lại gần nhất của từng mã (để so sánh thay đổi)
+PREVIOUS_PATH = os.path.join(CACHE_DIR, "screener_previous.pkl")
+# Mã không chấm được (chưa đủ MIN_BARS nến / lỗi) -> phiên bản dữ liệu lúc thử, không chấm lại khi chưa đổi
+SKIPPED_PATH = os.path.join(CACHE_DIR, "screener_skipped.pkl")
+
+# Cột của 1 dòng snapshot (build_row, ngoài symbol làm index)
+ROW_COLUMNS = [
+    "date", "data_version",
+    "open", "high", "low", "close", "volume", "change",
+    "ma20", "ma50", "rsi", "macd", "macd_signal", "bb_upper", "bb_lower", "vol_ma20", "vol_ratio",
+    "ret_5d", "ret_20d",
+    "score", "max_score", "rating", "recommendation", "rec_class", "signals",
+    "vp_poc", "vp_support", "vp_resistance",
+]
+
+# Chỉ số tương đối trong ngành, tính lại cho cả bảng mỗi lần snapshot đổi
+# z_*: độ lệch chuẩn so với trung bình ngành; sector_momentum: trung vị ret_20d của ngành
+SECTOR_Z_COLUMNS = ["ret_5d", "ret_20d", "rsi", "vol_ratio"]
+SECTOR_COLUMNS = ["sector"] + [f"z_{c}" for c in SECTOR_Z_COLUMNS] + ["sector_momentum"]
+
+# Sức mạnh tương đối (relative_strength) tại nến cuối của mã: điểm RS (%) và xếp hạng 1-99
+RS_COLUMNS = ["rs_score", "rs_rank"]
+
+# Cột của bảng snapshot
+SNAPSHOT_COLUMNS = ROW_COLUMNS + SECTOR_COLUMNS + RS_COLUMNS
+
+# Bảng hiện tại (DataFrame index = symbol), bảng dòng trước lần chấm lại và thời điểm làm mới gần nhất
+_snapshot = {"table": None, "previous": None, "skipped": None, "updated": None}
+_snapshot_lock = threading.Lock()
+
+# Chỉ 1 lượt làm mới toàn bộ chạy cùng lúc (tránh chấm trùng khi nhiều request cùng đến)
+_refresh_lock = threading.Lock()
+
+def build_row(symbol: str, df: pd.DataFrame, version: str) -> dict:
+    """1 dòng snapshot của 1 mã (None nếu không đủ dữ liệu)"""
+    if df is None or len(df) < 50:
+        return None
+
+    ind = calculate_indicators(df)
+    result = analyze_indicators(ind, symbol)
+    latest = ind.iloc[-1]
+    close = ind["Close"]
+    levels = volume_profile.get_levels(symbol)
+
+    return {
+        "symbol": symbol,
+        "date": ind.index[-1].strftime("%Y-%m-%d"),
+        "data_version": version,
+        "open": float(latest["Open"]),
+        "high": float(latest["High"]),
+        "low": float(latest["Low"]),
+        "close": float(latest["Close"]),
+        "volume": float(latest["Volume"]),
+        "change": result["change"],
+        "ma20": float(latest["MA20"]),
+        "ma50": float(latest["MA50"]),
+        "rsi": float(latest["RSI"]),
+        "macd": float(latest["MACD"]),
+        "macd_signal": float(latest["MACD_Signal"]),
+        "bb_upper": float(latest["BB_Upper"]),
+        "bb_lower": float(latest["BB_Lower"]),
+        "vol_ma20": float(latest["Vol_MA20"]),
+        "vol_ratio": result["indicators"]["vol_ratio"],
+        "ret_5d": float((close.iloc[-1] / close.iloc[-5] - 1) * 100),
+        "ret_20d": float((close.iloc[-1] / close.iloc[-21] - 1) * 100),
+        "score": result["score"],
+        "max_score": result["max_score"],
+        "rating": result["rating"],
+        "recommendation": result["recommendation"],
+        "rec_class": result["rec_class"],
+        "signals": result["signals"],
+        "vp_poc": levels.get("poc"),
+        "vp_support": levels.get("nearest_support"),
+        "vp_resistance": levels.get("nearest_resistance"),
+    }
+
+def add_sector_columns(table: pd.DataFrame) -> pd.DataFrame:
+    """Thêm ngành và chỉ số tương đối trong ngành (groupby trên cả bảng, không lặp từng mã)
+    z-score là NaN nếu ngành chỉ có 1 mã hoặc độ lệch chuẩn bằng 0"""
+    out = table[ROW_COLUMNS].copy()
+    out["sector"] = out.index.map(get_sector)
+    for col in SECTOR_Z_COLUMNS:
+        values = pd.to_numeric(out[col], errors="coerce")
+        by_sector = values.groupby(out["sector"])
+        std = by_sector.transform("std").replace(0, np.nan)
+        out[f"z_{col}"] = (values - by_sector.transform("mean")) / std
+    out["sector_momentum"] = pd.to_numeric(out["ret_20d"], errors="coerce").groupby(out["sector"]).transform("median")
+    return out
+
+def add_rs_columns(table: pd.DataFrame) -> pd.DataFrame:
+    """Thêm điểm / xếp hạng RS tại ngày nến cuối của từng mã
+    Cần bảng Close của toàn bộ mã (relative_strength.get_rs, ~19 MB với 1.600 mã x 1.500 phiên, có cache)"""
+    table = table.copy()
+    rs = relative_strength.rs_at(table.index, table["date"])
+    table["rs_score"] = rs["score"]
+    table["rs_rank"] = rs["rank"]
+    return table[SNAPSHOT_COLUMNS]
+
+def add_universe_columns(table: pd.DataFrame) -> pd.DataFrame:
+    """Thêm các cột so sánh giữa các mã: ngành / chỉ số tương đối trong ngành và RS"""
+    return add_rs_columns(add_sector_columns(table))
+
+def _empty_table() -> pd.DataFrame:
+    return pd.DataFrame(columns=SNAPSHOT_COLUMNS).rename_axis("symbol")
+
+def load_snapshot(path: str = None) -> pd.DataFrame:
+    """Đọc snapshot đã lưu trên đĩa (bảng rỗng nếu chưa có / file hỏng)"""
+    try:
+        table = pd.read_pickle(path or SNAPSHOT_PATH)
+    except Exception:
+        return _empty_table()
+    if list(table.columns) != SNAPSHOT_COLUMNS:
+        return _empty_table()
+    return table
+
+def save_snapshot(table: pd.DataFrame, path: str = None):
+    """Lưu snapshot xuống đĩa (ghi file tạm rồi đổi tên để không để lại file dở)"""
+    path = path or SNAPSHOT_PATH
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    table.to_pickle(tmp)
+    os.replace(tmp, path)
+
+def _current_table() -> pd.DataFrame:
+    """Bảng đang giữ trong bộ nhớ (đọc từ đĩa lần đầu); gọi khi đang giữ _snapshot_lock"""
+    if _snapshot["table"] is None:
+        _snapshot["table"] = load_snapshot()
+        if _snapshot["updated"] is None and os.path.exists(SNAPSHOT_PATH):
+            _snapshot["updated"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(os.path.getmtime(SNAPSHOT_PATH)))
+    return _snapshot["table"]
+
+def _skipped_map() -> dict:
+    """Mã không chấm được -> phiên bản dữ liệu lúc thử (đọc từ đĩa lần đầu); gọi khi đang giữ _snapshot_lock"""
+    if _snapshot["skipped"] is None:
+        try:
+            _snapshot["skipped"] = dict(pd.read_pickle(SKIPPED_PATH))
+        except Exception:
+            _snapshot["skipped"] = {}
+    return _snapshot["skipped"]
+
+def _previous_table() -> pd.DataFrame:
+    """Bảng dòng trước lần chấm lại gần nhất của từng mã; gọi khi đang giữ _snapshot_lock"""
+    if _snapshot["previous"] is None:
+        _snapshot["previous"] = load_snapshot(PREVIOUS_PATH)
+    return _snapshot["previous"]
+
+def pending_changes(symbols: list = None):
+    """So phiên bản dữ liệu với snapshot, trả về (bảng hiện tại, [mã cần chấm lại], [mã bị bỏ])
+    Mã đã thử chấm nhưng không được (thiếu nến) không tính là cần chấm lại khi phiên bản dữ liệu chưa đổi"""
+    symbols = data_store.list_symbols() if symbols is None else symbols
+    versions = {s: data_store.data_version(s) for s in symbols}
+    with _snapshot_lock:
+        table = _current_table()
+        skipped = dict(_skipped_map())
+    stale = [s for s, v in versions.items()
+             if v is not None and skipped.get(s) != v
+             and (s not in table.index or table.at[s, "data_version"] != v)]
+    removed = [s for s in table.index if s not in versions or versions[s] is None]
+    return table, stale, removed
+
+def score_symbol(symbol: str) -> dict:
+    """Chấm điểm 1 mã thành dòng snapshot (None nếu không có/không đủ dữ liệu hoặc lỗi)"""
+    df, version = data_store.load_symbol(symbol)
+    try:
+        return build_row(symbol, df, version)
+    except Exception as e:
+        print(f"Lỗi chấm điểm {symbol}: {e}")
+        return None
+
+def apply_changes(rows: list, stale: list, removed: list, versions: dict = None, rs: bool = True) -> pd.DataFrame:
+    """Ghi các dòng chấm lại vào bảng (bỏ dòng cũ của mã stale/removed), lưu xuống đĩa nếu có thay đổi
+    Dòng cũ của mã được chấm lại chuyển sang bảng previous để so sánh thay đổi
+    Mã stale không có dòng được ghi vào danh sách bỏ qua theo phiên bản trong `versions` (lấy trước khi chấm)
+    rs=False: chưa tính lại RS (dòng mới để NaN, dòng cũ giữ nguyên), gọi update_rs_columns sau khi ghi hết các lô"""
+    scored = {row["symbol"] for row in rows}
+    with _snapshot_lock:
+        # Danh sách bỏ qua: thêm mã không chấm được, bỏ mã đã chấm được / không còn dữ liệu
+        skipped = _skipped_map()
+        before = dict(skipped)
+        for symbol in stale:
+            version = (versions or {}).get(symbol) or data_store.data_version(symbol)
+            if symbol in scored or version is None:
+                skipped.pop(symbol, None)
+            else:
+                skipped[symbol] = version
+        for symbol in removed:
+            skipped.pop(symbol, None)
+        if skipped != before:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            pd.to_pickle(skipped, SKIPPED_PATH)
+
+        table = _current_table()
+        dropped = [s for s in list(stale) + list(removed) if s in table.index]
+        if not rows and not dropped:
+            return table
+
+        previous = _previous_table()
+        replaced = [s for s in stale if s in table.index]
+        previous = previous.drop(index=[s for s in list(stale) + list(removed) if s in previous.index])
+        if replaced:
+            previous = pd.concat([previous, table.loc[replaced]]) if len(previous) else table.loc[replaced]
+        _snapshot["previous"] = previous.sort_index()
+        save_snapshot(_snapshot["previous"], PREVIOUS_PATH)
+
+        table = table.drop(index=dropped)
+        if rows:
+            new = pd.DataFrame(rows).set_index("symbol")[ROW_COLUMNS]
+            table = pd.concat([table[ROW_COLUMNS], new]) if len(table) else new
+        if rs:
+            table = add_universe_columns(table.sort_index())
+        else:
+            kept = _snapshot["table"][RS_COLUMNS].drop(index=[s for s in scored if s in _snapshot["table"].index])
+            table = add_sector_columns(table.sort_index())
+            table[RS_COLUMNS] = kept.reindex(table.index)
+            table = table[SNAPSHOT_COLUMNS]
+        save_snapshot(table)
+        _snapshot["table"] = table
+        _snapshot["updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        return table
+
+def update_rs_columns() -> pd.DataFrame:
+    """Tính lại cột RS của cả bảng (1 lần sau khi ghi các lô với rs=False) và lưu xuống đĩa"""
+    with _snapshot_lock:
+        table = add_rs_columns(_current_table())
+        save_snapshot(table)
+        _snapshot["table"] = table
+        return table
+
+def iter_refresh_batches(symbols: list = None):
+    """Như refresh_snapshot nhưng chấm và ghi vào bảng từng lô, trả dần (các mã của lô, các dòng đã ghi vào bảng)
+    Khóa làm mới chỉ giữ trong lúc chấm và ghi 1 lô, không giữ khi trả kết quả: người đọc chậm
+    (stream SSE) không chặn các lượt làm mới khác; mã đã được lượt khác chấm lại thì bỏ qua"""
+    _, stale, removed = pending_changes(symbols)
+    if removed:
+        with _refresh_lock:
+            apply_changes([], [], removed)
+
+    # Nhiều lô: RS (cần bảng Close toàn bộ mã) chỉ tính 1 lần sau lô cuối, dòng trả về trước đó có RS là NaN
+    chunked = len(stale) >= LARGE_UNIVERSE
+    applied = False
+    try:
+        for batch in _batches(stale):
+            with _refresh_lock:
+                todo = pending_changes(batch)[1]
+                if not todo:
+                    continue
+                versions = {symbol: data_store.data_version(symbol) for symbol in todo}
+                rows = _score_batch(todo, chunked)
+                table = apply_changes(rows, todo, [], versions, rs=not chunked)
+                applied = applied or bool(rows)
+                # Dòng đã ghi vào bảng (kèm cột ngành / RS tính trên toàn bảng)
+                scored = [row["symbol"] for row in rows]
+                rows = [{"symbol": symbol, **row} for symbol, row in zip(scored, table.loc[scored].to_dict("records"))]
+            yield todo, rows
+    finally:
+        # Cả khi người đọc dừng giữa chừng: bảng đã ghi không bị thiếu RS
+        if chunked and applied:
+            with _refresh_lock:
+                update_rs_columns()
+
+def iter_refresh(symbols: list = None):
+    """Như refresh_snapshot nhưng trả dần (symbol, dòng) của từng mã vừa chấm lại
+    Mỗi lô được ghi vào bảng ngay khi chấm xong (xem iter_refresh_batches)"""
+    for _, rows in iter_refresh_batches(symbols):
+        for row in rows:
+            yield row["symbol"], row
+
+def refresh_snapshot(symbols: list = None) -> dict:
+    """Chấm lại các mã có phiên bản dữ liệu khác snapshot, bỏ mã không còn dữ liệu
+    Nhiều mã cần chấm lại (từ LARGE_UNIVERSE) thì chấm theo lô trên panel
+    Trả về {"table": bảng mới, "changed": [mã chấm lại], "removed": [mã bị bỏ]}"""
+    with _refresh_lock:
+        _, stale, removed = pending_changes(symbols)
+        versions = {symbol: data_store.data_version(symbol) for symbol in stale}
+        rows = [row for _, batch_rows in _score_batches(stale) for row in batch_rows]
+        table = apply_changes(rows, stale, removed, versions)
+        return {"table": table, "changed": [r["symbol"] for r in rows], "removed": removed}
+
+def get_snapshot() -> pd.DataFrame:
+    """Bảng snapshot đã làm mới theo phiên bản dữ liệu hiện tại (chỉ stat file nếu không có mã đổi)"""
+    return refresh_snapshot()["table"]
+
+def _number(value):
+    """NaN / thiếu -> None để JSON trả về hợp lệ"""
+    return None if value is None or pd.isna(value) else float(value)
+
+def to_result(symbol: str, row: dict, quote: dict = None) -> dict:
+    """Chuyển 1 dòng snapshot sang định dạng kết quả ai_analyze (giá realtime đè lên nếu có)"""
+    result = {
+        "symbol": symbol,
+        "price": row["close"],
+        "change": row["change"],
+        "score": int(row["score"]),
+        "max_score": int(row["max_score"]),
+        "rating": row["rating"],
+        "recommendation": row["recommendation"],
+        "rec_class": row["rec_class"],
+        "signals": row["signals"],
+        "indicators": {
+            "rsi": row["rsi"],
+            "macd": row["macd"],
+            "macd_signal": row["macd_signal"],
+            "ma20": row["ma20"],
+            "ma50": row["ma50"],
+            "vol_ratio": row["vol_ratio"]
+        },
+        "updated": row["date"],
+        "sector": row["sector"],
+        "sector_relative": {key: _number(row[key]) for key in SECTOR_COLUMNS[1:]},
+        "rs_score": _number(row["rs_score"]),
+        "rs_rank": _number(row["rs_rank"]),
+        "volume_profile": {
+            "poc": _number(row["vp_poc"]),
+            "nearest_support": _number(row["vp_support"]),
+            "nearest_resistance": _number(row["vp_resistance"])
+        }
+    }
+    if quote:
+        result["price"] = quote["price"]
+        result["change"] = quote["change_pct"]
+        result["updated"] = quote["updated"]
+    return result
+
+# ============ THAY ĐỔI SO VỚI LẦN CHẤM TRƯỚC ============
+
+# Thứ bậc rating (cao hơn là tốt hơn)
+RATING_RANK = {r[1]: len(RATINGS) - i for i, r in enumerate(RATINGS)}
+
+# Nhóm thay đổi -> mô tả
+CHANGE_KINDS = {
+    "new_strong": "Mới vào nhóm A/A+",
+    "upgrades": "Tăng hạng",
+    "downgrades": "Giảm hạng",
+    "golden_cross": "Golden Cross (MA20 cắt lên MA50)",
+    "death_cross": "Death Cross (MA20 cắt xuống MA50)",
+    "rsi_below_30": "RSI xuống dưới 30 (quá bán)",
+    "rsi_above_30": "RSI vượt lên 30 (thoát quá bán)",
+    "rsi_above_70": "RSI vượt lên 70 (quá mua)",
+    "rsi_below_70": "RSI xuống dưới 70 (thoát quá mua)",
+}
+
+def _change_item(symbol: str, cur: dict, prev: dict) -> dict:
+    return {
+        "symbol": symbol,
+        "date": cur["date"],
+        "previous_date": prev.get("date"),
+        "close": cur["close"],
+        "score": int(cur["score"]),
+        "previous_score": None if prev.get("score") is None else int(prev["score"]),
+        "rating": cur["rating"],
+        "previous_rating": prev.get("rating"),
+        "rsi": cur["rsi"],
+        "previous_rsi": prev.get("rsi"),
+    }
+
+def diff_tables(previous: pd.DataFrame, table: pd.DataFrame, since: str = None) -> dict:
+    """So sánh từng mã giữa bảng previous và bảng hiện tại bằng phép toán trên cả cột
+    since: chỉ giữ mã có nến hiện tại từ ngày này trở đi. Trả về {nhóm thay đổi: [mã ...]}"""
+    if since:
+        table = table[table["date"] >= since]
+    prev = previous.reindex(table.index)
+    has_prev = prev["date"].notna().values
+
+    rank = table["rating"].map(RATING_RANK).values
+    prev_rank = prev["rating"].map(RATING_RANK).values
+    ma20, ma50 = table["ma20"].values.astype(float), table["ma50"].values.astype(float)
+    prev_ma20, prev_ma50 = prev["ma20"].values.astype(float), prev["ma50"].values.astype(float)
+    rsi, prev_rsi = table["rsi"].values.astype(float), prev["rsi"].values.astype(float)
+    strong = RATING_RANK["A"]
+
+    with np.errstate(invalid="ignore"):
+        masks = {
+            # Mã mới có trong bảng mà đã ở nhóm A/A+ cũng tính là mới vào nhóm
+            "new_strong": (rank >= strong) & ~(prev_rank >= strong),
+            "upgrades": has_prev & (rank > prev_rank),
+            "downgrades": has_prev & (rank < prev_rank),
+            "golden_cross": (prev_ma20 <= prev_ma50) & (ma20 > ma50),
+            "death_cross": (prev_ma20 >= prev_ma50) & (ma20 < ma50),
+            "rsi_below_30": (prev_rsi >= 30) & (rsi < 30),
+            "rsi_above_30": (prev_rsi < 30) & (rsi >= 30),
+            "rsi_above_70": (prev_rsi <= 70) & (rsi > 70),
+            "rsi_below_70": (prev_rsi > 70) & (rsi <= 70),
+        }
+
+    cur_rows = table.to_dict("index")
+    prev_rows = {s: (r if isinstance(r["date"], str) else {}) for s, r in prev.to_dict("index").items()}
+    changes = {}
+    for kind, mask in masks.items():
+        items = [_change_item(s, cur_rows[s], prev_rows[s]) for s in table.index[mask]]
+        changes[kind] = sorted(items, key=lambda x: -x["score"])
+    return changes
+
+def get_changes(since: str = None) -> dict:
+    """Thay đổi của các mã so với lần chấm trước (chỉ chấm lại mã có phiên bản dữ liệu mới)"""
+    refresh_snapshot()
+    with _snapshot_lock:
+        table = _current_table()
+        previous = _previous_table()
+        updated = _snapshot["updated"]
+    return {"updated": updated, "changes": diff_tables(previous, table, since)}
+
+# ============ SNAPSHOT TẠI 1 NGÀY TRONG QUÁ KHỨ ============
+
+# Mảng giá/chỉ báo/điểm toàn lịch sử (nến x mã, dồn theo chuỗi nến riêng của từng mã), theo phiên bản dữ liệu
+_history = {"versions": None, "arrays": None}
+_history_lock = threading.Lock()
+
+def panel_arrays(panel: dict) -> dict:
+    """Mảng giá/chỉ báo/điểm của 1 panel (nến x mã, dồn theo chuỗi nến riêng của từng mã)
+    Chỉ báo chỉ dùng dữ liệu quá khứ nên giá trị tại 1 nến trùng với khi tính trên dữ liệu cắt đến nến đó"""
+    close, rank, valid = data_store.compact_columns(panel["Close"])
+    arrays = {"Close": close}
+    for col in ("Open", "High", "Low", "Volume"):
+        arrays[col] = data_store.compact_columns(panel[col])[0]
+    days = panel["Close"].index.values.astype("datetime64[D]").astype(float)
+    arrays["Day"] = data_store.compact_columns(pd.DataFrame(np.where(valid, days[:, None], np.nan)))[0]
+
+    ind = indicator_columns(pd.DataFrame(close), pd.DataFrame(arrays["Volume"]))
+    for name, values in ind.items():
+        arrays[name] = values.values
+    arrays["Score"] = score_arrays(close, arrays["Volume"], ind)
+
+    return {
+        "symbols": np.asarray(panel["Close"].columns, dtype=object),
+        "dates": panel["Close"].index,
+        # Số thứ tự nến cuối cùng của mỗi mã tính đến mỗi ngày (-1: chưa niêm yết)
+        "bar": rank,
+        "arrays": arrays,
+    }
+
+def history_arrays() -> dict:
+    """Mảng toàn lịch sử của mọi mã (panel_arrays), tính 1 lần cho mỗi phiên bản dữ liệu"""
+    symbols = data_store.list_symbols()
+    versions = tuple((s, data_store.data_version(s)) for s in symbols)
+    with _history_lock:
+        if _history["versions"] == versions:
+            return _history["arrays"]
+
+    result = panel_arrays(data_store.load_panel(symbols))
+    result["versions"] = dict(versions)
+    with _history_lock:
+        _history["versions"] = versions
+        _history["arrays"] = result
+    return result
+
+def rows_at(hist: dict, cols: np.ndarray, r: np.ndarray) -> pd.DataFrame:
+    """Các dòng snapshot (ROW_COLUMNS) lấy từ mảng panel_arrays: mã ở cột `cols`, tại nến thứ `r`
+    Cột signals và volume profile để None (signals_at / fill_volume_profile điền sau nếu cần)"""
+    a = {name: values[:, cols] for name, values in hist["arrays"].items()}
+    idx = np.arange(len(cols))
+
+    def at(name, back=0):
+        return a[name][r - back, idx]
+
+    close, prev_close = at("Close"), at("Close", 1)
+    vol_ma20 = at("Vol_MA20")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        vol_ratio = np.where(vol_ma20 > 0, at("Volume") / vol_ma20, 1)
+    score = at("Score")
+    symbols = hist["symbols"][cols]
+
+    table = pd.DataFrame({
+        "date": pd.to_datetime(at("Day"), unit="D").strftime("%Y-%m-%d"),
+        "data_version": [hist["versions"][s] for s in symbols],
+        "open": at("Open"), "high": at("High"), "low": at("Low"), "close": close, "volume": at("Volume"),
+        "change": (close - prev_close) / prev_close * 100,
+        "ma20": at("MA20"), "ma50": at("MA50"), "rsi": at("RSI"),
+        "macd": at("MACD"), "macd_signal": at("MACD_Signal"),
+        "bb_upper": at("BB_Upper"), "bb_lower": at("BB_Lower"), "vol_ma20": vol_ma20, "vol_ratio": vol_ratio,
+        "ret_5d": (close / at("Close", 4) - 1) * 100,
+        "ret_20d": (close / at("Close", 20) - 1) * 100,
+        "score": score.astype(int), "max_score": 100,
+        **rate_scores(score),
+        "signals": None,
+        "vp_poc": None, "vp_support": None, "vp_resistance": None,
+    }, index=pd.Index(symbols, name="symbol"))
+    return table[ROW_COLUMNS]
+
+def signals_at(hist: dict, cols, r) -> list:
+    """Danh sách tín hiệu của từng mã: chấm AI_RULES 1 lần trên 5 nến cuối (nến x mã) của mọi mã cần lấy"""
+    cols = np.asarray(cols, dtype=int)
+    if len(cols) == 0:
+        return []
+    # 5 nến cuối của từng mã: (5, số mã)
+    offsets = np.asarray(r)[None, :] + np.arange(-4, 1)[:, None]
+    block = {name: hist["arrays"][name][offsets, cols[None, :]] for name in ["Close", "Volume", *INDICATOR_COLUMNS]}
+    seed = {INDICATOR_COLUMNS[name]: block[name] for name in INDICATOR_COLUMNS}
+    result = scoring_rules.evaluate(AI_RULES, {"close": block["Close"], "volume": block["Volume"]}, seed)
+    return [scoring_rules.signals(AI_RULES, result, (-1, i)) for i in range(len(cols))]
+
+def snapshot_asof(date) -> pd.DataFrame:
+    """Bảng snapshot như screener đã thấy vào cuối ngày `date`
+    Mỗi mã lấy nến cuối cùng đến ngày đó (ngày không giao dịch dùng nến trước), bỏ mã chưa niêm yết
+    hoặc chưa đủ MIN_BARS nến. Cột signals để trống (fill_signals cho trang kết quả), volume profile là None"""
+    hist = history_arrays()
+    pos = hist["dates"].searchsorted(pd.Timestamp(date), side="right") - 1
+    if pos < 0:
+        return _empty_table()
+
+    bar = hist["bar"][pos]
+    cols = np.flatnonzero(bar >= MIN_BARS - 1)
+    if len(cols) == 0:
+        return _empty_table()
+    return add_universe_columns(rows_at(hist, cols, bar[cols]))
+
+def fill_signals(page: pd.DataFrame) -> pd.DataFrame:
+    """Điền cột signals cho các dòng của snapshot_asof"""
+    hist = history_arrays()
+    index = {s: i for i, s in enumerate(hist["symbols"])}
+    cols = [index[symbol] for symbol in page.index]
+    pos = hist["dates"].searchsorted(pd.to_datetime(page["date"]), side="right") - 1
+    page = page.copy()
+    page["signals"] = signals_at(hist, cols, hist["bar"][pos, cols])
+    return page
+
+# ============ CHẤM THEO LÔ CHO DANH SÁCH MÃ LỚN ============
+
+# Số mã cần chấm lại từ mức này trở lên thì chấm theo lô trên panel (vector hóa) thay vì từng mã
+LARGE_UNIVERSE = 200
+
+# Số mã mỗi lô: bộ nhớ tỉ lệ với CHUNK_SIZE x số nến, không phụ thuộc tổng số mã
+CHUNK_SIZE = 200
+
+# Số mã mỗi nhóm khi chấm từng mã: mỗi nhóm được ghi vào bảng (và trả cho stream) khi chấm xong
+SMALL_BATCH = 10
+
+def score_chunk(symbols: list) -> list:
+    """Chấm điểm 1 lô mã trong 1 lần tính trên panel của lô (không giữ dữ liệu lại trong cache)
+    Cùng kết quả với build_row, trừ volume profile để None (fill_volume_profile điền khi hiển thị)"""
+    versions = {s: data_store.data_version(s) for s in symbols}
+    panel = data_store.load_panel(symbols, keep=False)
+    if panel["Close"].shape[1] == 0:
+        return []
+
+    hist = panel_arrays(panel)
+    hist["versions"] = versions
+    last = hist["bar"][-1]
+    cols = np.flatnonzero(last >= MIN_BARS - 1)
+    if len(cols) == 0:
+        return []
+    table = rows_at(hist, cols, last[cols])
+    table["signals"] = signals_at(hist, cols, last[cols])
+    return table.reset_index().to_dict("records")
+
+def _batches(symbols: list) -> list:
+    """Chia mã cần chấm: nhóm SMALL_BATCH mã (chấm từng mã) nếu ít mã, lô CHUNK_SIZE mã nếu từ LARGE_UNIVERSE mã trở lên"""
+    size = SMALL_BATCH if len(symbols) < LARGE_UNIVERSE else CHUNK_SIZE
+    return [symbols[i:i + size] for i in range(0, len(symbols), size)]
+
+def _score_batch(batch: list, chunked: bool) -> list:
+    """Các dòng chấm được của 1 lô (chunked: tính trên panel của lô, lỗi thì chấm lại từng mã)"""
+    if chunked:
+        try:
+            return score_chunk(batch)
+        except Exception as e:
+            print(f"Lỗi chấm lô {batch[0]}..{batch[-1]}: {e}, chấm lại từng mã")
+    return [row for row in map(score_symbol, batch) if row is not None]
+
+def _score_batches(symbols: list):
+    """Chấm lần lượt theo _batches, trả dần (các mã đã xử lý, các dòng chấm được)"""
+    chunked = len(symbols) >= LARGE_UNIVERSE
+    for batch in _batches(symbols):
+        yield batch, _score_batch(batch, chunked)
+
+def fill_volume_profile(page: pd.DataFrame) -> pd.DataFrame:
+    """Điền các cột volume profile còn trống (dòng chấm theo lô) cho các dòng sẽ hiển thị"""
+    missing = [s for s, poc in zip(page.index, page["vp_poc"]) if poc is None or pd.isna(poc)]
+    if not missing:
+        return page
+    page = page.copy()
+    for symbol in missing:
+        levels = volume_profile.get_levels(symbol)
+        page.loc[symbol, ["vp_poc", "vp_support", "vp_resistance"]] = [
+            levels.get("poc"), levels.get("nearest_support"), levels.get("nearest_resistance")]
+    return page
+
+def make_synthetic_universe(data_dir: str, n_symbols: int = 1600, n_bars: int = 1500, seed: int = 0):
+    """Tạo n_symbols file CSV giả lập (cùng định dạng yfinance): giá đi ngẫu nhiên,
+    ngày niêm yết khác nhau và thiếu ngẫu nhiên ~1% phiên"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_bars)
+    os.makedirs(data_dir, exist_ok=True)
+    for i in range(n_symbols):
+        n = int(rng.integers(MIN_BARS, n_bars + 1))
+        keep = rng.random(n) > 0.01
+        close = 10000 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+        high = close * (1 + rng.uniform(0, 0.02, n))
+        low = close * (1 - rng.uniform(0, 0.02, n))
+        df = pd.DataFrame({"Close": close, "High": high, "Low": low, "Open": (high + low) / 2,
+                           "Volume": rng.integers(10_000, 1_000_000, n)},
+                          index=pd.Index(dates[-n:], name="Date"))[keep]
+        symbol = f"SYN{i:04d}"
+        with open(os.path.join(data_dir, f"{symbol}.csv"), "w") as f:
+            f.write("Price,Close,High,Low,Open,Volume\nTicker," + ",".join([symbol + ".VN"] * 5) + "\nDate,,,,,\n")
+            df.to_csv(f, header=False)
+
+def benchmark(n_symbols: int = 1600, n_bars: int = 1500):
+    """Đo thời gian làm mới snapshot cho danh sách mã giả lập lớn (thư mục tạm, không đụng data/ và cache/)"""
+    import resource
+    import shutil
+    import tempfile
+    global CACHE_DIR, SNAPSHOT_PATH, PREVIOUS_PATH, SKIPPED_PATH
+
+    root = tempfile.mkdtemp(prefix="screener_bench_")
+    saved = (data_store.DATA_DIR, data_store.FRAME_CACHE_DIR, CACHE_DIR, SNAPSHOT_PATH, PREVIOUS_PATH, SKIPPED_PATH)
+    try:
+        print(f"Tao {n_symbols} ma gia lap x toi da {n_bars} phien...")
+        make_synthetic_universe(os.path.join(root, "data"), n_symbols, n_bars)
+        data_store.DATA_DIR = os.path.join(root, "data")
+        data_store.FRAME_CACHE_DIR = os.path.join(root, "cache", "frames")
+        CACHE_DIR = os.path.join(root, "cache")
+        SNAPSHOT_PATH = os.path.join(CACHE_DIR, "screener_snapshot.pkl")
+        PREVIOUS_PATH = os.path.join(CACHE_DIR, "screener_previous.pkl")
+        SKIPPED_PATH = os.path.join(CACHE_DIR, "screener_skipped.pkl")
+
+        def run(label):
+            _snapshot.update({"table": None, "previous": None, "skipped": None})
+            start = time.time()
+            out = refresh_snapshot()
+            print(f"{label:<46} {time.time() - start:>7.2f}s  ({len(out['changed'])} ma cham lai)")
+
+        run("Lan dau (doc CSV + cham diem)")
+        os.remove(SNAPSHOT_PATH)
+        run("Cham lai toan bo (da co ban doc san)")
+        for symbol in data_store.list_symbols()[:20]:
+            os.utime(data_store.csv_path(symbol))
+        run("Cap nhat 20 ma")
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"Bo nho dinh: {peak:.0f} MB (lo {CHUNK_SIZE} ma)")
+    finally:
+        data_store.DATA_DIR, data_store.FRAME_CACHE_DIR, CACHE_DIR, SNAPSHOT_PATH, PREVIOUS_PATH, SKIPPED_PATH = saved
+        _snapshot.update({"table": None, "previous": None, "skipped": None})
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    import sys
+
+    if "--changes" in sys.argv:
+        out = get_changes()
+        for kind, items in out["changes"].items():
+            if items:
+                print(f"\n{CHANGE_KINDS[kind]} ({len(items)})")
+                for c in items:
+                    print(f"  {c['symbol']:<8} {c['previous_date']} -> {c['date']}  "
+                          f"{c['previous_rating'] or '-':>2} -> {c['rating']:<2}  RSI {c['rsi']:.0f}")
+        sys.exit(0)
+
+    if "--benchmark" in sys.argv:
+        i = sys.argv.index("--benchmark")
+        n = int(sys.argv[i + 1]) if len(sys.argv) > i + 1 and sys.argv[i + 1].isdigit() else 1600
+        benchmark(n)
+        sys.exit(0)
+
+    if "--rebuild" in sys.argv:
+        for path in (SNAPSHOT_PATH, PREVIOUS_PATH, SKIPPED_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+
+    start = time.time()
+    out = refresh_snapshot()
+    table = out["table"].sort_values("score", ascending=False)
+    print(f"Cham lai {len(out['changed'])} ma, bo {len(out['removed'])} ma, {time.time() - start:.2f}s")
+    print(table[["date", "close", "rsi", "vol_ratio", "ret_20d", "score", "rating"]].head(20).to_string())
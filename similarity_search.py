@@ -0,0 +1,199 @@
+"""
+Tìm mẫu hình giá tương tự trong lịch sử - "Lần trước biểu đồ giống hôm nay thì sau đó ra sao?"
+Dùng MASS (Mueen's Algorithm for Similarity Search): khoảng cách Euclid giữa các cửa sổ giá
+đã chuẩn hóa z, tính bằng FFT nên mỗi truy vấn là O(n log n) trên mỗi chuỗi
+Sử dụng: python similarity_search.py [--window 30] [--top 10] [MA ...]
+"""
+
+import numpy as np
+import time
+import data_store
+
+# Số phiên tính lợi nhuận sau mỗi điểm tương đồng
+FORWARD_HORIZONS = [5, 10, 20]
+
+# Cache theo mã: symbol -> {"version", "close", "dates", "fft_len", "fft", "stats": {m: (mean, std)}}
+_series_cache = {}
+
+def _next_pow2(n: int) -> int:
+    """Lũy thừa của 2 nhỏ nhất >= n"""
+    return 1 << (int(n) - 1).bit_length()
+
+def get_series(symbol: str) -> dict:
+    """Chuỗi giá đóng cửa và FFT đã tính sẵn của 1 mã (tính lại khi dữ liệu đổi phiên bản)"""
+    df, version = data_store.load_symbol(symbol)
+    if df is None:
+        return None
+
+    entry = _series_cache.get(symbol)
+    if entry is not None and entry["version"] == version:
+        return entry
+
+    close = df["Close"].values.astype(float)
+    # Độ dài FFT đủ cho tích chập với mọi cửa sổ truy vấn <= n
+    fft_len = _next_pow2(2 * max(len(close), 1))
+    entry = {
+        "version": version,
+        "close": close,
+        "dates": df.index,
+        "fft_len": fft_len,
+        "fft": np.fft.rfft(close, fft_len),
+        "stats": {}
+    }
+    _series_cache[symbol] = entry
+    return entry
+
+def _window_stats(entry: dict, m: int):
+    """Trung bình và độ lệch chuẩn trượt (cửa sổ m) tính bằng tổng tích lũy"""
+    if m not in entry["stats"]:
+        close = entry["close"]
+        x = close - close.mean()
+        c1 = np.concatenate([[0.0], np.cumsum(x)])
+        c2 = np.concatenate([[0.0], np.cumsum(x * x)])
+        mean = (c1[m:] - c1[:-m]) / m
+        var = (c2[m:] - c2[:-m]) / m - mean * mean
+        entry["stats"][m] = (mean + close.mean(), np.sqrt(np.maximum(var, 0.0)))
+    return entry["stats"][m]
+
+def distance_profile(query: np.ndarray, entry: dict) -> np.ndarray:
+    """Khoảng cách z-normalized từ query tới mọi cửa sổ cùng độ dài của chuỗi (MASS)
+    Phần tử i là khoảng cách tới cửa sổ bắt đầu tại nến i"""
+    m = len(query)
+    close = entry["close"]
+    n = len(close)
+    if n < m:
+        return np.array([])
+
+    # Chuẩn hóa query (trung bình 0, độ lệch 1) nên số hạng trung bình của chuỗi triệt tiêu
+    q = (query - query.mean()) / query.std()
+    qt = np.fft.irfft(entry["fft"] * np.fft.rfft(q[::-1], entry["fft_len"]), entry["fft_len"])[m - 1:n]
+
+    _, std = _window_stats(entry, m)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = qt / (m * std)
+    dist = np.sqrt(np.maximum(2 * m * (1 - corr), 0.0))
+    return np.where(std > 1e-12 * max(abs(close).max(), 1.0), dist, np.inf)
+
+def _top_matches(dist: np.ndarray, k: int, exclusion: int) -> list:
+    """k cửa sổ gần nhất, bỏ các cửa sổ chồng lấn (trong phạm vi exclusion) với kết quả đã chọn"""
+    dist = dist.copy()
+    picks = []
+    for _ in range(k):
+        if len(dist) == 0:
+            break
+        i = int(np.argmin(dist))
+        if not np.isfinite(dist[i]):
+            break
+        picks.append((i, float(dist[i])))
+        dist[max(0, i - exclusion):i + exclusion + 1] = np.inf
+    return picks
+
+def find_similar(symbol: str, window: int = 30, k: int = 10, symbols: list = None) -> dict:
+    """Tìm k đoạn lịch sử (mọi mã, mọi thời điểm) giống `window` phiên gần nhất của `symbol`
+    Kèm lợi nhuận sau mỗi đoạn và thống kê theo các kỳ FORWARD_HORIZONS"""
+    target = get_series(symbol)
+    if target is None:
+        return {"error": f"Không tìm thấy {symbol}"}
+    if window < 5 or len(target["close"]) < 2 * window:
+        return {"error": "Không đủ dữ liệu"}
+
+    query = target["close"][-window:]
+    if query.std() == 0:
+        return {"error": "Giá không biến động trong cửa sổ truy vấn"}
+
+    symbols = data_store.list_symbols() if symbols is None else symbols
+    query_start = target["dates"][-window]
+    exclusion = max(1, window // 2)
+    candidates = []
+
+    for sym in symbols:
+        entry = target if sym == symbol else get_series(sym)
+        if entry is None or len(entry["close"]) < window:
+            continue
+
+        # Chỉ xét các đoạn kết thúc trước khi đoạn truy vấn bắt đầu (bỏ đoạn trùng thời gian)
+        last_end = int(entry["dates"].searchsorted(query_start)) - 1
+        if last_end < window - 1:
+            continue
+
+        dist = distance_profile(query, entry)[:last_end - window + 2]
+
+        for start, d in _top_matches(dist, k, exclusion):
+            candidates.append((d, sym, start, entry))
+
+    candidates.sort(key=lambda c: c[0])
+
+    matches = []
+    for d, sym, start, entry in candidates[:k]:
+        close = entry["close"]
+        end = start + window - 1
+        forward = {}
+        for h in FORWARD_HORIZONS:
+            forward[f"{h}d"] = float((close[end + h] / close[end] - 1) * 100) if end + h < len(close) else None
+        matches.append({
+            "symbol": sym,
+            "start": entry["dates"][start].strftime("%Y-%m-%d"),
+            "end": entry["dates"][end].strftime("%Y-%m-%d"),
+            "distance": d,
+            "forward_returns": forward
+        })
+
+    # Thống kê lợi nhuận sau các đoạn tương đồng
+    forward_stats = {}
+    for h in FORWARD_HORIZONS:
+        values = np.array([m["forward_returns"][f"{h}d"] for m in matches
+                           if m["forward_returns"][f"{h}d"] is not None])
+        forward_stats[f"{h}d"] = {
+            "count": int(len(values)),
+            "mean": float(values.mean()) if len(values) else None,
+            "median": float(np.median(values)) if len(values) else None,
+            "win_rate": float((values > 0).mean() * 100) if len(values) else None
+        }
+
+    return {
+        "symbol": symbol,
+        "window": window,
+        "query_start": query_start.strftime("%Y-%m-%d"),
+        "query_end": target["dates"][-1].strftime("%Y-%m-%d"),
+        "matches": matches,
+        "forward_stats": forward_stats
+    }
+
+def print_similar(result: dict):
+    """In kết quả tìm kiếm"""
+    if "error" in result:
+        print(f"Lỗi: {result['error']}")
+        return
+
+    print(f"\n{'='*80}")
+    print(f"   MAU HINH TUONG TU: {result['symbol']} ({result['query_start']} -> {result['query_end']}, {result['window']} phien)")
+    print(f"{'='*80}")
+    print(f"{'STT':<4} {'Ma':<8} {'Tu':<11} {'Den':<11} {'Khoang cach':>11} " +
+          " ".join(f"{h + 'd':>8}" for h in map(str, FORWARD_HORIZONS)))
+    print("-" * 80)
+    for i, m in enumerate(result["matches"], 1):
+        fwd = " ".join(f"{v:>+7.1f}%" if v is not None else f"{'N/A':>8}" for v in m["forward_returns"].values())
+        print(f"{i:<4} {m['symbol']:<8} {m['start']:<11} {m['end']:<11} {m['distance']:>11.2f} {fwd}")
+
+    print(f"\n  Thong ke sau cac doan tuong tu:")
+    for h, s in result["forward_stats"].items():
+        if s["count"]:
+            print(f"    {h:>4}: TB {s['mean']:+.2f}% | Trung vi {s['median']:+.2f}% | Ty le tang {s['win_rate']:.0f}% ({s['count']} mau)")
+
+if __name__ == "__main__":
+    # Chạy hàng loạt: python similarity_search.py --window 30 --top 10 [FPT VCB ...]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tim mau hinh gia tuong tu trong lich su")
+    parser.add_argument("symbols", nargs="*", help="Cac ma can tim (mac dinh: tat ca)")
+    parser.add_argument("--window", type=int, default=30)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    symbols = [s.upper() for s in args.symbols] or data_store.list_symbols()
+    start = time.time()
+
+    for symbol in symbols:
+        print_similar(find_similar(symbol, window=args.window, k=args.top))
+
+    print(f"\nThoi gian: {time.time() - start:.1f}s cho {len(symbols)} ma")
@@ -1,242 +1,199 @@
 """
 Sàng lọc cổ phiếu tiềm năng (Stock Screener)
-Đánh giá và xếp hạng các cổ phiếu theo nhiều tiêu chí
-Sử dụng: python stock_screener.py
+Đánh giá và xếp hạng các cổ phiếu theo nhiều tiêu chí (thang điểm khai báo ở SCREENER_RULES)
+Sử dụng: python stock_screener.py [--jobs 8] [--timing] | --benchmark [N] | --verify
 """
 
 import pandas as pd
 import numpy as np
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import scoring_rules
+from data_store import load_data
 
-def load_data(csv_path: str) -> pd.DataFrame:
-    """Đọc CSV từ yfinance"""
-    try:
-        df = pd.read_csv(csv_path, header=[0, 1], index_col=0)
-        df.columns = [col[0] for col in df.columns]
-    except:
-        df = pd.read_csv(csv_path, index_col=0)
-    
-    df = df.reset_index()
-    df.columns.values[0] = "Date"
-    
-    if df["Date"].dtype == object:
-        df = df[df["Date"].str.match(r"^\d{4}-\d{2}-\d{2}", na=False)].copy()
-    
-    df["Date"] = pd.to_datetime(df["Date"])
-    for col in ["Open", "High", "Low", "Close", "Volume"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    
-    df = df.set_index("Date").dropna()
-    return df
+# Thang điểm sàng lọc (tổng tối đa 100): mỗi luật chọn mức đầu tiên thỏa điều kiện, tên luật là khóa của details
+SCREENER_RULES = scoring_rules.compile_rules({
+    "max_score": 100,
+    "variables": {
+        # Chưa đủ 200 nến thì dùng MA50 thay MA200
+        "ma_long": lambda v: np.where(np.isnan(v["ma200"]), v["ma50"], v["ma200"]),
+        "ret_20d": lambda v: (v["close"] - scoring_rules.shift(v["close"], 19)) / scoring_rules.shift(v["close"], 19) * 100,
+        "bb_pct": lambda v: v["bb_pos"] * 100,
+    },
+    "rules": [
+        # 1. Xu hướng giá (max 20 điểm)
+        {"name": "price_vs_ma20", "bands": [("close > ma20", 5, "bullish", "Tren MA20")]},
+        {"name": "price_vs_ma50", "bands": [("close > ma50", 5, "bullish", "Tren MA50")]},
+        {"name": "price_vs_ma200", "bands": [("close > ma_long", 5, "bullish", "Tren MA200")]},
+        {"name": "ma_cross", "bands": [("ma20 > ma50", 5, "bullish", "MA20 > MA50 (Bullish)")]},
+        # 2. RSI (max 15 điểm)
+        {"name": "rsi", "bands": [
+            ("rsi >= 40 and rsi <= 60", 10, "neutral", "RSI {rsi:.0f} (Trung tinh)"),
+            ("rsi >= 30 and rsi < 40", 15, "bullish", "RSI {rsi:.0f} (Gan qua ban - Co hoi)"),
+            ("rsi < 30", 12, "bullish", "RSI {rsi:.0f} (Qua ban)"),
+            ("rsi > 60 and rsi <= 70", 8, "neutral", "RSI {rsi:.0f} (Manh)"),
+        ], "default": (3, "bearish", "RSI {rsi:.0f} (Qua mua - Can than)")},
+        # 3. MACD (max 15 điểm)
+        {"name": "macd", "bands": [("macd > macd_signal", 10, "bullish", "MACD > Signal (Bullish)")]},
+        {"name": "macd_cross", "bands": [
+            ("prev_macd <= prev_macd_signal and macd > macd_signal", 5, "bullish", "MACD vua cat len Signal"),
+        ]},
+        # 4. Volume (max 15 điểm)
+        {"name": "volume", "bands": [
+            ("vol_ratio > 1.5", 15, "bullish", "Volume cao ({vol_ratio:.1f}x TB)"),
+            ("vol_ratio > 1", 10, "neutral", "Volume kha ({vol_ratio:.1f}x TB)"),
+            ("vol_ratio > 0.7", 5, "neutral", "Volume TB ({vol_ratio:.1f}x)"),
+        ], "default": (0, "bearish", "Volume thap ({vol_ratio:.1f}x)")},
+        # 5. Xu hướng ngắn hạn (max 15 điểm)
+        {"name": "trend_5d", "bands": [
+            ("ret_5d > 3", 8, "bullish", "5 ngay: +{ret_5d:.1f}%"),
+            ("ret_5d > 0", 5, "neutral", "5 ngay: +{ret_5d:.1f}%"),
+        ], "default": (0, "bearish", "5 ngay: {ret_5d:.1f}%")},
+        {"name": "trend_20d", "bands": [
+            ("ret_20d > 5", 7, "bullish", "20 ngay: +{ret_20d:.1f}%"),
+            ("ret_20d > 0", 4, "neutral", "20 ngay: +{ret_20d:.1f}%"),
+        ], "default": (0, "bearish", "20 ngay: {ret_20d:.1f}%")},
+        # 6. Bollinger Bands (max 10 điểm)
+        {"name": "bb", "bands": [
+            ("bb_pos >= 0.3 and bb_pos <= 0.7", 10, "neutral", "BB: {bb_pct:.0f}% (Vung an toan)"),
+            ("bb_pos < 0.2", 8, "bullish", "BB: {bb_pct:.0f}% (Gan day - Co hoi)"),
+            ("bb_pos > 0.8", 3, "bearish", "BB: {bb_pct:.0f}% (Gan dinh - Can than)"),
+        ], "default": (5, "neutral", "BB: {bb_pct:.0f}%")},
+        # 7. Stochastic (max 10 điểm)
+        {"name": "stoch", "bands": [
+            ("stoch >= 20 and stoch <= 80", 10, "neutral", "Stoch: {stoch:.0f} (Trung tinh)"),
+            ("stoch < 20", 8, "bullish", "Stoch: {stoch:.0f} (Qua ban - Co hoi)"),
+        ], "default": (3, "bearish", "Stoch: {stoch:.0f} (Qua mua)")},
+    ],
+    "ratings": [
+        (80, "A+ (Rat tiem nang)"),
+        (70, "A (Tiem nang)"),
+        (60, "B+ (Kha)"),
+        (50, "B (Trung binh)"),
+        (40, "C (Yeu)"),
+        (-np.inf, "D (Kem)"),
+    ],
+    "rating_keys": ["rating"],
+})
+
+# Số nến tối thiểu để chấm điểm
+MIN_BARS = 50
+
+def _evaluate(df: pd.DataFrame) -> dict:
+    """Chấm SCREENER_RULES trên mọi nến của 1 mã"""
+    data = {col.lower(): df[col] for col in ["Open", "High", "Low", "Close", "Volume"]}
+    return scoring_rules.evaluate(SCREENER_RULES, data)
 
 def calculate_score(df: pd.DataFrame) -> dict:
     """Tính điểm đánh giá cho 1 cổ phiếu"""
-    if len(df) < 50:
+    if len(df) < MIN_BARS:
         return None
     
-    df = df.copy()
-    latest = df.iloc[-1]
-    
-    score = 0
-    max_score = 0
-    details = {}
-    
-    # === 1. XU HƯỚNG GIÁ (max 20 điểm) ===
-    max_score += 20
-    
-    # MA crossover
-    df["MA20"] = df["Close"].rolling(20).mean()
-    df["MA50"] = df["Close"].rolling(50).mean()
-    df["MA200"] = df["Close"].rolling(200).mean()
-    
-    ma20 = df["MA20"].iloc[-1]
-    ma50 = df["MA50"].iloc[-1]
-    ma200 = df["MA200"].iloc[-1] if len(df) >= 200 else ma50
-    price = latest["Close"]
-    
-    # Giá trên MA
-    if price > ma20:
-        score += 5
-        details["price_vs_ma20"] = "Tren MA20"
-    if price > ma50:
-        score += 5
-        details["price_vs_ma50"] = "Tren MA50"
-    if price > ma200:
-        score += 5
-        details["price_vs_ma200"] = "Tren MA200"
-    
-    # Golden cross
-    if ma20 > ma50:
-        score += 5
-        details["ma_cross"] = "MA20 > MA50 (Bullish)"
-    
-    # === 2. RSI (max 15 điểm) ===
-    max_score += 15
-    
-    delta = df["Close"].diff()
-    gain = delta.where(delta > 0, 0).rolling(14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-    rs = gain / loss
-    df["RSI"] = 100 - (100 / (1 + rs))
-    rsi = df["RSI"].iloc[-1]
-    
-    if 40 <= rsi <= 60:
-        score += 10
-        details["rsi"] = f"RSI {rsi:.0f} (Trung tinh)"
-    elif 30 <= rsi < 40:
-        score += 15  # Cơ hội mua
-        details["rsi"] = f"RSI {rsi:.0f} (Gan qua ban - Co hoi)"
-    elif rsi < 30:
-        score += 12
-        details["rsi"] = f"RSI {rsi:.0f} (Qua ban)"
-    elif 60 < rsi <= 70:
-        score += 8
-        details["rsi"] = f"RSI {rsi:.0f} (Manh)"
-    else:
-        score += 3
-        details["rsi"] = f"RSI {rsi:.0f} (Qua mua - Can than)"
-    
-    # === 3. MACD (max 15 điểm) ===
-    max_score += 15
-    
-    ema12 = df["Close"].ewm(span=12).mean()
-    ema26 = df["Close"].ewm(span=26).mean()
-    df["MACD"] = ema12 - ema26
-    df["MACD_Signal"] = df["MACD"].ewm(span=9).mean()
-    
-    macd = df["MACD"].iloc[-1]
-    macd_signal = df["MACD_Signal"].iloc[-1]
-    macd_prev = df["MACD"].iloc[-2]
-    signal_prev = df["MACD_Signal"].iloc[-2]
-    
-    if macd > macd_signal:
-        score += 10
-        details["macd"] = "MACD > Signal (Bullish)"
-    
-    # MACD cross
-    if macd_prev <= signal_prev and macd > macd_signal:
-        score += 5
-        details["macd_cross"] = "MACD vua cat len Signal"
-    
-    # === 4. VOLUME (max 15 điểm) ===
-    max_score += 15
-    
-    df["Vol_MA20"] = df["Volume"].rolling(20).mean()
-    vol_ratio = latest["Volume"] / df["Vol_MA20"].iloc[-1]
-    
-    if vol_ratio > 1.5:
-        score += 15
-        details["volume"] = f"Volume cao ({vol_ratio:.1f}x TB)"
-    elif vol_ratio > 1:
-        score += 10
-        details["volume"] = f"Volume kha ({vol_ratio:.1f}x TB)"
-    elif vol_ratio > 0.7:
-        score += 5
-        details["volume"] = f"Volume TB ({vol_ratio:.1f}x)"
-    else:
-        details["volume"] = f"Volume thap ({vol_ratio:.1f}x)"
-    
-    # === 5. XU HƯỚNG NGẮN HẠN (max 15 điểm) ===
-    max_score += 15
-    
-    ret_5d = (price - df["Close"].iloc[-5]) / df["Close"].iloc[-5] * 100
-    ret_20d = (price - df["Close"].iloc[-20]) / df["Close"].iloc[-20] * 100
-    
-    if ret_5d > 3:
-        score += 8
-        details["trend_5d"] = f"5 ngay: +{ret_5d:.1f}%"
-    elif ret_5d > 0:
-        score += 5
-        details["trend_5d"] = f"5 ngay: +{ret_5d:.1f}%"
-    else:
-        details["trend_5d"] = f"5 ngay: {ret_5d:.1f}%"
-    
-    if ret_20d > 5:
-        score += 7
-        details["trend_20d"] = f"20 ngay: +{ret_20d:.1f}%"
-    elif ret_20d > 0:
-        score += 4
-        details["trend_20d"] = f"20 ngay: +{ret_20d:.1f}%"
-    else:
-        details["trend_20d"] = f"20 ngay: {ret_20d:.1f}%"
-    
-    # === 6. BOLLINGER BANDS (max 10 điểm) ===
-    max_score += 10
-    
-    df["BB_Mid"] = df["Close"].rolling(20).mean()
-    bb_std = df["Close"].rolling(20).std()
-    df["BB_Upper"] = df["BB_Mid"] + 2 * bb_std
-    df["BB_Lower"] = df["BB_Mid"] - 2 * bb_std
-    
-    bb_pos = (price - df["BB_Lower"].iloc[-1]) / (df["BB_Upper"].iloc[-1] - df["BB_Lower"].iloc[-1])
-    
-    if 0.3 <= bb_pos <= 0.7:
-        score += 10
-        details["bb"] = f"BB: {bb_pos*100:.0f}% (Vung an toan)"
-    elif bb_pos < 0.2:
-        score += 8
-        details["bb"] = f"BB: {bb_pos*100:.0f}% (Gan day - Co hoi)"
-    elif bb_pos > 0.8:
-        score += 3
-        details["bb"] = f"BB: {bb_pos*100:.0f}% (Gan dinh - Can than)"
-    else:
-        score += 5
-        details["bb"] = f"BB: {bb_pos*100:.0f}%"
-    
-    # === 7. STOCHASTIC (max 10 điểm) ===
-    max_score += 10
-    
-    low_14 = df["Low"].rolling(14).min()
-    high_14 = df["High"].rolling(14).max()
-    df["Stoch_K"] = 100 * (df["Close"] - low_14) / (high_14 - low_14)
-    stoch = df["Stoch_K"].iloc[-1]
-    
-    if 20 <= stoch <= 80:
-        score += 10
-        details["stoch"] = f"Stoch: {stoch:.0f} (Trung tinh)"
-    elif stoch < 20:
-        score += 8
-        details["stoch"] = f"Stoch: {stoch:.0f} (Qua ban - Co hoi)"
-    else:
-        score += 3
-        details["stoch"] = f"Stoch: {stoch:.0f} (Qua mua)"
-    
-    # Tính % điểm
+    result = _evaluate(df)
+    values = result["values"]
+    score = int(result["score"][-1])
+    max_score = SCREENER_RULES["max_score"]
     score_pct = score / max_score * 100
     
-    # Xếp hạng
-    if score_pct >= 80:
-        rating = "A+ (Rat tiem nang)"
-    elif score_pct >= 70:
-        rating = "A (Tiem nang)"
-    elif score_pct >= 60:
-        rating = "B+ (Kha)"
-    elif score_pct >= 50:
-        rating = "B (Trung binh)"
-    elif score_pct >= 40:
-        rating = "C (Yeu)"
-    else:
-        rating = "D (Kem)"
-    
     return {
-        "price": price,
+        "price": df["Close"].iloc[-1],
         "score": score,
         "max_score": max_score,
         "score_pct": score_pct,
-        "rating": rating,
-        "rsi": rsi,
-        "vol_ratio": vol_ratio,
-        "ret_5d": ret_5d,
-        "ret_20d": ret_20d,
-        "details": details
+        "rating": scoring_rules.rate(SCREENER_RULES, [score_pct])["rating"][0],
+        "rsi": values["rsi"][-1],
+        "vol_ratio": values["vol_ratio"][-1],
+        "ret_5d": values["ret_5d"][-1],
+        "ret_20d": values["ret_20d"][-1],
+        "details": scoring_rules.details(SCREENER_RULES, result, -1)
     }
 
-def screen_all_stocks():
-    """Sàng lọc tất cả cổ phiếu"""
+def score_history(df: pd.DataFrame) -> pd.DataFrame:
+    """Điểm và xếp hạng của calculate_score tại mọi ngày trong 1 lần tính
+    Dòng cuối trùng calculate_score(df); NaN / None khi chưa đủ MIN_BARS nến"""
+    score = _evaluate(df)["score"]
+    score[:MIN_BARS - 1] = np.nan
+    # max_score luôn là 100 nên score_pct = score
+    return pd.DataFrame({"score": score, **scoring_rules.rate(SCREENER_RULES, score)}, index=df.index)
+
+def verify_history(symbols: list, cuts: int = 20) -> list:
+    """So score_history với calculate_score tại `cuts` điểm cắt của mỗi mã, trả về các chỗ lệch"""
+    mismatches = []
+    for symbol in symbols:
+        df = load_data(f"data/{symbol}.csv")
+        if len(df) < MIN_BARS:
+            continue
+        history = score_history(df)
+        for end in np.unique(np.linspace(MIN_BARS, len(df), cuts).astype(int)):
+            expected = calculate_score(df.iloc[:end])
+            row = history.iloc[end - 1]
+            if row["score"] != expected["score"] or row["rating"] != expected["rating"]:
+                mismatches.append((symbol, df.index[end - 1], row["score"], expected["score"]))
+    return mismatches
+
+def _score_one(symbol: str):
+    """Chấm điểm 1 mã (chạy được trong tiến trình con), trả về (mã, kết quả, số giây)"""
+    start = time.perf_counter()
+    result = None
+    try:
+        df = load_data(f"data/{symbol}.csv")
+        result = calculate_score(df)
+        if result:
+            result["symbol"] = symbol
+    except Exception:
+        result = None
+    return symbol, result, time.perf_counter() - start
+
+def score_all(symbols: list, jobs: int = 1):
+    """Chấm điểm nhiều mã, jobs > 1 thì chia cho ProcessPoolExecutor theo từng lô
+    Kết quả giữ đúng thứ tự `symbols`. Trả về (danh sách kết quả, {mã: số giây})"""
+    if jobs <= 1 or len(symbols) <= 1:
+        outputs = list(map(_score_one, symbols))
+    else:
+        chunksize = max(1, len(symbols) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            outputs = list(executor.map(_score_one, symbols, chunksize=chunksize))
+    
+    results = [result for _, result, _ in outputs if result]
+    timings = {symbol: seconds for symbol, _, seconds in outputs}
+    return results, timings
+
+def print_timings(timings: dict, elapsed: float, top: int = 5):
+    """In thời gian chấm điểm theo mã (các mã chậm nhất)"""
+    total = sum(timings.values())
+    print(f"\n  Thoi gian: {elapsed:.2f}s thuc te, {total:.2f}s tong theo ma, TB {total / max(len(timings), 1) * 1000:.0f}ms/ma")
+    for symbol, seconds in sorted(timings.items(), key=lambda x: -x[1])[:top]:
+        print(f"    {symbol:<8} {seconds * 1000:>7.0f}ms")
+
+def benchmark(max_jobs: int = None):
+    """Đo thời gian sàng lọc toàn bộ mã với 1, 2, 4, ... tiến trình"""
     data_dir = "data"
-    csv_files = [f.replace(".csv", "") for f in os.listdir(data_dir) if f.endswith(".csv")]
+    symbols = sorted(f.replace(".csv", "") for f in os.listdir(data_dir) if f.endswith(".csv"))
+    max_jobs = max_jobs or os.cpu_count() or 1
+    
+    jobs_list = [1]
+    while jobs_list[-1] * 2 <= max_jobs:
+        jobs_list.append(jobs_list[-1] * 2)
+    if jobs_list[-1] != max_jobs:
+        jobs_list.append(max_jobs)
+    
+    print(f"\nBenchmark sang loc {len(symbols)} ma (CPU: {os.cpu_count()})")
+    print(f"{'Jobs':>5} {'Thoi gian':>10} {'Tang toc':>9}")
+    base = None
+    for jobs in jobs_list:
+        start = time.perf_counter()
+        score_all(symbols, jobs)
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print(f"{jobs:>5} {elapsed:>9.2f}s {base / elapsed:>8.2f}x")
+
+def screen_all_stocks(jobs: int = 1, show_timing: bool = False):
+    """Sàng lọc tất cả cổ phiếu (jobs > 1: chấm điểm song song nhiều tiến trình)"""
+    data_dir = "data"
+    csv_files = sorted(f.replace(".csv", "") for f in os.listdir(data_dir) if f.endswith(".csv"))
     
     print(f"\n{'='*70}")
     print(f"   SANG LOC CO PHIEU TIEM NANG")
@@ -244,18 +201,9 @@ def screen_all_stocks():
     print(f"   So ma phan tich: {len(csv_files)}")
     print(f"{'='*70}")
     
-    results = []
-    
-    for symbol in csv_files:
-        csv_path = f"data/{symbol}.csv"
-        try:
-            df = load_data(csv_path)
-            result = calculate_score(df)
-            if result:
-                result["symbol"] = symbol
-                results.append(result)
-        except Exception as e:
-            pass
+    start = time.perf_counter()
+    results, timings = score_all(csv_files, jobs)
+    elapsed = time.perf_counter() - start
     
     # Sắp xếp theo điểm
     results_sorted = sorted(results, key=lambda x: x["score_pct"], reverse=True)
@@ -325,6 +273,9 @@ def screen_all_stocks():
     else:
         print("  Khong co")
     
+    if show_timing:
+        print_timings(timings, elapsed)
+    
     return results_sorted
 
 def analyze_single(symbol: str):
@@ -363,7 +314,32 @@ def analyze_single(symbol: str):
     else:
         print(f"  >>> CAN THAN - Chua phai thoi diem tot <<<")
 
-if __name__ == "__main__":
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # python stock_screener.py --jobs 8 [--timing] | --benchmark 16
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Sang loc co phieu tiem nang")
+    parser.add_argument("--jobs", type=int, default=1, help="So tien trinh cham diem song song")
+    parser.add_argument("--timing", action="store_true", help="In thoi gian cham diem theo ma")
+    parser.add_argument("--benchmark", type=int, nargs="?", const=0, default=None,
+                        help="Do thoi gian voi 1..N tien trinh (mac dinh N = so CPU)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Kiem tra lich su diem vector hoa khop calculate_score")
+    args = parser.parse_args()
+    
+    if args.verify:
+        symbols = sorted(f.replace(".csv", "") for f in os.listdir("data") if f.endswith(".csv"))
+        bad = verify_history(symbols)
+        for symbol, date, got, expected in bad[:20]:
+            print(f"LECH {symbol} {date}: vector={got} calculate_score={expected}")
+        print("OK" if not bad else f"{len(bad)} cho lech")
+        sys.exit(1 if bad else 0)
+    elif args.benchmark is not None:
+        benchmark(args.benchmark or None)
+    else:
+        screen_all_stocks(jobs=args.jobs, show_timing=args.timing)
+
+elif __name__ == "__main__":
     data_dir = "data"
     csv_files = [f.replace(".csv", "") for f in os.listdir(data_dir) if f.endswith(".csv")]
     
@@ -0,0 +1,44 @@
+"""Dữ liệu giả lập dùng chung cho test (nến OHLCV xác định, không cần thư mục data/)"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# Module của dự án nằm phẳng ở thư mục gốc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def make_frame(trend: float, wave: float, n: int, spike: int = None) -> pd.DataFrame:
+    """Nến ngày có xu hướng `trend` (%/phiên) cộng dao động sin biên độ `wave` (%)
+    spike: số nến cuối có giá bật tăng và khối lượng gấp 3"""
+    i = np.arange(n)
+    close = 100 * (1 + trend / 100) ** i * (1 + wave / 100 * np.sin(i / 4))
+    volume = 1_000_000 + 200_000 * np.cos(i / 3)
+    if spike:
+        close[-spike:] *= 1 + 0.03 * np.arange(1, spike + 1)
+        volume[-spike:] *= 3
+    open_ = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({
+        "Open": open_,
+        "High": np.maximum(open_, close) * 1.01,
+        "Low": np.minimum(open_, close) * 0.99,
+        "Close": close,
+        "Volume": volume,
+    }, index=pd.bdate_range("2024-01-01", periods=n, name="Date"))
+
+# Tên -> tham số make_frame: xu hướng tăng/giảm, đi ngang, bật tăng kèm khối lượng, dữ liệu ngắn (< 200 nến)
+FRAMES = {
+    "breakout": dict(trend=0.6, wave=2, n=120, spike=2),
+    "selloff": dict(trend=-1.0, wave=2, n=120),
+    "uptrend": dict(trend=0.4, wave=2, n=260),
+    "downtrend": dict(trend=-0.4, wave=2, n=260),
+    "sideways": dict(trend=0.0, wave=4, n=260),
+    "rebound": dict(trend=-0.3, wave=1, n=240, spike=3),
+    "short": dict(trend=0.2, wave=3, n=80),
+}
+
+@pytest.fixture(params=sorted(FRAMES))
+def frame(request):
+    """(tên, DataFrame) của từng bộ dữ liệu giả lập"""
+    return request.param, make_frame(**FRAMES[request.param])
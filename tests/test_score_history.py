@@ -0,0 +1,50 @@
+"""Dòng cuối của lịch sử điểm vector hóa khớp điểm của bản chấm từng mã trước khi vector hóa
+Giá trị mong đợi lấy từ ai_analyze / calculate_score bản vô hướng (trước user-040) trên dữ liệu giả lập"""
+
+import numpy as np
+import scoring
+import stock_screener
+
+# Tên bộ dữ liệu -> (điểm AI, rating AI, điểm screener, rating screener)
+EXPECTED = {
+    "breakout": (78, "A", 74, "A (Tiem nang)"),
+    "downtrend": (48, "C", 45, "C (Yeu)"),
+    "rebound": (63, "B+", 56, "B (Trung binh)"),
+    "selloff": (38, "D", 33, "D (Kem)"),
+    "short": (68, "B+", 61, "B+ (Kha)"),
+    "sideways": (50, "B", 51, "B (Trung binh)"),
+    "uptrend": (60, "B+", 56, "B (Trung binh)"),
+}
+
+def test_ai_score_history_last_row(frame):
+    name, df = frame
+    score, rating = EXPECTED[name][:2]
+    last = scoring.score_history(df).iloc[-1]
+    assert last["score"] == score
+    assert last["rating"] == rating
+
+def test_ai_analyze_expected(frame):
+    name, df = frame
+    result = scoring.ai_analyze(df, "TEST")
+    assert (result["score"], result["rating"]) == EXPECTED[name][:2]
+
+def test_screener_score_history_last_row(frame):
+    name, df = frame
+    score, rating = EXPECTED[name][2:]
+    last = stock_screener.score_history(df).iloc[-1]
+    assert last["score"] == score
+    assert last["rating"] == rating
+
+def test_calculate_score_expected(frame):
+    name, df = frame
+    result = stock_screener.calculate_score(df)
+    assert (result["score"], result["rating"]) == EXPECTED[name][2:]
+
+def test_history_empty_before_min_bars(frame):
+    _, df = frame
+    ai = scoring.score_history(df)
+    screener = stock_screener.score_history(df)
+    assert np.isnan(ai["score"].iloc[:scoring.MIN_BARS - 1]).all()
+    assert ai["score"].iloc[scoring.MIN_BARS - 1:].notna().all()
+    assert np.isnan(screener["score"].iloc[:stock_screener.MIN_BARS - 1]).all()
+    assert screener["rating"].iloc[:stock_screener.MIN_BARS - 1].isna().all()
@@ -0,0 +1,195 @@
+"""
+Volume Profile - Phân bổ khối lượng theo vùng giá
+Hỗ trợ/kháng cự từ các vùng giá giao dịch nhiều (HVN), POC và Value Area (70% khối lượng)
+Khối lượng mỗi phiên được cộng vào ô giá của giá điển hình (H+L+C)/3; các ô giá cách nhau
+BIN_PCT theo thang log nên khi có phiên mới chỉ cần cộng/trừ vài ô, không quét lại lịch sử
+Sử dụng: python volume_profile.py [MA] [--window 120]
+"""
+
+import numpy as np
+import pandas as pd
+import threading
+import data_store
+
+# Độ rộng mỗi ô giá (0.5%)
+BIN_PCT = 0.005
+
+# Tỷ lệ khối lượng của Value Area
+VALUE_AREA_PCT = 0.70
+
+_LOG_STEP = np.log1p(BIN_PCT)
+
+def price_to_bin(price):
+    """Chỉ số ô giá (thang log) của giá"""
+    return np.floor(np.log(np.asarray(price, dtype=float)) / _LOG_STEP).astype(np.int64)
+
+def bin_to_price(idx):
+    """Giá giữa ô"""
+    return np.exp((np.asarray(idx, dtype=float) + 0.5) * _LOG_STEP)
+
+class VolumeProfile:
+    """Volume profile trên cửa sổ `window` phiên gần nhất của 1 mã, cập nhật tăng dần"""
+
+    def __init__(self, df: pd.DataFrame, window: int = 120, version: str = None):
+        self.window = window
+        self.version = version
+        self.df = df.iloc[:0]
+        self.bins = np.array([], dtype=np.int64)   # Ô giá của từng phiên
+        self.offset = 0                             # Chỉ số ô giá của hist[0]
+        self.hist = np.zeros(0)                     # Khối lượng theo ô giá
+        self.update(df)
+
+    def _add(self, idx: np.ndarray, sign: float):
+        """Cộng (sign=1) hoặc trừ (sign=-1) khối lượng các phiên idx vào histogram"""
+        if len(idx) == 0:
+            return
+        bins = self.bins[idx]
+        lo, hi = bins.min(), bins.max()
+
+        # Mở rộng histogram nếu giá ra ngoài vùng đang có
+        if len(self.hist) == 0:
+            self.offset, self.hist = lo, np.zeros(hi - lo + 1)
+        else:
+            if lo < self.offset:
+                self.hist = np.concatenate([np.zeros(self.offset - lo), self.hist])
+                self.offset = lo
+            if hi >= self.offset + len(self.hist):
+                self.hist = np.concatenate([self.hist, np.zeros(hi - self.offset - len(self.hist) + 1)])
+
+        volume = self.df["Volume"].values[idx].astype(float)
+        self.hist += sign * np.bincount(bins - self.offset, weights=volume, minlength=len(self.hist))
+
+    def update(self, df: pd.DataFrame) -> int:
+        """Nạp dữ liệu mới: trừ các phiên rời cửa sổ / bị sửa, cộng các phiên mới
+        Trả về vị trí phiên đầu tiên bị thay đổi"""
+        old_n = len(self.df)
+        start = data_store.first_changed_row(self.df, df) if old_n else 0
+        old_lo = max(0, old_n - self.window)
+        new_lo = max(0, len(df) - self.window)
+
+        # Trừ phiên cũ bị sửa hoặc rời khỏi cửa sổ
+        old_idx = np.arange(old_lo, old_n)
+        self._add(old_idx[(old_idx >= start) | (old_idx < new_lo)], -1)
+
+        self.df = df
+        typical = (df["High"].values[start:] + df["Low"].values[start:] + df["Close"].values[start:]) / 3
+        self.bins = np.concatenate([self.bins[:start], price_to_bin(typical)])
+
+        # Cộng phiên mới hoặc mới vào cửa sổ
+        new_idx = np.arange(new_lo, len(df))
+        self._add(new_idx[(new_idx >= start) | (new_idx < old_lo)], 1)
+
+        # Làm tròn sai số cộng/trừ số thực, cắt các ô rỗng ở 2 đầu
+        self.hist[np.abs(self.hist) < 1e-6] = 0.0
+        nonzero = np.flatnonzero(self.hist)
+        if len(nonzero):
+            self.offset += nonzero[0]
+            self.hist = self.hist[nonzero[0]:nonzero[-1] + 1]
+        else:
+            self.hist = np.zeros(0)
+        return start
+
+    def profile(self) -> pd.Series:
+        """Khối lượng theo giá (index là giá giữa ô, chỉ các ô có khối lượng)"""
+        nonzero = np.flatnonzero(self.hist > 0)
+        return pd.Series(self.hist[nonzero], index=bin_to_price(nonzero + self.offset))
+
+    def value_area(self):
+        """POC và Value Area: mở rộng từ POC sang phía có khối lượng lớn hơn tới khi đủ 70%"""
+        hist = self.hist
+        total = hist.sum()
+        if total <= 0:
+            return None, None, None
+
+        poc = int(np.argmax(hist))
+        lo = hi = poc
+        acc = hist[poc]
+        while acc < VALUE_AREA_PCT * total and (lo > 0 or hi < len(hist) - 1):
+            below = hist[lo - 1] if lo > 0 else -1
+            above = hist[hi + 1] if hi < len(hist) - 1 else -1
+            if above >= below:
+                hi += 1
+                acc += hist[hi]
+            else:
+                lo -= 1
+                acc += hist[lo]
+
+        return (float(bin_to_price(poc + self.offset)),
+                float(bin_to_price(lo + self.offset)),
+                float(bin_to_price(hi + self.offset)))
+
+    def levels(self, num_levels: int = 3, smooth: int = 3) -> dict:
+        """Hỗ trợ/kháng cự: các đỉnh cục bộ của histogram (HVN) dưới/trên giá hiện tại"""
+        if len(self.df) == 0:
+            return {}
+        current_price = float(self.df["Close"].iloc[-1])
+        poc, val, vah = self.value_area()
+
+        # Làm mượt histogram rồi lấy các ô là đỉnh cục bộ và cao hơn mức trung bình
+        hist = np.convolve(self.hist, np.ones(smooth) / smooth, mode="same")
+        padded = np.concatenate([[-np.inf], hist, [-np.inf]])
+        peaks = np.flatnonzero((hist > padded[:-2]) & (hist >= padded[2:]) & (hist > hist[hist > 0].mean()))
+        order = peaks[np.argsort(-hist[peaks])]
+        prices = bin_to_price(order + self.offset)
+
+        resistance = [float(p) for p in prices if p > current_price][:num_levels]
+        support = [float(p) for p in prices if p < current_price][:num_levels]
+
+        return {
+            "window": self.window,
+            "current_price": current_price,
+            "poc": poc,
+            "value_area_low": val,
+            "value_area_high": vah,
+            "resistance": sorted(resistance, reverse=True),
+            "support": sorted(support, reverse=True),
+            "nearest_resistance": min(resistance, default=None),
+            "nearest_support": max(support, default=None)
+        }
+
+# ============ TRẠNG THÁI THEO MÃ ============
+
+# (symbol, window) -> VolumeProfile
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+def get_volume_profile(symbol: str, window: int = 120) -> VolumeProfile:
+    """Volume profile của 1 mã, chỉ cộng/trừ các phiên mới khi dữ liệu đổi phiên bản"""
+    df, version = data_store.load_symbol(symbol)
+    if df is None:
+        return None
+
+    with _profiles_lock:
+        vp = _profiles.get((symbol, window))
+        if vp is None:
+            vp = _profiles[(symbol, window)] = VolumeProfile(df, window, version)
+        elif vp.version != version:
+            vp.update(df)
+            vp.version = version
+    return vp
+
+def get_levels(symbol: str, window: int = 120) -> dict:
+    """Mức hỗ trợ/kháng cự theo volume profile của 1 mã"""
+    vp = get_volume_profile(symbol, window)
+    if vp is None:
+        return {"error": f"Không tìm thấy {symbol}"}
+    with _profiles_lock:
+        return vp.levels()
+
+if __name__ == "__main__":
+    import sys
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    window = int(sys.argv[sys.argv.index("--window") + 1]) if "--window" in sys.argv else 120
+    symbols = [a.upper() for a in args if not a.isdigit()] or data_store.list_symbols()
+
+    print(f"{'Ma':<8} {'Gia':>12} {'POC':>12} {'VA thap':>12} {'VA cao':>12} {'Ho tro':>12} {'Khang cu':>12}")
+    print("-" * 86)
+    for symbol in symbols:
+        lv = get_levels(symbol, window)
+        if "error" in lv:
+            print(f"{symbol:<8} {lv['error']}")
+            continue
+        fmt = lambda v: f"{v:>12,.2f}" if v is not None else f"{'N/A':>12}"
+        print(f"{symbol:<8} {fmt(lv['current_price'])} {fmt(lv['poc'])} {fmt(lv['value_area_low'])} "
+              f"{fmt(lv['value_area_high'])} {fmt(lv['nearest_support'])} {fmt(lv['nearest_resistance'])}")